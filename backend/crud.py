@@ -3,7 +3,9 @@ from schemas import VagonetaCreate
 from datetime import datetime, timedelta, timezone
 from typing import List, Optional, Dict, Any, Tuple
 from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
 from pymongo.database import Database
+from pymongo.errors import BulkWriteError
 
 # Funciones CRUD optimizadas
 
@@ -13,6 +15,29 @@ def create_vagoneta_record(data: VagonetaCreate) -> str:
     result = db.vagonetas.insert_one(doc)  # MODIFIED: Removed await
     return str(result.inserted_id)
 
+BULK_INSERT_CHUNK_SIZE = 500  # Documentos por insert_many
+
+def create_vagoneta_records(data: List[VagonetaCreate], chunk_size: int = BULK_INSERT_CHUNK_SIZE) -> List[Optional[str]]:
+    """
+    Inserta varios registros con insert_many(ordered=False) en bloques de `chunk_size`.
+    Devuelve los IDs en el mismo orden que `data` (los _id se generan aquí, no dependen del
+    orden en que Mongo los escriba); None en la posición de los documentos que fallaron.
+    """
+    db = get_database()
+    chunk_size = max(1, chunk_size)
+    docs = [{"_id": ObjectId(), **item.dict()} for item in data]
+    ids: List[Optional[str]] = [str(doc["_id"]) for doc in docs]
+    for start in range(0, len(docs), chunk_size):
+        chunk = docs[start:start + chunk_size]
+        try:
+            db.vagonetas.insert_many(chunk, ordered=False)
+        except BulkWriteError as e:
+            # Con ordered=False el resto del bloque se inserta igual; solo se anulan los que fallaron
+            for error in e.details.get("writeErrors", []):
+                ids[start + error["index"]] = None
+                print(f"❌ Error insertando el registro {start + error['index']} del lote: {error.get('errmsg')}")
+    return ids
+
 def get_vagonetas_historial(
     skip: int = 0, 
     limit: int = 50, 
@@ -108,6 +133,12 @@ def get_estadisticas_vagoneta(numero: str) -> Dict[str, Any]:
     result = db.vagonetas.aggregate(pipeline).to_list(1)
     return result[0] if result else None
 
+def get_vagoneta_by_id(id: str) -> Optional[Dict[str, Any]]:
+    if not ObjectId.is_valid(id):
+        return None
+    db = get_database()
+    return db.vagonetas.find_one({"_id": ObjectId(id)})
+
 def anular_registro(id: str) -> bool:
     db = get_database()
     result = db.vagonetas.update_one(
@@ -173,3 +204,69 @@ def get_vagonetas_historial_count(
 
     count = db.vagonetas.count_documents(query)  # Synchronous call
     return count
+
+# Cola persistente de trabajos de video (utils/video_jobs.py)
+
+def ensure_video_job_indexes():
+    db = get_database()
+    db.video_jobs.create_index([("status", 1), ("priority", -1), ("created_at", 1)], name="video_jobs_claim_idx")
+
+def create_video_job(job: Dict[str, Any]) -> str:
+    db = get_database()
+    db.video_jobs.insert_one(job)
+    return str(job["_id"])
+
+def get_video_job(job_id: str) -> Optional[Dict[str, Any]]:
+    db = get_database()
+    return db.video_jobs.find_one({"_id": job_id})
+
+def list_video_jobs(status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+    db = get_database()
+    query = {"status": status} if status else {}
+    return list(db.video_jobs.find(query, {"params": 0}).sort("created_at", -1).limit(limit))
+
+def claim_next_video_job(worker_id: str) -> Optional[Dict[str, Any]]:
+    """Toma atómicamente el trabajo pendiente de mayor prioridad (y más antiguo)."""
+    db = get_database()
+    now = datetime.now(timezone.utc)
+    return db.video_jobs.find_one_and_update(
+        {"status": "pending"},
+        {"$set": {"status": "running", "worker_id": worker_id, "started_at": now, "heartbeat_at": now},
+         "$inc": {"attempts": 1}},
+        sort=[("priority", DESCENDING), ("created_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER
+    )
+
+def update_video_job(job_id: str, fields: Dict[str, Any], worker_id: Optional[str] = None) -> bool:
+    """Actualiza un trabajo; con `worker_id`, solo si sigue asignado a ese worker."""
+    db = get_database()
+    query: Dict[str, Any] = {"_id": job_id}
+    if worker_id:
+        query["worker_id"] = worker_id
+    result = db.video_jobs.update_one(query, {"$set": fields})
+    return result.matched_count > 0
+
+def requeue_stale_video_jobs(stale_before: datetime, max_attempts: int,
+                             failed_events: Optional[List[Dict[str, Any]]] = None) -> Tuple[List[str], List[str]]:
+    """
+    Devuelve a la cola los trabajos 'running' sin latido desde `stale_before` (worker caído) y
+    marca como fallidos los que ya agotaron sus intentos, guardando `failed_events` como sus
+    eventos finales. Ambos pierden el worker asignado, así el worker original (si solo estaba
+    lento) ya no puede actualizarlos. Devuelve (ids reencolados, ids fallidos).
+    """
+    db = get_database()
+    stale = {"status": "running", "heartbeat_at": {"$lt": stale_before}}
+    failed_ids = [doc["_id"] for doc in db.video_jobs.find({**stale, "attempts": {"$gte": max_attempts}}, {"_id": 1})]
+    for job_id in failed_ids:
+        db.video_jobs.update_one(
+            {**stale, "_id": job_id},
+            {"$set": {"status": "failed", "worker_id": None,
+                      "error": "Se agotaron los reintentos tras caídas del worker",
+                      "final_events": [{**event, "processing_id": job_id} for event in failed_events or []],
+                      "finished_at": datetime.now(timezone.utc)}}
+        )
+    requeued_ids = [doc["_id"] for doc in db.video_jobs.find(stale, {"_id": 1})]
+    if requeued_ids:
+        db.video_jobs.update_many({**stale, "_id": {"$in": requeued_ids}},
+                                  {"$set": {"status": "pending", "worker_id": None}})
+    return requeued_ids, failed_ids
@@ -5,7 +5,6 @@
 import asyncio 
 import shutil
 import os
-import uuid
 import json
 import traceback
 import cv2 
@@ -15,18 +14,30 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Query, Form, WebSocket, WebSocketDisconnect, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 from datetime import datetime, timezone # MODIFIED: Added timezone
 from typing import List, Dict, Optional, Any
 
 import crud 
-from utils.image_processing import run_detection_on_path, run_detection_on_frame
+from utils.image_processing import run_detection_on_path_async, run_detection_on_frame_async, initialize_inference, get_readiness, shutdown_inference, get_inference_stats, get_model_info, swap_model
 from utils.auto_capture_system import AutoCaptureManager, load_cameras_config 
+from utils.plate_prior import get_plate_prior_store, run_detection_with_prior_async
+from utils.tiling import parse_tiling_config
+from utils.tracking import BoxTracker, TRACKER_MAX_SKIP
+from utils.passages import PassageAggregator
+from utils.video_segments import FrameReader, plan_segments, run_segments, VIDEO_SEGMENTS
+from utils.video_sampling import FrameSampler, MotionGate, motion_progress, VIDEO_COARSE_STRIDE_MS, VIDEO_MOTION_GATE
+from utils.video_jobs import JobContext, VideoJobQueue, VIDEO_CHECKPOINT_SECONDS
+from utils.progress_events import ProgressCoalescer
+from utils.annotation import detection_geometry, get_annotated_cache
+from utils.image_writer import get_image_writer
+from utils.temporal_voting import TemporalVoter
 from database import connect_to_mongo, close_mongo_connection, get_database 
 from collections import Counter # Keep if used elsewhere, not in provided snippets
-from schemas import VagonetaCreate, VagonetaInDB, HistorialResponse, RegistroHistorialDisplay
+from schemas import VagonetaCreate, VagonetaInDB, HistorialResponse, RegistroHistorialDisplay, ModelConfigUpdate
+from utils.model_registry import get_inference_settings, get_model_registry
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
@@ -79,7 +90,27 @@ class ConnectionManager:
 
 manager = ConnectionManager()
 
-async def procesar_video_mp4_streamable(video_path: str, upload_dir: Path):
+def _motion_summary(gates) -> str:
+    fields = motion_progress(gates)
+    if not fields:
+        return ""
+    return f" Muestras sin movimiento no analizadas: {fields['motion_skipped']} (~{fields['time_saved_s']} s ahorrados)."
+
+async def procesar_video_mp4_streamable(video_path: str, upload_dir: Path, per_frame_records: bool = False,
+                                        segments: Optional[int] = None, motion_gate: Optional[bool] = None,
+                                        start_frame: int = 0):
+    """
+    Procesa un video y va emitiendo eventos de progreso. Por defecto agrupa las lecturas en
+    pasadas de vagoneta (utils/passages.py): un registro por pasada con su mejor frame. Con
+    `per_frame_records` (depuración) se analiza cada frame muestreado sin seguimiento y se
+    devuelve un registro por cada lectura con confianza >= 0.5, como antes.
+    Con `segments` > 1 (por defecto VIDEO_SEGMENTS) los videos largos se procesan por segmentos
+    en paralelo (utils/video_segments.py) con el mismo formato de eventos.
+    Con `motion_gate` (por defecto VIDEO_MOTION_GATE) el modelo solo analiza las muestras con
+    movimiento; los eventos de progreso incluyen `motion_skipped` y `time_saved_s`.
+    Cuando no hay pasadas abiertas emite eventos `checkpoint` con el frame desde el que se puede
+    reanudar (`start_frame`) y las detecciones hasta ese punto (utils/video_jobs.py).
+    """
     yield {"type": "status", "stage": "initialization", "message": f"Iniciando procesamiento de video: {Path(video_path).name}"}
     
     cap = cv2.VideoCapture(video_path)
@@ -89,77 +120,242 @@ async def procesar_video_mp4_streamable(video_path: str, upload_dir: Path):
 
     detections = {}  # Para agrupar por número: {numero: [lista de detecciones]}
     frame_count = 0
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    yield {"type": "progress", "stage": "setup", "message": "Video abierto y listo para procesar.", "total_frames": total_frames, "current_frame": 0}
-
-    try:
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                yield {"type": "status", "stage": "frame_processing", "message": "Fin de los frames o error al leer."}
-                break
-            
-            frame_count += 1
-            if frame_count % 5 != 0:  # Procesar cada N frames
-                if frame_count % 100 == 0: 
-                    yield {"type": "progress", "stage": "frame_processing", "message": f"Avanzando video...", "current_frame": frame_count, "total_frames": total_frames}
-                continue
+    # Cada 5 frames se da un paso de seguimiento; el modelo solo corre cuando el seguimiento lo pide
+    # (en modo depuración por frame se analizan todos los frames muestreados)
+    tracker = BoxTracker(detect_interval=1, max_skip=1 if per_frame_records else TRACKER_MAX_SKIP)
+    # Votación temporal en tiempo de video: avisa en el stream cuando un número se estabiliza
+    voter = TemporalVoter(f"video:{Path(video_path).name}")
+
+    image_writer = get_image_writer()
+    pending_images: List[asyncio.Future] = []
+
+    async def guardar_deteccion(frame_number: int, numero: str, confianza: float, frame_img, modelo_ladrillo,
+                                extra: Optional[dict] = None):
+        if numero not in detections:
+            detections[numero] = []
+
+        # Guardar frame como imagen para esta detección (en el escritor de imágenes, fuera del event loop)
+        frame_filename = image_writer.image_name(f"frame_{frame_number}_{numero}_{confianza:.3f}")
+        pending_images.append(await image_writer.enqueue(frame_img, upload_dir / frame_filename))
+
+        detections[numero].append({
+            'confianza': confianza,
+            'frame': frame_number,
+            'imagen_path': f"uploads/{frame_filename}",
+            'modelo_ladrillo': modelo_ladrillo,
+            **(extra or {})
+        })
 
-            yield {"type": "progress", "stage": "frame_processing", "message": f"Procesando frame {frame_count}/{total_frames}", "current_frame": frame_count, "total_frames": total_frames}
+    async def guardar_pasada(passage) -> Optional[dict]:
+        """Guarda el mejor frame de una pasada cerrada; las de los segmentos lo releen del video."""
+        frame_img = passage.best_frame
+        if frame_img is None and frame_reader is not None:
+            frame_img = await asyncio.to_thread(frame_reader.read, passage.frame_mejor)
+        if frame_img is None:
+            return {"type": "warning", "stage": "frame_processing",
+                    "message": f"No se pudo leer el frame {passage.frame_mejor} de la pasada del número {passage.numero}."}
+        await guardar_deteccion(passage.frame_mejor, passage.numero, passage.confianza_max,
+                                frame_img, passage.modelo_ladrillo,
+                                {'pasada': passage.summary(), 'geometria': passage.geometry})
+        return None
 
-            if frame is None or frame.size == 0:
-                yield {"type": "warning", "stage": "frame_processing", "message": f"Frame {frame_count} es None o está vacío."}
-                continue
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    video_fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    passages = PassageAggregator(video_fps)
+    # Paso grueso en tiempo y fino alrededor de los aciertos; en depuración, el paso fijo de siempre
+    sampler = FrameSampler(video_fps, start=start_frame, coarse_ms=0 if per_frame_records else VIDEO_COARSE_STRIDE_MS)
+    checkpoint_every = int(VIDEO_CHECKPOINT_SECONDS * video_fps)
+    last_checkpoint = start_frame
+
+    async def esperar_imagenes() -> List[dict]:
+        """Espera las imágenes encoladas (antes de que se creen registros que las referencian)."""
+        results = await asyncio.gather(*pending_images, return_exceptions=True)
+        pending_images.clear()
+        return [{"type": "warning", "stage": "frame_processing", "message": f"Error guardando la imagen de una detección: {r}"}
+                for r in results if isinstance(r, Exception)]
+
+    def checkpoint_event(frame_number: int) -> dict:
+        return {"type": "checkpoint", "stage": "frame_processing", "frame": frame_number, "total_frames": total_frames,
+                "data": {numero: list(lista) for numero, lista in detections.items()}}
+    # Paso de movimiento opcional: el modelo solo corre sobre muestras con movimiento (no en depuración)
+    use_motion_gate = (VIDEO_MOTION_GATE if motion_gate is None else motion_gate) and not per_frame_records
+    gate = MotionGate() if use_motion_gate else None
+    yield {"type": "progress", "stage": "setup", "message": "Video abierto y listo para procesar.", "total_frames": total_frames, "current_frame": start_frame}
+
+    # Videos largos: segmentos en paralelo (utils/video_segments.py); el modo depuración es siempre secuencial
+    bounds = [(start_frame, None)] if per_frame_records else plan_segments(total_frames, segments or VIDEO_SEGMENTS, start=start_frame)
+    frame_reader: Optional[FrameReader] = None
+    if len(bounds) > 1:
+        cap.release()  # Cada segmento abre su propio decodificador
+        frame_reader = FrameReader(video_path)  # Mejores frames de las pasadas que sobreviven a los filtros
+        yield {"type": "status", "stage": "frame_processing", "message": f"Procesando el video en {len(bounds)} segmentos en paralelo."}
+        inferencias = pasos = decodificados = 0
+        motion_gates: List[Optional[MotionGate]] = []
+        try:
+            motion_gates = [MotionGate() if use_motion_gate else None for _ in bounds]
+            async for kind, value in run_segments(video_path, bounds, video_fps, motion_gates):
+                if kind == 'progress':
+                    yield {"type": "progress", "stage": "frame_processing", "message": f"Procesando frame {value}/{total_frames}", "current_frame": value, "total_frames": total_frames,
+                           **motion_progress(motion_gates)}
+                    continue
+                # Resultados del segmento, en orden de frames
+                frame_count += value.frames_read
+                inferencias += value.tracking.get('detections', 0)
+                pasos += value.tracking.get('steps', 0)
+                decodificados += value.tracking.get('retrieved', 0)
+                for warning in value.warnings:
+                    yield {"type": "warning", "stage": "frame_processing", "message": warning}
+                for read in value.reads:
+                    if read['numero'] and read['confianza'] is not None and not read.get('seguimiento'):
+                        yield {"type": "detection_update", "stage": "frame_processing", "frame": read['frame'],
+                               "numero": read['numero'], "confianza": float(read['confianza']), "modelo": read['modelo']}
+                    stable = voter.add(read['numero'], read['confianza'], timestamp=read['frame'] / video_fps,
+                                       modelo_ladrillo=read['modelo'])
+                    if stable is not None:
+                        yield {"type": "stable_number", "stage": "frame_processing", "frame": read['frame'], **stable.to_dict()}
+                # Las pasadas que cruzan el corte con el segmento anterior se fusionan aquí
+                for segment_passage in value.passages:
+                    for passage in passages.add_passage(segment_passage):
+                        warning = await guardar_pasada(passage)
+                        if warning:
+                            yield warning
+                        yield {"type": "passage_closed", "stage": "frame_processing", **passage.summary()}
+                if not passages.has_open:
+                    for warning in await esperar_imagenes():
+                        yield warning
+                    yield checkpoint_event(value.start + value.frames_read)
+        except Exception as e_video:
+            frame_reader.release()
+            yield {"type": "error", "stage": "video_processing_error", "message": f"Error mayor durante el procesamiento del video: {str(e_video)}"}
+            traceback.print_exc()
+            return
+        yield {"type": "status", "stage": "cleanup", "message": f"Video {Path(video_path).name} procesado en {len(bounds)} segmentos. Total frames leídos: {frame_count}. "
+               f"Frames decodificados: {decodificados}. "
+               f"Inferencias: {inferencias} de {pasos} frames muestreados." + _motion_summary(motion_gates)}
+    else:
+        try:
+            if start_frame > 0:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+            while cap.isOpened():
+                # Punto seguro para reanudar: todo lo anterior analizado y ninguna pasada abierta
+                if not passages.has_open and sampler.resume_position - last_checkpoint >= checkpoint_every:
+                    last_checkpoint = sampler.resume_position
+                    for warning in await esperar_imagenes():
+                        yield warning
+                    yield checkpoint_event(last_checkpoint)
+                # grab() hasta la siguiente muestra y retrieve() solo de ella (utils/video_sampling.py)
+                frame, frame_count, finished = await asyncio.to_thread(sampler.read, cap)
+                if finished:
+                    yield {"type": "status", "stage": "frame_processing", "message": "Fin de los frames o error al leer."}
+                    break
+
+                yield {"type": "progress", "stage": "frame_processing", "message": f"Procesando frame {frame_count}/{total_frames}", "current_frame": frame_count, "total_frames": total_frames,
+                       **motion_progress([gate])}
+
+                if frame is None or frame.size == 0:
+                    yield {"type": "warning", "stage": "frame_processing", "message": f"Frame {frame_count} es None o está vacío."}
+                    continue
 
-            try:
-                # --- NUEVA LÓGICA DE DETECCIÓN UNIFICADA ---
-                detection_results = run_detection_on_frame(frame)
-                numero_detectado = detection_results.get('numero_detectado')
-                confianza_numero = detection_results.get('confianza_numero')
-                modelo_ladrillo = detection_results.get('modelo_ladrillo')
-                # --- FIN DE LA NUEVA LÓGICA ---
+                try:
+                    # El modelo de fondo ve todas las muestras, aunque luego decida el seguimiento
+                    # Acierto que provocó un retroceso del muestreador: su inferencia ya está hecha
+                    detection_results = sampler.cached_result(frame_count)
+                    moving = gate.has_motion(frame, frame_count) if gate else True
+                    if detection_results is None and not tracker.should_detect():
+                        if sampler.report(frame_count, bool(tracker.tracks)):
+                            continue
+                        tracker.propagate(frame)
+                        # Paso sin modelo: la pista sigue leyendo su número para la votación y las pasadas
+                        reading = tracker.reading()
+                        if reading is None:
+                            continue
+                        stable = voter.add(reading['numero_detectado'], reading['confianza_numero'],
+                                           timestamp=frame_count / video_fps, modelo_ladrillo=reading['modelo_ladrillo'])
+                        if stable is not None:
+                            yield {"type": "stable_number", "stage": "frame_processing", "frame": frame_count, **stable.to_dict()}
+                        for passage in passages.extend(frame_count, reading['numero_detectado']):
+                            warning = await guardar_pasada(passage)
+                            if warning:
+                                yield warning
+                            yield {"type": "passage_closed", "stage": "frame_processing", **passage.summary()}
+                        continue
+                    if detection_results is None and not moving and not tracker.tracks:
+                        gate.mark_skipped()
+                        sampler.report(frame_count, False)
+                        continue
+
+                    # --- NUEVA LÓGICA DE DETECCIÓN UNIFICADA ---
+                    if detection_results is None:
+                        inference_start = time.perf_counter()
+                        detection_results = await run_detection_on_frame_async(frame)
+                        if gate:
+                            gate.record_inference(time.perf_counter() - inference_start)
+                    if sampler.report(frame_count, bool(detection_results.get('numero_detectado'))
+                                      or detection_results.get('bbox_vagoneta') is not None, detection_results):
+                        continue  # Acierto tras un paso grueso: se vuelve a recorrer el hueco con paso fino
+                    tracker.update(frame, detection_results)
+                    numero_detectado = detection_results.get('numero_detectado')
+                    confianza_numero = detection_results.get('confianza_numero')
+                    modelo_ladrillo = detection_results.get('modelo_ladrillo')
+                    # --- FIN DE LA NUEVA LÓGICA ---
                 
-                if numero_detectado and confianza_numero is not None:
-                    confianza_float = 0.0
-                    try:
-                        confianza_float = float(confianza_numero)
-                    except (ValueError, TypeError):
-                        pass # Keep confianza_float as 0.0 or log warning
-
-                    yield {
-                        "type": "detection_update", 
-                        "stage": "frame_processing",
-                        "frame": frame_count, 
-                        "numero": numero_detectado, 
-                        "confianza": confianza_float,
-                        "modelo": modelo_ladrillo
-                    }
+                    if numero_detectado and confianza_numero is not None:
+                        confianza_float = 0.0
+                        try:
+                            confianza_float = float(confianza_numero)
+                        except (ValueError, TypeError):
+                            pass # Keep confianza_float as 0.0 or log warning
+
+                        yield {
+                            "type": "detection_update", 
+                            "stage": "frame_processing",
+                            "frame": frame_count, 
+                            "numero": numero_detectado, 
+                            "confianza": confianza_float,
+                            "modelo": modelo_ladrillo
+                        }
                     
-                    # Guardar TODAS las detecciones significativas (no solo la mejor)
-                    if confianza_float >= 0.5:  # Solo detecciones con confianza >= 50%
-                        if numero_detectado not in detections:
-                            detections[numero_detectado] = []
-                        
-                        # Guardar frame como imagen para esta detección
-                        frame_filename = f"frame_{frame_count}_{numero_detectado}_{confianza_float:.3f}.jpg"
-                        frame_path = upload_dir / frame_filename
-                        cv2.imwrite(str(frame_path), frame)
-                        
-                        detections[numero_detectado].append({
-                            'confianza': confianza_float,
-                            'frame': frame_count,
-                            'imagen_path': f"uploads/{frame_filename}",
-                            'modelo_ladrillo': modelo_ladrillo
-                        })
-            except Exception as e_detect:
-                yield {"type": "warning", "stage": "frame_processing", "message": f"Error detectando en frame {frame_count}: {str(e_detect)}"}
-    except Exception as e_video:
-        yield {"type": "error", "stage": "video_processing_error", "message": f"Error mayor durante el procesamiento del video: {str(e_video)}"}
-        traceback.print_exc()
-        return 
-    finally:
-        cap.release()
-        yield {"type": "status", "stage": "cleanup", "message": f"Video {Path(video_path).name} procesado. Total frames leídos: {frame_count}."}
+                        # Modo depuración: TODAS las detecciones significativas (no solo la mejor de cada pasada)
+                        if per_frame_records and confianza_float >= 0.5:  # Solo detecciones con confianza >= 50%
+                            await guardar_deteccion(frame_count, numero_detectado, confianza_float, frame, modelo_ladrillo,
+                                                    {'geometria': detection_geometry(detection_results)})
+
+                    stable = voter.add(numero_detectado, confianza_numero, timestamp=frame_count / video_fps,
+                                       modelo_ladrillo=modelo_ladrillo)
+                    if stable is not None:
+                        yield {"type": "stable_number", "stage": "frame_processing", "frame": frame_count, **stable.to_dict()}
+
+                    if not per_frame_records:
+                        # Un registro por pasada: se guarda el mejor frame cuando la pasada se cierra
+                        for passage in passages.add(frame_count, numero_detectado, confianza_numero, frame, modelo_ladrillo,
+                                                    detection_geometry(detection_results)):
+                            warning = await guardar_pasada(passage)
+                            if warning:
+                                yield warning
+                            yield {"type": "passage_closed", "stage": "frame_processing", **passage.summary()}
+                except Exception as e_detect:
+                    yield {"type": "warning", "stage": "frame_processing", "message": f"Error detectando en frame {frame_count}: {str(e_detect)}"}
+        except Exception as e_video:
+            yield {"type": "error", "stage": "video_processing_error", "message": f"Error mayor durante el procesamiento del video: {str(e_video)}"}
+            traceback.print_exc()
+            return 
+        finally:
+            cap.release()
+            tracking_stats = tracker.get_status()
+            yield {"type": "status", "stage": "cleanup", "message": f"Video {Path(video_path).name} procesado. Total frames leídos: {sampler.position}. "
+                   f"Frames decodificados: {sampler.stats['retrieved']}. "
+                   f"Inferencias: {tracking_stats['detections']} de {tracking_stats['steps']} frames muestreados."
+                   + _motion_summary([gate])}
+
+    for passage in passages.close_all():
+        warning = await guardar_pasada(passage)
+        if warning:
+            yield warning
+        yield {"type": "passage_closed", "stage": "completion", **passage.summary()}
+    if frame_reader:
+        frame_reader.release()
+    for warning in await esperar_imagenes():
+        yield warning
 
     if not detections:
         yield {"type": "final_result", "stage": "completion", "data": None, "message": "No se detectaron números en el video."}
@@ -178,19 +374,44 @@ def parse_merma(merma_str: Optional[str]) -> Optional[float]:
     except (ValueError, TypeError):
         return None
 
+def with_geometry(metadata: Optional[Dict], detection_results: Optional[Dict]) -> Dict:
+    """Añade a los metadatos del registro las cajas de la detección (para GET /vagonetas/{id}/annotated)."""
+    geometry = detection_geometry(detection_results)
+    return {**(metadata or {}), "geometria": geometry} if geometry else (metadata or {})
+
 live_frames: Dict[str, Any] = {}
 
 @asynccontextmanager
 async def lifespan(app_instance: FastAPI):
     print("INFO:     Iniciando aplicación...")
     connect_to_mongo()
-    app_instance.state.pending_video_processing = {} 
+    global video_job_queue
+    video_job_queue = VideoJobQueue(procesar_video_job)
+    # Carga y calentamiento del modelo en segundo plano: /ready responde 503 hasta que terminen
+    camera_backends = [cam["inference_backend"] for cam in CAMERAS_CONFIG if cam.get("inference_backend")]
+    app_instance.state.inference_init_task = asyncio.create_task(
+        asyncio.to_thread(initialize_inference, camera_backends))
+    # Cola persistente de videos: sus workers (que retoman trabajos pendientes o interrumpidos de
+    # ejecuciones anteriores) arrancan cuando el modelo está calentado; encolar funciona desde ya
+    async def _start_video_jobs():
+        readiness = await app_instance.state.inference_init_task
+        if not readiness.get("ready"):
+            # Los trabajos quedan pendientes en Mongo y se retoman al reiniciar con el modelo sano
+            print(f"❌ Cola de videos sin iniciar: la inferencia no está lista ({readiness.get('error')})")
+            return
+        await video_job_queue.start()
+    app_instance.state.video_jobs_start_task = asyncio.create_task(_start_video_jobs())
+    get_image_writer().start()
     print("INFO:     Aplicación iniciada y base de datos conectada.")
     yield
     print("INFO:     Cerrando aplicación...")
     if auto_capture_manager and auto_capture_manager.is_running():
         print("INFO:     Deteniendo sistema de captura automática...")
         await auto_capture_manager.stop_system()
+    app_instance.state.video_jobs_start_task.cancel()
+    await video_job_queue.stop()
+    await asyncio.to_thread(get_image_writer().stop)  # Termina de escribir las imágenes pendientes
+    shutdown_inference()
     close_mongo_connection()
     print("INFO:     Aplicación apagada y conexión a base de datos cerrada.")
 
@@ -216,6 +437,9 @@ TEMP_CHUNK_DIR.mkdir(exist_ok=True)
 
 # Variables globales para monitoreo en vivo
 monitor_tasks = {}  # Diccionario para manejar tareas de monitoreo activas
+live_trackers: Dict[str, Optional[BoxTracker]] = {}  # Seguimiento de vagonetas por cámara en vivo
+live_voters: Dict[str, TemporalVoter] = {}  # Votación temporal del número por cámara en vivo
+LIVE_TRACK_STEP = int(os.getenv("LIVE_TRACK_STEP", 3))  # Frames entre pasos del seguimiento
 
 app.mount("/uploads", StaticFiles(directory=str(UPLOAD_DIR)), name="uploads") # Ensure directory is string
 
@@ -244,6 +468,7 @@ async def upload_chunk(
 
 auto_capture_manager: Optional[AutoCaptureManager] = None 
 auto_capture_task: Optional[asyncio.Task] = None 
+video_job_queue: Optional[VideoJobQueue] = None
 CAMERAS_CONFIG = load_cameras_config() 
 
 def sanitize_filename(filename: str) -> str:
@@ -275,7 +500,7 @@ async def upload_image(
             shutil.copyfileobj(file.file, buffer)
         
         # --- NUEVA LÓGICA DE DETECCIÓN UNIFICADA ---
-        detection_results = run_detection_on_path(str(save_path))
+        detection_results = await run_detection_on_path_async(str(save_path))
         numero_detectado = detection_results.get('numero_detectado')
         modelo_ladrillo = detection_results.get('modelo_ladrillo')
         confianza_numero = detection_results.get('confianza_numero')
@@ -297,7 +522,7 @@ async def upload_image(
             evento=evento,
             modelo_ladrillo=modelo_ladrillo,
             merma=parse_merma(merma),
-            metadata=parsed_metadata,
+            metadata=with_geometry(parsed_metadata, detection_results),
             confianza=float(confianza_numero) if confianza_numero is not None else None,
             origen_deteccion="image_upload"
         )
@@ -342,6 +567,8 @@ async def upload_files(
             print(f"Warning: Invalid metadata JSON string in /upload-multiple/: {metadata_str}")
             # Not raising, will proceed with metadata as None for records
 
+    # Imágenes guardadas: se detectan todas juntas (el servicio de lotes las agrupa)
+    saved_images: List[tuple] = []  # (índice en results, archivo, ruta guardada, timestamp)
     for file in files:
         current_file_save_path: Optional[Path] = None
         try:
@@ -377,20 +604,39 @@ async def upload_files(
                 # For now, assume it's just uploaded and not processed.
                 continue
 
-            # Process if it's an image
-            # --- NUEVA LÓGICA DE DETECCIÓN UNIFICADA ---
-            detection_results = run_detection_on_path(str(current_file_save_path))
+            saved_images.append((len(results), file, current_file_save_path, timestamp_obj))
+            results.append({"filename": file.filename, "status": "pending"})
+            
+        except Exception as e:
+            if current_file_save_path and current_file_save_path.exists():
+                try: os.remove(current_file_save_path)
+                except Exception: pass # Ignore cleanup error
+            print(f"Error procesando archivo {file.filename} en /upload-multiple/: {e}\n{traceback.format_exc()}")
+            results.append({
+                "filename": file.filename, "status": "error", "error": str(e)
+            })
+
+    # --- NUEVA LÓGICA DE DETECCIÓN UNIFICADA ---
+    # Todas las imágenes se encolan a la vez: comparten lote en lugar de esperar una por una
+    all_detections = await asyncio.gather(*(run_detection_on_path_async(str(path)) for _, _, path, _ in saved_images),
+                                          return_exceptions=True)
+
+    # Registros de las imágenes con número: se insertan todos juntos al final (insert_many)
+    pending_records: List[tuple] = []  # (índice en results, VagonetaCreate, ruta guardada)
+    for (index, file, current_file_save_path, timestamp_obj), detection_results in zip(saved_images, all_detections):
+        try:
+            if isinstance(detection_results, BaseException):
+                raise detection_results
             numero_detectado = detection_results.get('numero_detectado')
             modelo_ladrillo = detection_results.get('modelo_ladrillo')
             confianza_numero = detection_results.get('confianza_numero')
-            # --- FIN DE LA NUEVA LÓGICA ---
             
             if not numero_detectado:
                 if current_file_save_path.exists(): os.remove(current_file_save_path)
-                results.append({
+                results[index] = {
                     "filename": file.filename, "status": "ignored",
                     "message": "No se detectó vagoneta con número"
-                })
+                }
                 continue
             
             vagoneta_create_obj = VagonetaCreate(
@@ -401,34 +647,44 @@ async def upload_files(
                 evento=evento,
                 modelo_ladrillo=modelo_ladrillo,
                 merma=parse_merma(merma),
-                metadata=parsed_metadata,
+                metadata=with_geometry(parsed_metadata, detection_results),
                 confianza=float(confianza_numero) if confianza_numero is not None else None,
                 origen_deteccion="image_upload_multiple"
             )
-            record_id = crud.create_vagoneta_record(vagoneta_create_obj)
-            
-            db_record_dict = vagoneta_create_obj.dict()
-            db_record_dict["_id"] = str(record_id)
-            db_record_dict["id"] = str(record_id)
-            if isinstance(db_record_dict.get("timestamp"), datetime):
-                db_record_dict["timestamp"] = db_record_dict["timestamp"].isoformat()
-            broadcast_message = {"type": "new_detection", "data": db_record_dict}
-            asyncio.create_task(manager.broadcast_json(broadcast_message))
-            
-            results.append({
-                "filename": file.filename, "status": "ok", "record_id": str(record_id),
+            pending_records.append((index, vagoneta_create_obj, current_file_save_path))
+            results[index] = {
+                "filename": file.filename, "status": "ok", "record_id": None,
                 "numero_detectado": numero_detectado, "modelo_ladrillo": modelo_ladrillo,
                 "confianza": confianza_numero
-            })
+            }
             
         except Exception as e:
-            if current_file_save_path and current_file_save_path.exists():
+            if current_file_save_path.exists():
                 try: os.remove(current_file_save_path)
                 except Exception: pass # Ignore cleanup error
             print(f"Error procesando archivo {file.filename} en /upload-multiple/: {e}\n{traceback.format_exc()}")
-            results.append({
+            results[index] = {
                 "filename": file.filename, "status": "error", "error": str(e)
-            })
+            }
+    # --- FIN DE LA NUEVA LÓGICA ---
+
+    if pending_records:
+        try:
+            record_ids = await asyncio.to_thread(crud.create_vagoneta_records, [data for _, data, _ in pending_records])
+        except Exception as e:
+            print(f"Error insertando los registros de /upload-multiple/: {e}\n{traceback.format_exc()}")
+            record_ids = [None] * len(pending_records)
+        for (index, vagoneta_create_obj, saved_path), record_id in zip(pending_records, record_ids):
+            if record_id is None:
+                if saved_path.exists():
+                    try: os.remove(saved_path)
+                    except Exception: pass # Ignore cleanup error
+                results[index] = {"filename": results[index]["filename"], "status": "error",
+                                  "error": "No se pudo guardar el registro en la base de datos."}
+                continue
+            results[index]["record_id"] = record_id
+            asyncio.create_task(manager.broadcast_json({"type": "new_detection",
+                                                        "data": _registro_a_dict(vagoneta_create_obj, record_id)}))
     return {"results": results}
 
 @app.post("/finalize-upload/")
@@ -439,7 +695,11 @@ async def finalize_upload(
     tunel: Optional[str] = Form(None),
     evento: str = Form(...),
     merma: Optional[str] = Form(None),
-    metadata_str: Optional[str] = Form(None)
+    metadata_str: Optional[str] = Form(None),
+    per_frame_records: bool = Form(False),  # Videos: un registro por frame en lugar de uno por pasada (depuración)
+    video_segments: Optional[int] = Form(None),  # Videos: segmentos en paralelo (por defecto VIDEO_SEGMENTS)
+    motion_gate: Optional[bool] = Form(None),  # Videos: analizar solo frames con movimiento (por defecto VIDEO_MOTION_GATE)
+    priority: int = Form(0)  # Videos: prioridad en la cola (mayor primero)
 ):
     metadata: Optional[Dict] = None
     if metadata_str:
@@ -490,7 +750,7 @@ async def finalize_upload(
         try:
             print(f"🖼️  Procesando imagen ensamblada: {final_save_path}")
             # --- NUEVA LÓGICA DE DETECCIÓN UNIFICADA ---
-            detection_results = run_detection_on_path(str(final_save_path))
+            detection_results = await run_detection_on_path_async(str(final_save_path))
             numero_detectado = detection_results.get('numero_detectado')
             modelo_ladrillo = detection_results.get('modelo_ladrillo')
             confianza_numero = detection_results.get('confianza_numero')
@@ -511,7 +771,7 @@ async def finalize_upload(
                 evento=evento,
                 modelo_ladrillo=modelo_ladrillo,
                 merma=parse_merma(merma),
-                metadata=metadata,
+                metadata=with_geometry(metadata, detection_results),
                 confianza=float(confianza_numero) if confianza_numero is not None else None,
                 origen_deteccion="image_chunk_upload"
             )
@@ -539,8 +799,8 @@ async def finalize_upload(
             raise HTTPException(status_code=500, detail=f"Error processing assembled image: {str(e)}")
 
     elif is_video:
-        processing_id = str(uuid.uuid4())
-        app.state.pending_video_processing[processing_id] = {
+        # Trabajo persistente en la cola de videos: sigue aunque el cliente cierre el stream o el servidor se reinicie
+        processing_id = await video_job_queue.enqueue({
             "video_path": str(final_save_path), # This is the assembled video path
             "original_filename": originalFilename,
             "upload_dir": str(UPLOAD_DIR), # For consistency, though procesar_video_mp4_streamable might not use it
@@ -548,9 +808,12 @@ async def finalize_upload(
             "evento": evento,
             "merma_str": merma,
             "metadata": metadata,
+            "per_frame_records": per_frame_records,
+            "video_segments": video_segments,
+            "motion_gate": motion_gate,
             "timestamp": final_timestamp_obj # Timestamp of when the video processing task was created
-        }
-        print(f"📹 Video {originalFilename} (ID: {fileId}) ensamblado y listo para procesamiento en segundo plano. Task ID: {processing_id}")
+        }, priority=priority)
+        print(f"📹 Video {originalFilename} (ID: {fileId}) ensamblado y encolado (prioridad {priority}). Task ID: {processing_id}")
         return JSONResponse(content={
             "status": "video_processing_pending", "processing_id": processing_id,
             "filename": originalFilename,
@@ -562,173 +825,175 @@ async def finalize_upload(
             except OSError: pass
         raise HTTPException(status_code=400, detail=f"Unsupported file type after assembly: {file_ext} for {originalFilename}")
 
+def _registro_a_dict(data: VagonetaCreate, record_id: str) -> Dict[str, Any]:
+    """Registro recién creado listo para JSON (WebSocket y eventos SSE)."""
+    db_record_dict = data.dict()
+    db_record_dict["_id"] = str(record_id)
+    db_record_dict["id"] = str(record_id)
+    if isinstance(db_record_dict.get("timestamp"), datetime):
+        db_record_dict["timestamp"] = db_record_dict["timestamp"].isoformat()
+    return db_record_dict
+
+def _registro_video(task_info: Dict[str, Any], processing_id: str, numero_str: str, deteccion: Dict[str, Any]) -> VagonetaCreate:
+    """Registro de una detección de video (una pasada, o un frame en depuración)."""
+    confianza_val = deteccion.get('confianza', 0.0)
+    frame_num = deteccion.get('frame', 0)
+    imagen_path = deteccion.get('imagen_path', f"uploads/{Path(task_info['video_path']).name}")
+
+    # Validar confianza
+    if confianza_val > 1.0:
+        print(f"Warning (VID:{processing_id}): Confianza {confianza_val} > 1.0 para N°{numero_str} frame {frame_num}. Capada a 1.0.")
+        confianza_val = 1.0
+    elif confianza_val < 0.0:
+        print(f"Warning (VID:{processing_id}): Confianza {confianza_val} < 0.0 para N°{numero_str} frame {frame_num}. Capada a 0.0.")
+        confianza_val = 0.0
+
+    record_timestamp = task_info.get("timestamp", datetime.now(timezone.utc))
+    if not isinstance(record_timestamp, datetime):
+        record_timestamp = datetime.now(timezone.utc)
+    if record_timestamp.tzinfo is None:
+        record_timestamp = record_timestamp.replace(tzinfo=timezone.utc)
+
+    vagoneta_data = VagonetaCreate(
+        numero=str(numero_str),
+        imagen_path=imagen_path,
+        timestamp=record_timestamp,
+        tunel=task_info.get("tunel"),
+        evento=task_info.get("evento"),
+        modelo_ladrillo=deteccion.get('modelo_ladrillo'),
+        merma=parse_merma(task_info.get("merma_str")),
+        metadata={
+            **(task_info.get("metadata") or {}),
+            "frame_number": frame_num,
+            "video_source": Path(task_info['video_path']).name,
+            # Pasada de la vagoneta: rango de frames y resumen de confianzas
+            **({"pasada": deteccion["pasada"]} if deteccion.get("pasada") else {}),
+            **({"geometria": deteccion["geometria"]} if deteccion.get("geometria") else {})
+        },
+        confianza=confianza_val,
+        origen_deteccion="video_processing"
+    )
+    return vagoneta_data
+
+async def procesar_video_job(job: Dict[str, Any], ctx: JobContext) -> Dict[str, Any]:
+    """
+    Manejador de la cola de videos (utils/video_jobs.py): procesa el video, publica sus eventos a
+    los suscriptores y crea los registros en cada punto de control, así que tras una caída el
+    trabajo se reanuda desde el último punto sin duplicar registros.
+    """
+    task_info = job["params"]
+    processing_id = job["_id"]
+    checkpoint = job.get("checkpoint") or {}
+    start_frame = checkpoint.get("frame", 0)
+    registros_creados: List[Dict[str, Any]] = list(checkpoint.get("records") or [])
+    creados = {(r["numero"], r["frame"]) for r in registros_creados}
+    # Progreso limitado y lecturas agrupadas en digests antes de llegar a los suscriptores
+    events = ProgressCoalescer(ctx.publish)
+    if start_frame:
+        events.push({"type": "status", "stage": "resume",
+                     "message": f"Reanudando el video desde el frame {start_frame} ({len(registros_creados)} registros ya creados)."})
+
+    async def crear_registros(detecciones: Optional[Dict[str, List[Dict[str, Any]]]]):
+        """Inserta de una vez (insert_many) los registros nuevos desde el último punto de control."""
+        pendientes = []
+        for numero_str, lista_detecciones in (detecciones or {}).items():
+            for deteccion in lista_detecciones:
+                key = (numero_str, deteccion.get('frame', 0))
+                if key not in creados:
+                    pendientes.append((key, _registro_video(task_info, processing_id, numero_str, deteccion)))
+        if not pendientes:
+            return
+        ctx.ensure_owned()  # Si el trabajo se reasignó, los registros los crea el nuevo dueño
+        record_ids = await asyncio.to_thread(crud.create_vagoneta_records, [data for _, data in pendientes])
+        for (key, vagoneta_data), record_id in zip(pendientes, record_ids):
+            if record_id is None:
+                continue  # Se reintenta en el próximo punto de control o al terminar
+            db_record_dict = _registro_a_dict(vagoneta_data, record_id)
+            print(f"✅ Registro creado para video {task_info['original_filename']} (Task:{processing_id}), N°: {key[0]}, Frame: {key[1]}, Conf: {vagoneta_data.confianza:.3f}, DB_ID: {record_id}")
+            asyncio.create_task(manager.broadcast_json({"type": "new_detection", "data": db_record_dict}))
+            creados.add(key)
+            registros_creados.append({"id": record_id, "numero": key[0], "confianza": vagoneta_data.confianza, "frame": key[1]})
+            events.push({'type': 'db_record_created', 'data': db_record_dict})
+
+    final_detection_data = None
+    error_message = None
+    try:
+        async for update in procesar_video_mp4_streamable(task_info["video_path"], Path(task_info["upload_dir"]),
+                                                          per_frame_records=task_info.get("per_frame_records", False),
+                                                          segments=task_info.get("video_segments"),
+                                                          motion_gate=task_info.get("motion_gate"),
+                                                          start_frame=start_frame):
+            if update.get("type") == "checkpoint":
+                await crear_registros(update.get("data"))
+                await ctx.checkpoint({"frame": update["frame"], "total_frames": update.get("total_frames"),
+                                      "records": registros_creados})
+                continue
+            events.push(update)
+            if update.get("type") == "final_result":
+                final_detection_data = update.get("data")
+            elif update.get("type") == "error":
+                error_message = update.get("message")
+
+        if error_message:
+            raise RuntimeError(error_message)
+
+        await crear_registros(final_detection_data)
+    finally:
+        events.flush()
+    if registros_creados:
+        print(f"📊 Total de {len(registros_creados)} registros creados para video {task_info['original_filename']}")
+        ctx.publish_final({'type': 'processing_complete', 'total_records': len(registros_creados), 'records': registros_creados})
+        message = f"Proceso completado para {task_info['original_filename']}. {len(registros_creados)} registros creados."
+    else:
+        print(f"ℹ️ Video {task_info['original_filename']} (Task:{processing_id}) procesado, pero no se encontraron detecciones.")
+        ctx.publish_final({'type': 'status', 'stage': 'completion', 'message': 'Video procesado pero no se encontraron detecciones.'})
+        message = f"Proceso completado para {task_info['original_filename']}. No se creó registro."
+    return {"total_records": len(registros_creados), "records": registros_creados, "message": message}
+
+def _job_to_json(job: Dict[str, Any]) -> Dict[str, Any]:
+    return json.loads(json.dumps(job, default=str))
+
 @app.get("/stream-video-processing/{processing_id}")
 async def stream_video_processing(processing_id: str):
-    if processing_id not in app.state.pending_video_processing:
-        raise HTTPException(status_code=404, detail=f"Video processing ID '{processing_id}' not found or already processed.")
+    """Progreso de un trabajo de video por SSE; se puede conectar (y reconectar) en cualquier momento."""
+    if await video_job_queue.get_job(processing_id) is None:
+        raise HTTPException(status_code=404, detail=f"Video processing ID '{processing_id}' not found.")
 
-    task_info = app.state.pending_video_processing[processing_id]
-    
     async def event_generator():
-        final_detection_data = None
-        processing_error_occurred = False
-        error_message_detail = "Unknown error during video processing."
-        db_record_id_created = None # To store the ID of the created record
-
-        try:
-            yield f"data: {json.dumps({'type': 'status', 'stage': 'stream_init', 'message': 'Conectado al stream de procesamiento de video.'})}\n\n"
-            
-            video_path_to_process = task_info["video_path"]
-            upload_dir_for_streamer = Path(task_info["upload_dir"])
-
-            async for update in procesar_video_mp4_streamable(video_path_to_process, upload_dir_for_streamer):
-                yield f"data: {json.dumps(update)}\n\n"
-                if update.get("type") == "final_result":
-                    final_detection_data = update.get("data")
-                elif update.get("type") == "error": 
-                    processing_error_occurred = True
-                    error_message_detail = update.get("message", error_message_detail)
-            
-            if not processing_error_occurred and final_detection_data:
-                if isinstance(final_detection_data, dict) and final_detection_data:
-                    # Procesar TODAS las detecciones (no solo la mejor)
-                    registros_creados = []
-                    
-                    for numero_str, lista_detecciones in final_detection_data.items():
-                        if isinstance(lista_detecciones, list):
-                            # Nueva estructura: lista de detecciones por número
-                            for deteccion in lista_detecciones:
-                                confianza_val = deteccion.get('confianza', 0.0)
-                                frame_num = deteccion.get('frame', 0)
-                                imagen_path = deteccion.get('imagen_path', f"uploads/{Path(task_info['video_path']).name}")
-                                
-                                # Validar confianza
-                                if confianza_val > 1.0:
-                                    print(f"Warning (VID:{processing_id}): Confianza {confianza_val} > 1.0 para N°{numero_str} frame {frame_num}. Capada a 1.0.")
-                                    confianza_val = 1.0
-                                elif confianza_val < 0.0:
-                                    print(f"Warning (VID:{processing_id}): Confianza {confianza_val} < 0.0 para N°{numero_str} frame {frame_num}. Capada a 0.0.")
-                                    confianza_val = 0.0
-
-                                # Crear registro individual
-                                record_timestamp = task_info.get("timestamp", datetime.now(timezone.utc))
-                                if not isinstance(record_timestamp, datetime): 
-                                    record_timestamp = datetime.now(timezone.utc)
-                                if record_timestamp.tzinfo is None: 
-                                    record_timestamp = record_timestamp.replace(tzinfo=timezone.utc)
-
-                                vagoneta_data = VagonetaCreate(
-                                    numero=str(numero_str),
-                                    imagen_path=imagen_path,
-                                    timestamp=record_timestamp,
-                                    tunel=task_info.get("tunel"),
-                                    evento=task_info.get("evento"),
-                                    modelo_ladrillo=None,
-                                    merma=parse_merma(task_info.get("merma_str")),                                    metadata={
-                                        **(task_info.get("metadata") or {}),
-                                        "frame_number": frame_num,
-                                        "video_source": Path(task_info['video_path']).name
-                                    },
-                                    confianza=confianza_val,
-                                    origen_deteccion="video_processing"
-                                )
-                                
-                                record_id = crud.create_vagoneta_record(vagoneta_data)
-                                registros_creados.append({
-                                    "id": str(record_id),
-                                    "numero": numero_str,
-                                    "confianza": confianza_val,
-                                    "frame": frame_num
-                                })
-
-                                db_record_dict = vagoneta_data.dict()
-                                db_record_dict["_id"] = str(record_id)
-                                db_record_dict["id"] = str(record_id)
-                                if isinstance(db_record_dict.get("timestamp"), datetime):
-                                    db_record_dict["timestamp"] = db_record_dict["timestamp"].isoformat()
-
-                                yield f"data: {json.dumps({'type': 'db_record_created', 'data': db_record_dict})}\n\n"
-                                print(f"✅ Registro creado para video {task_info['original_filename']} (Task:{processing_id}), N°: {numero_str}, Frame: {frame_num}, Conf: {confianza_val:.3f}, DB_ID: {record_id}")
-                                
-                                # Broadcast via WebSocket
-                                broadcast_message = {"type": "new_detection", "data": db_record_dict}
-                                asyncio.create_task(manager.broadcast_json(broadcast_message))
-                        
-                        else:
-                            # Estructura antigua: compatibilidad hacia atrás
-                            confianza_val = float(lista_detecciones) if lista_detecciones else 0.0
-                            
-                            if confianza_val > 1.0:
-                                confianza_val = 1.0
-                            elif confianza_val < 0.0:
-                                confianza_val = 0.0
-
-                            record_timestamp = task_info.get("timestamp", datetime.now(timezone.utc))
-                            if not isinstance(record_timestamp, datetime): 
-                                record_timestamp = datetime.now(timezone.utc)
-                            if record_timestamp.tzinfo is None: 
-                                record_timestamp = record_timestamp.replace(tzinfo=timezone.utc)
-
-                            vagoneta_data = VagonetaCreate(
-                                numero=str(numero_str),
-                                imagen_path=f"uploads/{Path(task_info['video_path']).name}",
-                                timestamp=record_timestamp,
-                                tunel=task_info.get("tunel"),
-                                evento=task_info.get("evento"),
-                                modelo_ladrillo=None,
-                                merma=parse_merma(task_info.get("merma_str")),
-                                metadata=task_info.get("metadata") or {},
-                                confianza=confianza_val,
-                                origen_deteccion="video_processing"
-                            )
-                            
-                            record_id = crud.create_vagoneta_record(vagoneta_data)
-                            registros_creados.append({
-                                "id": str(record_id),
-                                "numero": numero_str,
-                                "confianza": confianza_val
-                            })
-
-                    print(f"📊 Total de {len(registros_creados)} registros creados para video {task_info['original_filename']}")
-                    yield f"data: {json.dumps({'type': 'processing_complete', 'total_records': len(registros_creados), 'records': registros_creados})}\n\n"
-                else:
-                    yield f"data: {json.dumps({'type': 'status', 'stage': 'completion', 'message': 'Video procesado, pero no se identificó un número de vagoneta claro.'})}\n\n"
-                    print(f"ℹ️ Video {task_info['original_filename']} (Task:{processing_id}) procesado. No se identificó un número principal. Detecciones: {final_detection_data}")
-                    # processing_error_occurred remains False, but no record is created.
-                    
-            elif processing_error_occurred:
-                yield f"data: {json.dumps({'type': 'error', 'stage': 'finalization', 'message': f'Error final durante el procesamiento: {error_message_detail}'})}\n\n"
-                print(f"❌ Error final durante el procesamiento del video {task_info['original_filename']} (Task:{processing_id}): {error_message_detail}")
-            
-            elif not final_detection_data : # and not processing_error_occurred implicitly
-                yield f"data: {json.dumps({'type': 'status', 'stage': 'completion', 'message': 'Video procesado pero no se encontraron detecciones.'})}\n\n"
-                print(f"ℹ️ Video {task_info['original_filename']} (Task:{processing_id}) procesado, pero no se encontraron detecciones.")
-        
-        except Exception as e_stream:
-            processing_error_occurred = True # Mark error
-            error_message_detail = f'Excepción en el stream principal: {str(e_stream)}'
-            yield f"data: {json.dumps({'type': 'error', 'stage': 'stream_exception', 'message': error_message_detail})}\n\n"
-            print(f"💥 Excepción en stream_video_processing para {processing_id} ({task_info.get('original_filename', 'N/A')}): {e_stream}\n{traceback.format_exc()}")
-        
-        finally:
-            # Send stream_end event
-            final_message = error_message_detail if processing_error_occurred else \
-                            f"Proceso completado para {task_info.get('original_filename', 'video')}. " + \
-                            (f"Registro DB ID: {db_record_id_created}" if db_record_id_created else "No se creó registro.")
-            
-            yield f"data: {json.dumps({'type': 'stream_end', 'error_occurred': processing_error_occurred, 'message': final_message, 'processing_id': processing_id})}\n\n"
-            print(f"INFO: Stream para {processing_id} ({task_info.get('original_filename', 'N/A')}) finalizando. Error ocurrido: {processing_error_occurred}")
-            
-            # Clean up pending task
-            if processing_id in app.state.pending_video_processing:
-                del app.state.pending_video_processing[processing_id]
-                print(f"INFO: Tarea {processing_id} eliminada de pendientes.")
-            else:
-                # This case might happen if cleanup occurs due to an early exit or another mechanism
-                print(f"WARN: Tarea {processing_id} ya no estaba en pendientes al finalizar stream (posiblemente ya eliminada o error previo).")
+        yield f"data: {json.dumps({'type': 'status', 'stage': 'stream_init', 'message': 'Conectado al stream de procesamiento de video.'})}\n\n"
+        async for event in video_job_queue.events(processing_id):
+            yield f"data: {json.dumps(event, default=str)}\n\n"
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
+@app.websocket("/ws/video-jobs/{processing_id}")
+async def websocket_video_job(websocket: WebSocket, processing_id: str):
+    """Mismos eventos que /stream-video-processing/{processing_id}, por WebSocket."""
+    await websocket.accept()
+    try:
+        found = False
+        async for event in video_job_queue.events(processing_id):
+            found = True
+            await websocket.send_json(_job_to_json(event))
+        if not found:
+            await websocket.send_json({"type": "error", "message": f"Video processing ID '{processing_id}' not found."})
+        await websocket.close()
+    except WebSocketDisconnect:
+        print(f"🔌❌ Suscriptor del trabajo {processing_id} desconectado")
+
+@app.get("/video-jobs")
+async def list_video_jobs(status: Optional[str] = Query(None, enum=["pending", "running", "completed", "failed"]),
+                          limit: int = 50):
+    jobs = await asyncio.to_thread(crud.list_video_jobs, status, limit)
+    return {"jobs": [_job_to_json(job) for job in jobs], "queue": video_job_queue.get_status()}
+
+@app.get("/video-jobs/{processing_id}")
+async def get_video_job(processing_id: str):
+    job = await video_job_queue.get_job(processing_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Video processing ID '{processing_id}' not found.")
+    return _job_to_json(job)
+
 @app.get("/historial/", response_model=HistorialResponse)
 async def get_historial_registros(
     skip: int = 0, 
@@ -805,6 +1070,30 @@ async def get_historial_registros(
         has_more=(skip + len(registros_list) < total_registros)
     )
 
+@app.get("/vagonetas/{record_id}/annotated")
+async def get_imagen_anotada(record_id: str):
+    """Imagen del registro con sus cajas dibujadas (generada bajo demanda y guardada en disco)."""
+    registro = await asyncio.to_thread(crud.get_vagoneta_by_id, record_id)
+    if not registro:
+        raise HTTPException(status_code=404, detail="Registro no encontrado.")
+    imagen_path = Path(registro.get("imagen_path") or "")
+    if not registro.get("imagen_path") or not imagen_path.is_file():
+        raise HTTPException(status_code=404, detail="El registro no tiene una imagen disponible.")
+
+    geometria = (registro.get("metadata") or {}).get("geometria")
+    if not geometria:
+        # Registros anteriores a metadata.geometria: se vuelve a detectar sobre la imagen guardada
+        geometria = detection_geometry(await run_detection_on_path_async(str(imagen_path)))
+
+    try:
+        annotated_path = await asyncio.to_thread(
+            get_annotated_cache().render, record_id, imagen_path, geometria,
+            registro.get("numero"), registro.get("confianza"), registro.get("modelo_ladrillo")
+        )
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return FileResponse(str(annotated_path), media_type="image/jpeg")
+
 @app.post("/auto-capture/start")
 async def start_auto_capture():
     global auto_capture_manager, auto_capture_task, CAMERAS_CONFIG, UPLOAD_DIR, manager
@@ -869,15 +1158,57 @@ async def websocket_endpoint(websocket: WebSocket):
         print(f"❌ Error en WebSocket para {websocket.client}: {e}")
         manager.disconnect(websocket)
 
-# Example model info endpoint (if processor object exists and has details)
-# from utils.image_processing import processor # Assuming processor is initialized here or globally
+@app.get("/ready")
+async def readiness_check():
+    """Listo para recibir tráfico solo cuando los modelos están cargados y calentados."""
+    readiness = get_readiness()
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
+
+@app.get("/inference/stats")
+async def inference_stats():
+    """Aciertos/fallos de la caché de resultados y estado de los lotes de inferencia."""
+    return get_inference_stats()
+
+@app.get("/images/writer/stats")
+async def image_writer_stats():
+    """Profundidad de la cola y tiempos de codificación/escritura del escritor de imágenes."""
+    return get_image_writer().get_stats()
+
 @app.get("/model/info")
-async def get_model_info():
-    # This depends on how 'processor' is defined and what attributes it has.
-    # Placeholder if 'processor' is not readily available or its structure is unknown.
-    # if 'processor' in globals() and hasattr(processor, 'get_model_details'):
-    #     return processor.get_model_details()
-    return {"message": "Información del modelo no disponible en esta configuración."}
+async def model_info():
+    """Versión activa del modelo, tamaño de entrada, umbrales y rendimiento medido."""
+    return await asyncio.to_thread(get_model_info)
+
+@app.post("/model/config")
+async def update_model_config(config: ModelConfigUpdate):
+    """Ajusta los umbrales de inferencia en caliente (se aplican a los pedidos siguientes)."""
+    settings = get_inference_settings()
+    try:
+        changed = settings.update(min_confidence=config.min_confidence, umbral_agrupacion=config.umbral_agrupacion)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # usar_agrupacion y modo_deteccion no cambian el pipeline: se aceptan pero no se aplican
+    ignored = [field for field in ("usar_agrupacion", "modo_deteccion") if getattr(config, field) is not None]
+    return {"updated": changed, "config": settings.to_dict(), "ignored": ignored}
+
+@app.get("/model/versions")
+async def list_model_versions():
+    """Versiones registradas del modelo (scripts/register_model.py) y cuál está activa."""
+    registry = get_model_registry()
+    versions = await asyncio.to_thread(lambda: [v.to_dict() for v in registry.list_versions()])
+    return {"active": registry.active_version, "versions": versions}
+
+@app.post("/model/activate/{version}")
+async def activate_model_version(version: str):
+    """Carga y calienta otra versión del modelo y la pone en servicio sin reiniciar."""
+    try:
+        return await asyncio.to_thread(swap_model, version)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"No se pudo activar la versión '{version}': {e}")
 
 # Endpoints para Monitor en Vivo
 
@@ -964,9 +1295,12 @@ async def get_monitor_status():
     active_monitors = []
     for camera_id, task in monitor_tasks.items():
         if not task.done():
+            tracker = live_trackers.get(camera_id)
             active_monitors.append({
                 "camera_id": camera_id,
-                "status": "running"
+                "status": "running",
+                "tracking": tracker.get_status() if tracker is not None else None,
+                "voting": live_voters[camera_id].get_status() if camera_id in live_voters else None
             })
     
     return {
@@ -977,6 +1311,73 @@ async def get_monitor_status():
 async def monitor_camera_live(camera_id: str, camera_config: dict):
     """Función para monitorear una cámara en tiempo real"""
     cap = None
+    # Región aprendida del número para esta cámara (compartida con la captura automática)
+    plate_prior = get_plate_prior_store().get(camera_id) if camera_config.get("use_plate_prior", True) else None
+    tiling = parse_tiling_config(camera_config.get("tiling"))
+    # Seguimiento entre detecciones: con la escena vacía se detecta cada ~30 frames, como antes
+    tracker = (BoxTracker(detect_interval=max(1, 30 // LIVE_TRACK_STEP))
+               if camera_config.get("tracking", True) else None)
+    live_trackers[camera_id] = tracker
+    # Votación temporal: un registro por número estable, no uno por lectura ruidosa
+    voter = TemporalVoter.from_config(camera_id, camera_config.get("voting"))
+    live_voters[camera_id] = voter
+    frame_index = 0
+    fps = 0
+
+    async def _detect_live_frame(frame):
+        if plate_prior is not None:
+            return (await run_detection_with_prior_async(
+                [frame], plate_prior, get_plate_prior_store(),
+                backend=camera_config.get("inference_backend"), tiling=tiling))[0]
+        return await run_detection_on_frame_async(
+            frame, backend=camera_config.get("inference_backend"), tiling=tiling)
+
+    async def _vote_live_detection(frame, detection_results):
+        track = tracker.best_track() if tracker is not None else None
+        event = voter.add(detection_results.get('numero_detectado'), detection_results.get('confianza_numero'),
+                          evidence=(frame, detection_geometry(detection_results), track.id if track else None),
+                          modelo_ladrillo=detection_results.get('modelo_ladrillo'))
+        if event is not None and event.confianza >= 0.5:
+            best_frame, geometry, track_id = event.evidence
+            extra_metadata = {"votos": event.votos, "share": round(event.share, 3), "geometria": geometry}
+            if track_id is not None:
+                extra_metadata["track_id"] = track_id
+            await _save_live_detection(best_frame, event.numero, event.confianza, event.modelo_ladrillo, extra_metadata)
+
+    async def _save_live_detection(frame, numero_detectado, confianza_numero, modelo_ladrillo,
+                                   extra_metadata: Optional[dict] = None):
+        # Guardar imagen del frame (codificación y disco en el escritor de imágenes)
+        timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+        image_writer = get_image_writer()
+        frame_filename = image_writer.image_name(f"detection_frame_{camera_id}_{timestamp_str}")
+        await image_writer.write_async(frame, UPLOAD_DIR / frame_filename)
+
+        # Crear registro en base de datos
+        vagoneta_create_obj = VagonetaCreate(
+            numero=str(numero_detectado),
+            imagen_path=f"uploads/{frame_filename}",
+            timestamp=datetime.now(timezone.utc),
+            tunel=camera_config.get("tunel"),
+            evento="deteccion_automatica",
+            modelo_ladrillo=modelo_ladrillo,
+            merma=None,
+            metadata={"camera_id": camera_id, "fps": fps, **(extra_metadata or {})},
+            confianza=float(confianza_numero),
+            origen_deteccion="live_camera"
+        )
+        record_id = crud.create_vagoneta_record(vagoneta_create_obj)
+
+        # Notificar a los clientes WebSocket
+        db_record_dict = vagoneta_create_obj.dict()
+        db_record_dict["_id"] = str(record_id)
+        db_record_dict["id"] = str(record_id)
+        db_record_dict["timestamp"] = db_record_dict["timestamp"].isoformat()
+
+        await manager.broadcast_json({
+            "type": "new_detection",
+            "data": db_record_dict
+        })
+
     try:
         camera_url = camera_config["camera_url"]
         print(f"🎥 Iniciando monitoreo para cámara {camera_id} (URL: {camera_url})")
@@ -989,9 +1390,10 @@ async def monitor_camera_live(camera_id: str, camera_config: dict):
         if not cap.isOpened():
             raise Exception(f"No se pudo abrir la cámara {camera_id}")
 
-        # Configurar propiedades
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+        # Configurar propiedades (las cámaras con teselas se leen a su resolución nativa)
+        if tiling is None:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
         cap.set(cv2.CAP_PROP_FPS, 15)
 
         # Verificar lectura
@@ -1003,7 +1405,6 @@ async def monitor_camera_live(camera_id: str, camera_config: dict):
         frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         frame_count = 0
         last_time = time.time()
-        fps = 0
         print(f"✅ Cámara conectada (Resolución: {frame_width}x{frame_height})")
         
         while True:
@@ -1031,50 +1432,29 @@ async def monitor_camera_live(camera_id: str, camera_config: dict):
                         }
                     })
 
-                # Realizar detección en algunos frames (cada 30 frames, aproximadamente 1-2 segundos)
-                if frame_count % 30 == 0:
+                # Realizar detección en algunos frames (cada 30 frames, aproximadamente 1-2 segundos);
+                # con seguimiento, un paso cada LIVE_TRACK_STEP frames y el modelo solo cuando hace falta
+                frame_index += 1
+                if tracker is not None:
+                    if frame_index % LIVE_TRACK_STEP == 0:
+                        try:
+                            if tracker.should_detect():
+                                detection_results = await _detect_live_frame(frame)
+                                tracker.update(frame, detection_results)
+                                await _vote_live_detection(frame, detection_results)
+                            else:
+                                tracker.propagate(frame)
+                                # La pista sigue votando por su número entre detecciones completas
+                                reading = tracker.reading()
+                                if reading is not None:
+                                    await _vote_live_detection(frame, reading)
+                        except Exception as e:
+                            print(f"Error en detección de cámara {camera_id}: {e}")
+                elif frame_count % 30 == 0:
                     # Procesar el frame para detección
                     try:
-                        # --- NUEVA LÓGICA DE DETECCIÓN UNIFICADA ---
-                        detection_results = run_detection_on_frame(frame)
-                        numero_detectado = detection_results.get('numero_detectado')
-                        modelo_ladrillo = detection_results.get('modelo_ladrillo')
-                        confianza_numero = detection_results.get('confianza_numero')
-                        # --- FIN DE LA NUEVA LÓGICA ---
-                        
-                        if numero_detectado and confianza_numero is not None:
-                            if confianza_numero >= 0.5:
-                                # Guardar imagen del frame
-                                timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
-                                frame_filename = f"detection_frame_{camera_id}_{timestamp_str}.jpg"
-                                frame_path = UPLOAD_DIR / frame_filename
-                                cv2.imwrite(str(frame_path), frame)
-                                
-                                # Crear registro en base de datos
-                                vagoneta_create_obj = VagonetaCreate(
-                                    numero=str(numero_detectado),
-                                    imagen_path=f"uploads/{frame_filename}",
-                                    timestamp=datetime.now(timezone.utc),
-                                    tunel=camera_config.get("tunel"),
-                                    evento="deteccion_automatica",
-                                    modelo_ladrillo=modelo_ladrillo,
-                                    merma=None,
-                                    metadata={"camera_id": camera_id, "fps": fps},
-                                    confianza=float(confianza_numero),
-                                    origen_deteccion="live_camera"
-                                )
-                                record_id = crud.create_vagoneta_record(vagoneta_create_obj)
-                                
-                                # Notificar a los clientes WebSocket
-                                db_record_dict = vagoneta_create_obj.dict()
-                                db_record_dict["_id"] = str(record_id)
-                                db_record_dict["id"] = str(record_id)
-                                db_record_dict["timestamp"] = db_record_dict["timestamp"].isoformat()
-                                
-                                await manager.broadcast_json({
-                                    "type": "new_detection",
-                                    "data": db_record_dict
-                                })
+                        detection_results = await _detect_live_frame(frame)
+                        await _vote_live_detection(frame, detection_results)
                     except Exception as e:
                         print(f"Error en detección de cámara {camera_id}: {e}")                
                 # Almacenar frame para streaming
@@ -1091,6 +1471,8 @@ async def monitor_camera_live(camera_id: str, camera_config: dict):
     finally:
         if cap:
             cap.release()
+        live_trackers.pop(camera_id, None)
+        live_voters.pop(camera_id, None)
         print(f"🔌 Liberando recursos de cámara {camera_id}")
 
 # ====================
@@ -50,3 +50,10 @@ class HistorialResponse(BaseModel):
     skip: int
     limit: int
     has_more: bool
+
+class ModelConfigUpdate(BaseModel):
+    """Umbrales de inferencia enviados por ModelConfig.js (POST /model/config)"""
+    min_confidence: Optional[float] = Field(None, description="Confianza mínima de las detecciones YOLO", gt=0.0, lt=1.0)
+    umbral_agrupacion: Optional[int] = Field(None, description="Distancia máxima en píxeles entre dígitos de un mismo número", gt=0)
+    usar_agrupacion: Optional[bool] = Field(None, description="Agrupar dígitos en números compuestos (siempre activo)")
+    modo_deteccion: Optional[str] = Field(None, description="Modo de detección elegido en el frontend (informativo)")
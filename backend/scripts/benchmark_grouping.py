@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark de la agrupación de dígitos: una llamada a agrupar_numero_compuesto por
+frame frente a agrupar_numeros_compuestos_lote sobre el lote completo, con las cajas de
+models/numeros_enteros/yolo_model/result/detecciones.json repartidas en frames sintéticos.
+
+No carga el modelo: mide solo el post-procesamiento y comprueba que ambos caminos dan el
+mismo resultado.
+
+Uso:
+    python scripts/benchmark_grouping.py --batch-sizes 1 8 32 --repeats 20
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from utils.number_grouping import MAPEO_CLASES, agrupar_numero_compuesto, agrupar_numeros_compuestos_lote
+
+DEFAULT_SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              "models", "numeros_enteros", "yolo_model", "result", "detecciones.json")
+CLASES_POR_NUMERO = {numero: clase for clase, numero in MAPEO_CLASES.items()}
+
+def load_frames(path: str, max_boxes: int, seed: int):
+    """Reparte las cajas del JSON, en orden, en frames de 1 a `max_boxes` cajas (array N×6)."""
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    rows = [[e["posicion"]["x_min"], e["posicion"]["y_min"], e["posicion"]["x_max"], e["posicion"]["y_max"],
+             e["confianza"], CLASES_POR_NUMERO.get(e["numero_detectado"], -1)] for e in entries]
+    boxes = np.asarray(rows, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    frames, start = [], 0
+    while start < len(boxes):
+        size = int(rng.integers(1, max_boxes + 1))
+        frames.append(boxes[start:start + size])
+        start += size
+    return frames
+
+def measure(fn, repeats: int) -> float:
+    fn()  # calentamiento
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la agrupación de dígitos por lotes")
+    parser.add_argument("--sample", default=DEFAULT_SAMPLE, help="JSON de detecciones de muestra")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 128], help="Frames por lote")
+    parser.add_argument("--max-boxes", type=int, default=8, help="Cajas máximas por frame sintético")
+    parser.add_argument("--umbral", type=int, default=50, help="Umbral de agrupación en píxeles")
+    parser.add_argument("--repeats", type=int, default=20, help="Repeticiones por medición")
+    args = parser.parse_args()
+
+    frames = load_frames(args.sample, args.max_boxes, seed=0)
+    print("⏱️ BENCHMARK DE AGRUPACIÓN DE DÍGITOS")
+    print("=" * 40)
+    print(f"📁 {sum(len(f) for f in frames)} cajas en {len(frames)} frames ({args.sample})")
+
+    per_frame = [agrupar_numero_compuesto(f, args.umbral) for f in frames]
+    if per_frame != agrupar_numeros_compuestos_lote(frames, args.umbral):
+        print("❌ El lote no coincide con la agrupación frame a frame")
+        sys.exit(1)
+    print("✅ Resultados idénticos frame a frame y por lotes")
+
+    for batch_size in args.batch_sizes:
+        batches = [frames[i:i + batch_size] for i in range(0, len(frames), batch_size)]
+        loop_s = measure(lambda: [agrupar_numero_compuesto(f, args.umbral) for b in batches for f in b], args.repeats)
+        batch_s = measure(lambda: [agrupar_numeros_compuestos_lote(b, args.umbral) for b in batches], args.repeats)
+        loop_us, batch_us = loop_s * 1e6 / len(frames), batch_s * 1e6 / len(frames)
+        print(f"📊 Lotes de {batch_size} frames")
+        print(f"   Frame a frame: {loop_us:7.1f} µs/frame")
+        print(f"   Por lotes:     {batch_us:7.1f} µs/frame (x{loop_us / batch_us:.2f})")
+
+if __name__ == "__main__":
+    main()
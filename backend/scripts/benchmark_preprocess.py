@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark del preprocesamiento por frame: pipeline anterior (CLAHE a resolución
+completa + letterbox y conversión a tensor de ultralytics) frente a PreprocessPipeline
+(letterbox primero, CLAHE cacheado y buffers preasignados) a 720p y 1080p.
+
+No carga el modelo: mide solo el trabajo hasta tener el tensor de entrada listo.
+
+Uso:
+    python scripts/benchmark_preprocess.py --imgsz 1280 --iterations 200
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+from utils.preprocessing import PreprocessPipeline, letterbox_geometry, PAD_VALUE
+
+RESOLUTIONS = {"720p": (720, 1280), "1080p": (1080, 1920)}
+
+def legacy_preprocess(image: np.ndarray, imgsz: int, stride: int = 32) -> np.ndarray:
+    """Reproduce el camino anterior: preprocess_image + LetterBox + conversión de ultralytics."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    enhanced = cv2.cvtColor(clahe.apply(gray), cv2.COLOR_GRAY2BGR)
+
+    (new_h, new_w), (out_h, out_w), left, top = letterbox_geometry(image.shape[:2], (imgsz, imgsz), auto=True, stride=stride)
+    resized = cv2.resize(enhanced, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    padded = cv2.copyMakeBorder(resized, top, out_h - new_h - top, left, out_w - new_w - left,
+                                cv2.BORDER_CONSTANT, value=(PAD_VALUE, PAD_VALUE, PAD_VALUE))
+    tensor = padded[None].transpose(0, 3, 1, 2)[:, ::-1]  # BHWC -> BCHW, BGR -> RGB
+    return np.ascontiguousarray(tensor).astype(np.float32) / 255.0
+
+def measure(fn, iterations: int):
+    for _ in range(5):  # calentamiento (caches de OpenCV y buffers del pipeline)
+        fn()
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed_ms = (time.perf_counter() - start) * 1000 / iterations
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed_ms, peak / (1024 * 1024)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del preprocesamiento por frame")
+    parser.add_argument("--imgsz", type=int, default=1280, help="Tamaño de entrada del modelo")
+    parser.add_argument("--iterations", type=int, default=200, help="Frames por medición")
+    args = parser.parse_args()
+
+    print("⏱️ BENCHMARK DE PREPROCESAMIENTO")
+    print("=" * 40)
+    rng = np.random.default_rng(0)
+    pipeline = PreprocessPipeline()
+
+    for label, shape in RESOLUTIONS.items():
+        frame = rng.integers(0, 256, size=shape + (3,), dtype=np.uint8)
+        legacy_ms, legacy_mb = measure(lambda: legacy_preprocess(frame, args.imgsz), args.iterations)
+        new_ms, new_mb = measure(
+            lambda: pipeline.prepare_batch([frame], (args.imgsz, args.imgsz), auto=True, as_tensor=True), args.iterations)
+
+        print(f"📊 {label} -> imgsz {args.imgsz}")
+        print(f"   Anterior: {legacy_ms:6.2f} ms/frame, pico numpy {legacy_mb:6.1f} MB")
+        print(f"   Pipeline: {new_ms:6.2f} ms/frame, pico numpy {new_mb:6.1f} MB")
+        print(f"   Ahorro:   {legacy_ms - new_ms:6.2f} ms/frame (x{legacy_ms / new_ms:.2f})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Script para verificar que todos los backends de inferencia producen la misma salida de
+detect_objects_unified que el modelo PyTorch de referencia sobre un conjunto de imágenes.
+
+Uso:
+    python scripts/check_backend_parity.py --samples uploads --backends onnx openvino torchscript
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+
+from utils.inference_backends import BACKENDS, DEFAULT_WEIGHTS_PATH, compare_detections
+from utils.image_processing import ImageProcessor
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+def load_samples(samples_dir: str, limit: int):
+    paths = sorted(p for p in glob.glob(os.path.join(samples_dir, "*")) if p.lower().endswith(IMAGE_EXTENSIONS))
+    samples = []
+    for path in paths[:limit]:
+        image = cv2.imread(path)
+        if image is not None:
+            samples.append((os.path.basename(path), image))
+    return samples
+
+def run_backend(processor: ImageProcessor, samples):
+    outputs, latencies = [], []
+    for _, image in samples:
+        start = time.perf_counter()
+        outputs.append(processor.detect_objects_unified(image))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return outputs, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description="Paridad de salidas entre backends de inferencia")
+    parser.add_argument("--weights", default=DEFAULT_WEIGHTS_PATH, help="Ruta a best.pt")
+    parser.add_argument("--samples", default="uploads", help="Directorio con imágenes de muestra")
+    parser.add_argument("--limit", type=int, default=50, help="Máximo de imágenes a comparar")
+    parser.add_argument("--backends", nargs="+", default=[b for b in BACKENDS if b != "pytorch"], choices=list(BACKENDS))
+    parser.add_argument("--conf-tol", type=float, default=0.05, help="Tolerancia de confianza")
+    parser.add_argument("--bbox-tol", type=float, default=4.0, help="Tolerancia de bbox en píxeles")
+    args = parser.parse_args()
+
+    print("🔍 VERIFICANDO PARIDAD ENTRE BACKENDS")
+    print("=" * 40)
+
+    samples = load_samples(args.samples, args.limit)
+    if not samples:
+        print(f"❌ No hay imágenes de muestra en {args.samples}")
+        sys.exit(1)
+    print(f"🖼️ Imágenes de muestra: {len(samples)}")
+
+    reference_outputs, reference_latencies = run_backend(ImageProcessor(args.weights, backend="pytorch"), samples)
+    print(f"📊 pytorch (referencia): {sum(reference_latencies) / len(reference_latencies):.1f} ms/imagen")
+
+    all_ok = True
+    for name in args.backends:
+        try:
+            processor = ImageProcessor(args.weights, backend=name)
+        except Exception as e:
+            print(f"❌ {name}: no se pudo cargar ({e})")
+            all_ok = False
+            continue
+
+        outputs, latencies = run_backend(processor, samples)
+        mismatches = 0
+        for (filename, _), reference, candidate in zip(samples, reference_outputs, outputs):
+            differences = compare_detections(reference, candidate, args.conf_tol, args.bbox_tol)
+            if differences:
+                mismatches += 1
+                print(f"   ⚠️ {name} / {filename}: {'; '.join(differences)}")
+
+        status = "✅" if mismatches == 0 else "❌"
+        print(f"{status} {name}: {len(samples) - mismatches}/{len(samples)} coincidencias, "
+              f"{sum(latencies) / len(latencies):.1f} ms/imagen")
+        all_ok = all_ok and mismatches == 0
+
+    sys.exit(0 if all_ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,7 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from utils.image_processing import processor
+from utils.image_processing import get_processor
 
 def check_model_status():
     """Verifica el estado del modelo"""
@@ -15,6 +15,8 @@ def check_model_status():
     print("=" * 40)
     
     try:
+        processor = get_processor()
+        print(f"⏱️ Tiempo de carga: {processor.load_seconds:.2f}s")
         print(f"✅ Modelo cargado: {processor.model is not None}")
         print(f"🔧 Confianza: {processor.min_confidence}")
         print(f"🏷️ Número de clases: {len(processor.model.names)}")
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Script para exportar best.pt a los backends de inferencia alternativos
+(TorchScript, ONNX Runtime, OpenVINO).
+
+Uso:
+    python scripts/export_backends.py                       # todos los backends
+    python scripts/export_backends.py --backends onnx openvino --force
+"""
+
+import argparse
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.inference_backends import BACKENDS, DEFAULT_WEIGHTS_PATH, export_backend
+
+def main():
+    exportables = [name for name, backend in BACKENDS.items() if backend.export_format]
+    # INT8 necesita calibración: se genera con scripts/quantize_int8.py o pidiéndolo explícitamente
+    default_backends = [name for name in exportables if not BACKENDS[name].exporter]
+    parser = argparse.ArgumentParser(description="Exporta best.pt a los backends de inferencia")
+    parser.add_argument("--weights", default=DEFAULT_WEIGHTS_PATH, help="Ruta a best.pt")
+    parser.add_argument("--backends", nargs="+", default=default_backends, choices=exportables)
+    parser.add_argument("--force", action="store_true", help="Regenerar aunque el artefacto exista")
+    args = parser.parse_args()
+
+    print("🔧 EXPORTANDO BACKENDS DE INFERENCIA")
+    print("=" * 40)
+
+    if not os.path.exists(args.weights):
+        print(f"❌ No se encontró el modelo: {args.weights}")
+        sys.exit(1)
+
+    failed = []
+    for name in args.backends:
+        try:
+            export_backend(name, args.weights, force=args.force)
+        except Exception as e:
+            print(f"❌ Error exportando a {name}: {e}")
+            failed.append(name)
+
+    if failed:
+        print(f"⚠️ Backends con error: {', '.join(failed)}")
+        sys.exit(1)
+    print("✅ Exportación completada")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Script para generar el modelo INT8 (backend "onnx-int8") calibrado con frames reales del
+directorio de subidas y reportar su precisión y latencia frente al modelo FP32.
+
+El reporte compara, frame a frame, el `numero_detectado` compuesto de ambos modelos y la
+latencia de detect_objects_unified.
+
+Uso:
+    python scripts/quantize_int8.py --uploads uploads --calib-limit 200 --report int8_report.json
+"""
+
+import argparse
+import json
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.inference_backends import BACKENDS, DEFAULT_WEIGHTS_PATH
+from utils.image_processing import ImageProcessor
+from utils.quantization import DEFAULT_UPLOADS_DIR, build_quantization_report, iter_calibration_frames, quantize_int8
+
+def main():
+    parser = argparse.ArgumentParser(description="Cuantización INT8 post-entrenamiento con reporte de precisión/latencia")
+    parser.add_argument("--weights", default=DEFAULT_WEIGHTS_PATH, help="Ruta a best.pt")
+    parser.add_argument("--uploads", default=DEFAULT_UPLOADS_DIR, help="Directorio con imágenes/videos de calibración")
+    parser.add_argument("--calib-limit", type=int, default=200, help="Máximo de frames de calibración")
+    parser.add_argument("--samples", type=int, default=50, help="Frames de evaluación para el reporte")
+    parser.add_argument("--reference", default="pytorch", choices=[b for b in BACKENDS if b != "onnx-int8"],
+                        help="Backend FP32 de referencia")
+    parser.add_argument("--no-head-fp32", action="store_true", help="Cuantizar también la cabeza de detección")
+    parser.add_argument("--force", action="store_true", help="Regenerar aunque best_int8.onnx ya exista")
+    parser.add_argument("--report", default=None, help="Ruta del reporte JSON (opcional)")
+    args = parser.parse_args()
+
+    print("🔧 CUANTIZACIÓN INT8 DEL DETECTOR")
+    print("=" * 40)
+
+    try:
+        quantize_int8(args.weights, uploads_dir=args.uploads, limit=args.calib_limit,
+                      force=args.force, keep_head_fp32=not args.no_head_fp32)
+    except Exception as e:
+        print(f"❌ No se pudo generar el modelo INT8: {e}")
+        sys.exit(1)
+
+    samples = list(iter_calibration_frames(args.uploads, args.samples))
+    if not samples:
+        print(f"⚠️ No hay frames en {args.uploads} para el reporte")
+        sys.exit(0)
+
+    reference = ImageProcessor(args.weights, backend=args.reference)
+    int8 = ImageProcessor(args.weights, backend="onnx-int8")
+    report = build_quantization_report(reference, int8, samples)
+
+    for frame in report["frames"]:
+        if not frame["match"]:
+            print(f"   ⚠️ {frame['sample']}: {args.reference}={frame['numero_fp32']!r} int8={frame['numero_int8']!r}")
+
+    print(f"📊 Frames evaluados: {report['samples']}")
+    print(f"   Coincidencia de numero_detectado: {report['numero_agreement']}")
+    print(f"   Recall vs {args.reference} (frames con número): {report['numero_recall_vs_fp32']}")
+    print(f"   Latencia {args.reference}: {report['latency_fp32']}")
+    print(f"   Latencia INT8: {report['latency_int8']}")
+    print(f"🚀 Aceleración media: x{report['speedup_mean']}")
+
+    if args.report:
+        report["reference_backend"] = args.reference
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Reporte guardado en {args.report}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Script para registrar unos pesos nuevos (best.pt de un reentrenamiento) como versión del
+registro de modelos y listar las versiones disponibles.
+
+El registro no cambia el modelo en servicio: la versión se activa en caliente con
+POST /model/activate/{version} una vez el servidor la ha cargado y calentado.
+
+Uso:
+    python scripts/register_model.py --weights runs/train_final/weights/best.pt --epochs 200
+    python scripts/register_model.py --list
+"""
+
+import argparse
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.model_registry import get_model_registry
+
+def main():
+    parser = argparse.ArgumentParser(description="Registro de versiones del modelo YOLO")
+    parser.add_argument("--weights", help="Ruta al best.pt a registrar")
+    parser.add_argument("--version", default=None, help="Nombre de la versión (por defecto, vAAAAMMDD-HHMMSS)")
+    parser.add_argument("--epochs", type=int, default=None, help="Épocas de entrenamiento (se muestra en /model/info)")
+    parser.add_argument("--imgsz", type=int, default=None, help="Tamaño de entrada con el que se entrenó")
+    parser.add_argument("--notes", default=None, help="Notas libres de la versión")
+    parser.add_argument("--list", action="store_true", help="Listar las versiones registradas")
+    args = parser.parse_args()
+
+    registry = get_model_registry()
+
+    if args.weights:
+        metadata = {key: value for key, value in (("training_epochs", args.epochs), ("imgsz", args.imgsz),
+                                                  ("notes", args.notes)) if value is not None}
+        try:
+            version = registry.register(args.weights, args.version, metadata)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        print(f"📁 Pesos copiados a: {version.weights_path}")
+        print(f"🚀 Activar con: POST /model/activate/{version.version}")
+    elif not args.list:
+        parser.print_help()
+        return
+
+    print("📋 VERSIONES REGISTRADAS")
+    print("=" * 40)
+    for version in registry.list_versions():
+        details = version.to_dict()
+        marker = "✅" if version.version == registry.active_version else "  "
+        print(f"{marker} {version.version}: {details['size_mb']} MB, épocas={version.metadata.get('training_epochs')}, "
+              f"disponible={details['available']}")
+
+if __name__ == "__main__":
+    main()
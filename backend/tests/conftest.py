@@ -0,0 +1,20 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+# Los módulos del backend se importan como en main.py (import crud, from utils...)
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Los pesos no se versionan: se copian a mano (ver README) o los registra scripts/register_model.py
+MODEL_WEIGHTS = BACKEND_DIR / "models" / "numeros_enteros" / "yolo_model" / "training" / "best.pt"
+
+
+@pytest.fixture(scope="session")
+def model_path() -> str:
+    """Ruta a best.pt; las pruebas que necesitan el modelo se saltan si no está."""
+    if not MODEL_WEIGHTS.is_file():
+        pytest.skip(f"Modelo no disponible en {MODEL_WEIGHTS}")
+    return str(MODEL_WEIGHTS)
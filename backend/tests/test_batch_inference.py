@@ -0,0 +1,54 @@
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+from utils.batch_inference import BatchInferenceService
+
+
+def _frames(n):
+    return [np.full((8, 8, 3), i, dtype=np.uint8) for i in range(n)]
+
+
+def test_results_are_delivered_in_order():
+    service = BatchInferenceService(lambda frames, *a: [{'valor': int(f[0, 0, 0])} for f in frames],
+                                    max_batch_size=4, max_wait_ms=20)
+    try:
+        futures = [service.submit(frame) for frame in _frames(6)]
+        assert [f.result(timeout=5)['valor'] for f in futures] == list(range(6))
+        stats = service.get_stats()
+        assert stats['requests'] == 6 and stats['frames_processed'] == 6 and stats['errors'] == 0
+    finally:
+        service.stop()
+
+
+def test_short_result_list_fails_every_request_instead_of_hanging():
+    service = BatchInferenceService(lambda frames, *a: [{}] * (len(frames) - 1), max_batch_size=4, max_wait_ms=50)
+    try:
+        futures = [service.submit(frame) for frame in _frames(3)]
+        for future in futures:
+            with pytest.raises(RuntimeError):
+                future.result(timeout=5)
+        assert service.get_stats()['errors'] >= 1
+    finally:
+        service.stop()
+
+
+class _ShortExecutor:
+    workers = 1
+
+    def submit_batch(self, frames, *args):
+        future = Future()
+        future.set_result([{}] * (len(frames) - 1))
+        return future
+
+
+def test_short_result_list_from_executor_fails_requests():
+    service = BatchInferenceService(executor=_ShortExecutor(), max_batch_size=2, max_wait_ms=50)
+    try:
+        futures = [service.submit(frame) for frame in _frames(2)]
+        for future in futures:
+            with pytest.raises(RuntimeError):
+                future.result(timeout=5)
+    finally:
+        service.stop()
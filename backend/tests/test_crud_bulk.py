@@ -0,0 +1,51 @@
+from datetime import datetime, timezone
+
+from pymongo.errors import BulkWriteError
+
+import crud
+from schemas import VagonetaCreate
+
+
+class FakeVagonetas:
+    """insert_many de pymongo con ordered=False: los documentos marcados como "dup" fallan."""
+
+    def __init__(self):
+        self.calls = []
+        self.stored = []
+
+    def insert_many(self, docs, ordered=True):
+        assert ordered is False
+        self.calls.append(len(docs))
+        errors = []
+        for index, doc in enumerate(docs):
+            if doc["numero"] == "dup":
+                errors.append({"index": index, "code": 11000, "errmsg": "duplicate key"})
+            else:
+                self.stored.append(doc)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+
+def _registro(numero):
+    return VagonetaCreate(numero=numero, evento="ingreso", imagen_path="uploads/x.jpg",
+                          timestamp=datetime.now(timezone.utc))
+
+
+def test_ids_follow_input_order_across_chunks_and_failed_documents_get_none(monkeypatch):
+    vagonetas = FakeVagonetas()
+    monkeypatch.setattr(crud, "get_database", lambda: type("DB", (), {"vagonetas": vagonetas})())
+    numeros = ["1", "dup", "3", "4", "5", "dup", "7"]
+
+    ids = crud.create_vagoneta_records([_registro(n) for n in numeros], chunk_size=3)
+
+    assert vagonetas.calls == [3, 3, 1]
+    assert [i is None for i in ids] == [n == "dup" for n in numeros]
+    stored = {str(doc["_id"]): doc["numero"] for doc in vagonetas.stored}
+    assert [stored[i] for i in ids if i is not None] == ["1", "3", "4", "5", "7"]
+
+
+def test_empty_input_does_not_touch_the_collection(monkeypatch):
+    vagonetas = FakeVagonetas()
+    monkeypatch.setattr(crud, "get_database", lambda: type("DB", (), {"vagonetas": vagonetas})())
+    assert crud.create_vagoneta_records([]) == []
+    assert vagonetas.calls == []
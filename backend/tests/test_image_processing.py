@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+
+from utils.image_processing import ImageProcessor
+
+
+@pytest.fixture(scope="module")
+def processor(model_path):
+    return ImageProcessor(model_path, backend="pytorch")
+
+
+def test_batch_detection_matches_single_frame_detection(processor):
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, (480, 640, 3), dtype=np.uint8), np.zeros((360, 640, 3), dtype=np.uint8)]
+    batch = processor.detect_objects_batch(frames)
+    assert len(batch) == len(frames)
+    for frame, result in zip(frames, batch):
+        single = processor.detect_objects_unified(frame)
+        assert result.get('numero_detectado') == single.get('numero_detectado')
+        assert (result.get('bbox_vagoneta') is None) == (single.get('bbox_vagoneta') is None)
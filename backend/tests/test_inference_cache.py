@@ -0,0 +1,74 @@
+import types
+
+import numpy as np
+
+import utils.inference_cache as inference_cache
+from utils.inference_cache import InferenceResultCache, frame_digest
+
+
+def _clock(monkeypatch, start=1000.0):
+    now = [start]
+    monkeypatch.setattr(inference_cache, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = _clock(monkeypatch)
+    cache = InferenceResultCache(max_entries=4, ttl_seconds=10)
+    cache.put("a", {"numero": "12"})
+    now[0] += 9.9
+    assert cache.get("a") == {"numero": "12"}
+    now[0] += 0.2
+    assert cache.get("a") is None
+    stats = cache.get_stats()
+    assert stats['hits'] == 1 and stats['misses'] == 1 and stats['expirations'] == 1 and stats['entries'] == 0
+
+
+def test_least_recently_used_entry_is_evicted(monkeypatch):
+    _clock(monkeypatch)
+    cache = InferenceResultCache(max_entries=2, ttl_seconds=60)
+    cache.put("a", {"v": 1})
+    cache.put("b", {"v": 2})
+    assert cache.get("a") == {"v": 1}   # "b" pasa a ser la menos usada
+    cache.put("c", {"v": 3})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"v": 1} and cache.get("c") == {"v": 3}
+    assert cache.get_stats()['evictions'] == 1
+
+
+def test_results_are_copies():
+    cache = InferenceResultCache(max_entries=2, ttl_seconds=60)
+    result = {"numero": "12"}
+    cache.put("a", result)
+    result["numero"] = "99"
+    cache.get("a")["numero"] = "77"
+    assert cache.get("a") == {"numero": "12"}
+
+
+def test_invalidate_drops_entries_and_results_of_the_previous_generation():
+    cache = InferenceResultCache(max_entries=4, ttl_seconds=60)
+    cache.put("a", {"v": 1})
+    generation = cache.generation   # Inferencia lanzada con el modelo anterior
+    cache.invalidate()
+    assert cache.get("a") is None
+    cache.put("b", {"v": 2}, generation=generation)
+    assert cache.get("b") is None
+    cache.put("b", {"v": 3}, generation=cache.generation)
+    assert cache.get("b") == {"v": 3}
+    assert cache.get_stats()['invalidations'] == 1
+
+
+def test_disabled_cache_stores_nothing():
+    cache = InferenceResultCache(max_entries=0)
+    cache.put("a", {"v": 1})
+    assert not cache.enabled and cache.get("a") is None and cache.get_stats()['misses'] == 0
+
+
+def test_frame_digest_depends_on_shape_and_content():
+    frame = np.zeros((4, 6, 3), dtype=np.uint8)
+    assert frame_digest(frame) == frame_digest(frame.copy())
+    assert frame_digest(frame) != frame_digest(frame.reshape(6, 4, 3))
+    changed = frame.copy()
+    changed[0, 0, 0] = 1
+    assert frame_digest(frame) != frame_digest(changed)
+    assert frame_digest(frame[:, ::2]) == frame_digest(np.ascontiguousarray(frame[:, ::2]))
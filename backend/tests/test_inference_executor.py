@@ -0,0 +1,48 @@
+import time
+from concurrent.futures import TimeoutError
+
+import numpy as np
+import pytest
+
+from utils.inference_executor import InferenceExecutor
+
+
+class SlowReplica:
+    """Réplica falsa cuyo primer pase (arranque en frío) tarda `delay` segundos."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = 0
+
+    def detect_objects_batch(self, frames, umbral_agrupacion=50, min_confidence=None, tiling=None):
+        self.calls += 1
+        if self.calls == 1:
+            time.sleep(self.delay)
+        return [{} for _ in frames]
+
+
+def test_thread_warmup_honours_timeout():
+    executor = InferenceExecutor(lambda: SlowReplica(1.0), mode="thread", workers=2)
+    frame = np.zeros((8, 8, 3), dtype=np.uint8)
+    try:
+        start = time.monotonic()
+        with pytest.raises(TimeoutError):
+            executor.warmup([frame], timeout=0.1)
+        assert time.monotonic() - start < 0.5
+    finally:
+        executor.shutdown()
+
+
+def test_thread_warmup_runs_every_replica():
+    replicas = []
+
+    def factory():
+        replicas.append(SlowReplica(0.0))
+        return replicas[-1]
+
+    executor = InferenceExecutor(factory, mode="thread", workers=3)
+    try:
+        executor.warmup([np.zeros((8, 8, 3), dtype=np.uint8)], timeout=5)
+    finally:
+        executor.shutdown()
+    assert len(replicas) == 3 and all(r.calls == 1 for r in replicas)
@@ -0,0 +1,46 @@
+import numpy as np
+
+from utils.inference_workers import pack_detection, unpack_detection
+
+
+def _full_result(numero, ladrillo, dtype=np.float32):
+    return {
+        'numero_detectado': numero,
+        'confianza_numero': 0.9,
+        'bbox_numero': (10, 20, 110, 60),
+        'modelo_ladrillo': ladrillo,
+        'confianza_ladrillo': 0.4999999,
+        'bbox_ladrillo': np.array([1.5, 2.25, 300.75, 400.125], dtype=dtype),
+        'bbox_vagoneta': np.array([0.1, 0.2, 639.9, 479.7], dtype=dtype),
+        'confianza_vagoneta': 0.5,
+    }
+
+
+def _assert_same(original, restored):
+    assert restored.keys() == original.keys()
+    for key, value in original.items():
+        if isinstance(value, np.ndarray):
+            assert restored[key].dtype == value.dtype
+            assert np.array_equal(restored[key], value)
+        else:
+            assert restored[key] == value, key
+
+
+def test_round_trip_keeps_long_numbers_and_exact_confidences():
+    original = _full_result('01001101201301401', 'Ladrillo hueco 12x18x33 estándar (cerámico) ñandú')
+    _assert_same(original, unpack_detection(pack_detection(original)))
+
+
+def test_round_trip_float64_boxes():
+    original = _full_result('123', 'L1', dtype=np.float64)
+    _assert_same(original, unpack_detection(pack_detection(original)))
+
+
+def test_round_trip_partial_and_empty_results():
+    partial = {
+        'numero_detectado': None, 'confianza_numero': None, 'bbox_numero': None,
+        'modelo_ladrillo': None, 'confianza_ladrillo': None, 'bbox_ladrillo': None,
+        'bbox_vagoneta': np.array([1, 2, 3, 4], dtype=np.float32), 'confianza_vagoneta': 0.7,
+    }
+    _assert_same(partial, unpack_detection(pack_detection(partial)))
+    assert unpack_detection(pack_detection({})) == {}
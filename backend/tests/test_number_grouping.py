@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from utils.number_grouping import (agrupar_numero_compuesto, agrupar_numeros_compuestos_lote,
+                                   detectar_numero_compuesto_desde_resultados, mapear_clases_a_numeros)
+
+
+def _referencia(detecciones, umbral_agrupacion=50):
+    """Agrupación original frame a frame (bucle de Python), sin dibujo ni detecciones_raw."""
+    actuales = []
+    for fila in detecciones:
+        x1, y1, x2, y2 = map(int, fila[:4])
+        actuales.append({'bbox': (x1, y1, x2, y2), 'class': int(fila[5]), 'confidence': float(fila[4]),
+                         'x_center': (x1 + x2) // 2, 'y_center': (y1 + y2) // 2})
+    if not actuales:
+        return None, {}
+    actuales.sort(key=lambda d: d['x_center'])
+    grupos, grupo = [], [actuales[0]]
+    for anterior, actual in zip(actuales, actuales[1:]):
+        distancia = actual['bbox'][0] - anterior['bbox'][2]
+        if distancia < umbral_agrupacion and abs(actual['y_center'] - anterior['y_center']) < 30:
+            grupo.append(actual)
+        else:
+            grupos.append(grupo)
+            grupo = [actual]
+    grupos.append(grupo)
+
+    mejor_grupo, mejor_confianza = None, 0
+    for grupo in grupos:
+        score = sum(d['confidence'] for d in grupo) / len(grupo) * (1 + len(grupo) * 0.1)
+        if score > mejor_confianza:
+            mejor_confianza, mejor_grupo = score, grupo
+    if not mejor_grupo:
+        return None, {}
+    numero = "".join(mapear_clases_a_numeros(d['class']) for d in sorted(mejor_grupo, key=lambda d: d['bbox'][0]))
+    return numero, {
+        'numero': numero,
+        'confidence': min(mejor_confianza / len(mejor_grupo), 1.0),
+        'bbox': (min(d['bbox'][0] for d in mejor_grupo), min(d['bbox'][1] for d in mejor_grupo),
+                 max(d['bbox'][2] for d in mejor_grupo), max(d['bbox'][3] for d in mejor_grupo)),
+        'detecciones_individuales': len(mejor_grupo),
+        'grupos_totales': len(grupos),
+    }
+
+
+def _frame_aleatorio(rng):
+    """Array N×6 float32 como boxes.data de YOLO, con cajas pegadas, lejanas y en otra línea."""
+    n = int(rng.integers(0, 9))
+    x1 = rng.uniform(0, 400, n)
+    y1 = rng.uniform(0, 80, n)
+    filas = np.column_stack([x1, y1, x1 + rng.uniform(5, 40, n), y1 + rng.uniform(10, 40, n),
+                             rng.uniform(0.0, 1.0, n), rng.integers(0, 33, n)])
+    return filas.astype(np.float32)
+
+
+def _comparar(obtenido, esperado):
+    numero, info = obtenido
+    numero_ref, info_ref = esperado
+    assert numero == numero_ref
+    assert {k: v for k, v in info.items() if k != 'confidence'} == {k: v for k, v in info_ref.items() if k != 'confidence'}
+    if info_ref:
+        assert info['confidence'] == pytest.approx(info_ref['confidence'], rel=1e-12)
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("umbral", [10, 50])
+def test_batch_grouping_matches_per_frame_reference(seed, umbral):
+    rng = np.random.default_rng(seed)
+    frames = [_frame_aleatorio(rng) for _ in range(200)]
+    frames[3] = None  # Frames sin resultado de YOLO
+    lote = agrupar_numeros_compuestos_lote(frames, umbral)
+    assert len(lote) == len(frames)
+    for frame, resultado in zip(frames, lote):
+        _comparar(resultado, _referencia(frame if frame is not None else np.empty((0, 6)), umbral))
+    assert lote == [agrupar_numero_compuesto(f, umbral) for f in frames]
+
+
+class _Tensor:
+    def __init__(self, data):
+        self.data = data
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.data
+
+
+class _Resultado:
+    def __init__(self, data):
+        self.boxes = type("Boxes", (), {"data": _Tensor(data)})()
+
+
+def test_compat_api_keeps_per_box_details():
+    rng = np.random.default_rng(7)
+    for _ in range(50):
+        data = _frame_aleatorio(rng)
+        _, numero, info = detectar_numero_compuesto_desde_resultados([_Resultado(data)])
+        esperado = _referencia(data)
+        _comparar((numero, {k: v for k, v in info.items() if k != 'detecciones_raw'}), esperado)
+        if esperado[0]:
+            assert [d['x_center'] for d in info['detecciones_raw']] == sorted(d['x_center'] for d in info['detecciones_raw'])
+            assert len(info['detecciones_raw']) == len(data)
@@ -0,0 +1,34 @@
+import cv2
+import numpy as np
+
+from utils.preprocessing import PAD_VALUE, PreprocessPipeline, letterbox_geometry
+
+
+def _reference(image, imgsz, auto):
+    (h, w), canvas_shape, left, top = letterbox_geometry(image.shape[:2], imgsz, auto)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    resized = cv2.resize(gray, (w, h)) if (h, w) != image.shape[:2] else gray
+    enhanced = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(resized)
+    canvas = np.full(canvas_shape, PAD_VALUE, dtype=np.uint8)
+    canvas[top:top + h, left:left + w] = enhanced
+    return canvas
+
+
+def test_letterbox_matches_reference_across_shapes():
+    pipeline = PreprocessPipeline()
+    rng = np.random.default_rng(0)
+    for _ in range(40):
+        shape = (int(rng.integers(50, 900)), int(rng.integers(50, 1200)), 3)
+        image = rng.integers(0, 255, shape, dtype=np.uint8)
+        for auto in (True, False):
+            canvas, _ = pipeline.letterbox_gray(image, (640, 640), auto)
+            assert np.array_equal(canvas, _reference(image, (640, 640), auto))
+
+
+def test_buffer_cache_is_bounded():
+    pipeline = PreprocessPipeline(max_cached=4)
+    rng = np.random.default_rng(1)
+    for i in range(30):
+        image = rng.integers(0, 255, (100 + 7 * i, 300 + 11 * i, 3), dtype=np.uint8)
+        pipeline.prepare_batch([image], (640, 640), auto=True)
+    assert len(pipeline._local.buffers) <= 4
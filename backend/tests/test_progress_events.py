@@ -0,0 +1,62 @@
+from utils.progress_events import ProgressCoalescer
+
+
+def _coalescer(**options):
+    now = [0.0]
+    sent = []
+    coalescer = ProgressCoalescer(sent.append, clock=lambda: now[0], **options)
+    return coalescer, sent, now
+
+
+def _progress(frame, total=1000):
+    return {"type": "progress", "current_frame": frame, "total_frames": total}
+
+
+def _detection(frame, numero, confianza):
+    return {"type": "detection_update", "frame": frame, "numero": numero, "confianza": confianza, "modelo": None}
+
+
+def test_progress_is_throttled_in_time_and_last_one_is_flushed_before_other_events():
+    coalescer, sent, now = _coalescer(mode="time", interval_seconds=0.5, digest_seconds=10)
+    for frame in range(1, 11):
+        coalescer.push(_progress(frame))
+        now[0] += 0.1
+    # Se publican el primero y uno cada 0.5 s; el resto queda pendiente o descartado
+    assert [e["current_frame"] for e in sent] == [1, 6]
+    coalescer.push({"type": "passage_closed", "numero": "12"})
+    assert [e.get("current_frame") for e in sent[2:]] == [10, None]
+    assert sent[-1]["type"] == "passage_closed"
+    assert coalescer.stats['progress_dropped'] == 7   # Frames 2-5 y 7-9
+
+
+def test_percent_mode_emits_one_progress_per_step():
+    coalescer, sent, _ = _coalescer(mode="percent", percent_step=10, digest_seconds=10)
+    for frame in range(0, 1001, 10):
+        coalescer.push(_progress(frame))
+    coalescer.flush()
+    assert [e["current_frame"] for e in sent] == list(range(0, 1001, 100))
+
+
+def test_detections_are_grouped_into_a_digest_per_number():
+    coalescer, sent, now = _coalescer(interval_seconds=0.5, digest_seconds=1.0)
+    coalescer.push(_detection(5, "12", 0.6))
+    now[0] += 0.4
+    coalescer.push(_detection(10, "12", 0.9))
+    coalescer.push(_detection(15, "34", 0.5))
+    assert sent == []
+    now[0] += 0.6
+    coalescer.push(_detection(20, "12", 0.7))   # Vence el intervalo del digest
+    assert len(sent) == 1
+    digest = sent[0]
+    assert digest["type"] == "detection_digest" and digest["total"] == 4
+    assert (digest["frame_inicio"], digest["frame_fin"]) == (5, 20)
+    assert digest["detections"][0] == {"numero": "12", "lecturas": 3, "confianza": 0.9, "frame": 10, "modelo": None}
+    assert digest["detections"][1]["numero"] == "34"
+    assert coalescer.stats['detections_digested'] == 4
+
+
+def test_other_events_flush_pending_digest_first_to_keep_order():
+    coalescer, sent, _ = _coalescer(digest_seconds=10)
+    coalescer.push(_detection(5, "12", 0.6))
+    coalescer.push({"type": "final_result", "data": None})
+    assert [e["type"] for e in sent] == ["detection_digest", "final_result"]
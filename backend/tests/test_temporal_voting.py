@@ -0,0 +1,51 @@
+from utils.temporal_voting import TemporalVoter
+
+
+def _voter(**options):
+    return TemporalVoter("cam", **{'window_seconds': 10, 'min_votes': 3, 'min_share': 0.6,
+                                   'min_confidence': 0.3, **options})
+
+
+def test_number_becomes_stable_once_with_best_evidence():
+    voter = _voter()
+    assert voter.add("12", 0.7, timestamp=0.0, evidence="f0") is None
+    assert voter.add("12", 0.9, timestamp=1.0, evidence="f1", modelo_ladrillo="6H") is None
+    event = voter.add("12", 0.8, timestamp=2.0, evidence="f2")
+    assert event is not None and event.numero == "12" and event.votos == 3
+    assert event.confianza == 0.9 and event.evidence == "f1" and event.modelo_ladrillo == "6H"
+    assert voter.add("12", 0.8, timestamp=3.0) is None   # Ya emitido mientras siga en la ventana
+
+
+def test_votes_expire_and_the_number_can_be_emitted_again():
+    voter = _voter()
+    for t in (0.0, 1.0, 2.0):
+        event = voter.add("12", 0.8, timestamp=t)
+    assert event is not None
+    # Frame sin número a los 12.5 s: solo avanza el reloj y caducan todos los votos
+    assert voter.add(None, None, timestamp=12.5) is None
+    status = voter.get_status()
+    assert status['window_votes'] == 0 and status['emitted'] == [] and status['leader'] is None
+    for t in (13.0, 14.0):
+        assert voter.add("12", 0.8, timestamp=t) is None
+    event = voter.add("12", 0.8, timestamp=15.0)
+    assert event is not None and event.votos == 3
+
+
+def test_expired_votes_stop_counting_towards_the_share():
+    voter = _voter()
+    for t in (0.0, 1.0):
+        voter.add("34", 0.9, timestamp=t)
+    # Con "34" aún en la ventana, "12" no llega al 60% del peso
+    assert voter.add("12", 0.8, timestamp=5.0) is None
+    assert voter.add("12", 0.8, timestamp=6.0) is None
+    assert voter.add("12", 0.8, timestamp=7.0) is None
+    # A los 11.5 s caducaron los votos de "34": "12" pasa a tener todo el peso
+    event = voter.add("12", 0.8, timestamp=11.5)
+    assert event is not None and event.numero == "12" and event.share == 1.0 and event.votos == 4
+
+
+def test_low_confidence_reads_do_not_vote():
+    voter = _voter(min_votes=1)
+    assert voter.add("12", 0.1, timestamp=0.0) is None
+    assert voter.get_status()['ignored'] == 1 and voter.get_status()['window_votes'] == 0
+    assert voter.add("12", 0.5, timestamp=0.5) is not None
@@ -0,0 +1,65 @@
+import numpy as np
+
+from utils.passages import PassageAggregator
+from utils.tracking import BoxTracker
+
+FPS = 30
+STEP = 5   # Paso fino del muestreo de videos
+
+
+def _escena(seed=0):
+    """Fondo fijo y una placa con textura que cruza el encuadre a 0.2 px por frame."""
+    rng = np.random.default_rng(seed)
+    fondo = rng.integers(0, 256, (240, 320, 3), dtype=np.uint8)
+    placa = rng.integers(0, 256, (24, 40, 3), dtype=np.uint8)
+
+    def frame(n):
+        img = fondo.copy()
+        x = 20 + int(n * 0.2)
+        img[100:124, x:x + 40] = placa
+        return img, (x, 100, x + 40, 124)
+
+    return frame
+
+
+def _recorrer(tracker, passages, frames):
+    """Bucle de procesar_video_mp4_streamable: modelo solo cuando el seguimiento lo pide."""
+    escena = _escena()
+    detecciones, cerradas = [], []
+    for n in frames:
+        frame, caja = escena(n)
+        if not tracker.should_detect():
+            tracker.propagate(frame)
+            reading = tracker.reading()
+            if reading is not None:
+                cerradas += passages.extend(n, reading['numero_detectado'])
+            continue
+        resultado = {'numero_detectado': '12', 'confianza_numero': 0.8, 'bbox_numero': caja}
+        detecciones.append(n)
+        tracker.update(frame, resultado)
+        cerradas += passages.add(n, '12', 0.8, frame, None)
+    return detecciones, cerradas + passages.close_all()
+
+
+def test_tracked_wagon_stays_in_one_passage_across_sparse_detections():
+    tracker = BoxTracker(detect_interval=1, max_skip=50)
+    passages = PassageAggregator(FPS, max_gap_seconds=2.0, min_reads=2)
+
+    detecciones, cerradas = _recorrer(tracker, passages, range(STEP, 30 * FPS + 1, STEP))
+
+    # El seguimiento espacia las detecciones completas más que el hueco máximo de una pasada
+    assert max(np.diff(detecciones)) > passages.max_gap_frames
+    assert tracker.stats['propagations'] > tracker.stats['detections']
+    assert len(cerradas) == 1
+    pasada = cerradas[0].summary()
+    assert pasada['numero'] == '12' and pasada['frame_inicio'] == STEP and pasada['frame_fin'] == 30 * FPS
+    assert pasada['lecturas'] == len(detecciones) and pasada['pasos_seguidos'] == tracker.stats['propagations']
+
+
+def test_tracked_steps_do_not_open_passages_or_count_as_reads():
+    passages = PassageAggregator(FPS, max_gap_seconds=2.0, min_reads=2)
+    assert passages.extend(10, '12') == []
+    passages.add(15, '12', 0.9, None)
+    passages.extend(200, '12')
+    # Una sola lectura del modelo: la pasada sigue siendo ruido aunque el seguimiento la extendiera
+    assert passages.close_all() == [] and passages.stats['discarded'] == 1
@@ -0,0 +1,167 @@
+import asyncio
+import copy
+from datetime import datetime, timezone
+
+import crud
+import utils.video_jobs as video_jobs
+
+
+class FakeJobs:
+    """Colección video_jobs en memoria con la misma semántica que las funciones de crud."""
+
+    def __init__(self):
+        self.store = {}
+        self.heartbeat_errors = 0
+
+    def create(self, job):
+        self.store[job["_id"]] = copy.deepcopy(job)
+        return job["_id"]
+
+    def get(self, job_id):
+        return copy.deepcopy(self.store.get(job_id))
+
+    def claim(self, worker_id):
+        pending = [j for j in self.store.values() if j["status"] == "pending"]
+        if not pending:
+            return None
+        job = sorted(pending, key=lambda j: (-j["priority"], j["created_at"]))[0]
+        job.update(status="running", worker_id=worker_id, heartbeat_at=datetime.now(timezone.utc))
+        job["attempts"] += 1
+        return copy.deepcopy(job)
+
+    def update(self, job_id, fields, worker_id=None):
+        if self.heartbeat_errors and list(fields) == ["heartbeat_at"]:
+            self.heartbeat_errors -= 1
+            raise ConnectionError("Mongo no disponible")
+        job = self.store.get(job_id)
+        if not job or (worker_id and job.get("worker_id") != worker_id):
+            return False
+        job.update(copy.deepcopy(fields))
+        return True
+
+
+def _install(monkeypatch, fake):
+    monkeypatch.setattr(crud, "create_video_job", fake.create)
+    monkeypatch.setattr(crud, "get_video_job", fake.get)
+    monkeypatch.setattr(crud, "claim_next_video_job", fake.claim)
+    monkeypatch.setattr(crud, "update_video_job", fake.update)
+    monkeypatch.setattr(crud, "ensure_video_job_indexes", lambda: None)
+    monkeypatch.setattr(crud, "requeue_stale_video_jobs", lambda *a: ([], []))
+    monkeypatch.setattr(video_jobs, "VIDEO_JOB_HEARTBEAT_SECONDS", 0.01)
+    monkeypatch.setattr(video_jobs, "VIDEO_JOB_POLL_SECONDS", 0.01)
+
+
+def test_heartbeat_survives_transient_errors(monkeypatch):
+    fake = FakeJobs()
+    fake.heartbeat_errors = 3
+    _install(monkeypatch, fake)
+
+    async def handler(job, ctx):
+        await asyncio.sleep(0.1)
+        return {"message": "ok"}
+
+    async def scenario():
+        queue = video_jobs.VideoJobQueue(handler, workers=1)
+        job_id = await queue.enqueue({})
+        await queue.start()
+        events = [event async for event in queue.events(job_id)]
+        await queue.stop()
+        return job_id, events
+
+    job_id, events = asyncio.run(scenario())
+    assert fake.heartbeat_errors == 0
+    assert fake.store[job_id]["status"] == "completed"
+    assert events[-1]["type"] == "stream_end" and not events[-1]["error_occurred"]
+
+
+def test_worker_stops_when_job_is_reassigned(monkeypatch):
+    fake = FakeJobs()
+    _install(monkeypatch, fake)
+    progress = []
+
+    async def handler(job, ctx):
+        for i in range(100):
+            if i == 3:
+                # El barrido lo reencoló y otro worker lo tomó
+                fake.store[job["_id"]]["worker_id"] = "otro-worker"
+            progress.append(i)
+            await asyncio.sleep(0.01)
+        return {"message": "no debería terminar"}
+
+    async def scenario():
+        queue = video_jobs.VideoJobQueue(handler, workers=1)
+        job_id = await queue.enqueue({})
+        await queue.start()
+        await asyncio.sleep(0.3)
+        await queue.stop()
+        return job_id
+
+    job_id = asyncio.run(scenario())
+    assert len(progress) < 10  # El latido lo detectó y canceló el manejador enseguida
+    assert fake.store[job_id]["status"] == "running" and fake.store[job_id]["worker_id"] == "otro-worker"
+    assert "final_events" not in fake.store[job_id]
+
+
+def test_stale_failed_job_ends_subscriber_streams(monkeypatch):
+    fake = FakeJobs()
+    _install(monkeypatch, fake)
+
+    async def scenario():
+        queue = video_jobs.VideoJobQueue(lambda job, ctx: None, workers=1)
+        job_id = await queue.enqueue({})
+        fake.store[job_id]["status"] = "running"
+
+        def requeue(stale_before, max_attempts, failed_events=None):
+            fake.store[job_id].update(status="failed", worker_id=None,
+                                      final_events=[{**e, "processing_id": job_id} for e in failed_events])
+            return [], [job_id]
+
+        monkeypatch.setattr(crud, "requeue_stale_video_jobs", requeue)
+        received = []
+
+        async def subscriber():
+            async for event in queue.events(job_id):
+                received.append(event)
+
+        task = asyncio.create_task(subscriber())
+        await asyncio.sleep(0.05)
+        await queue._recover()
+        await asyncio.wait_for(task, timeout=1)
+        return job_id, received
+
+    job_id, received = asyncio.run(scenario())
+    assert received[-1] == {"type": "stream_end", "error_occurred": True, "processing_id": job_id,
+                            "message": video_jobs.STALE_FAILED_MESSAGE}
+
+
+def test_subscriber_follows_job_running_on_another_instance(monkeypatch):
+    fake = FakeJobs()
+    _install(monkeypatch, fake)
+    monkeypatch.setattr(video_jobs, "VIDEO_JOB_SUBSCRIBER_POLL_SECONDS", 0.02)
+
+    async def scenario():
+        # Esta instancia no arranca workers: el trabajo lo procesa otra
+        queue = video_jobs.VideoJobQueue(lambda job, ctx: None, workers=1)
+        job_id = await queue.enqueue({})
+        fake.store[job_id].update(status="running", worker_id="otra-instancia")
+        received = []
+
+        async def subscriber():
+            async for event in queue.events(job_id):
+                received.append(event)
+
+        task = asyncio.create_task(subscriber())
+        await asyncio.sleep(0.05)
+        fake.store[job_id]["checkpoint"] = {"frame": 300, "total_frames": 900, "records": [{"numero": "12"}]}
+        await asyncio.sleep(0.1)
+        fake.store[job_id].update(status="completed", final_events=[
+            {"type": "processing_complete", "processing_id": job_id},
+            {"type": "stream_end", "error_occurred": False, "processing_id": job_id}])
+        await asyncio.wait_for(task, timeout=1)
+        return received
+
+    received = asyncio.run(scenario())
+    progress = [e for e in received if e["type"] == "progress"]
+    assert len(progress) == 1  # Un evento por punto de control nuevo, no por consulta
+    assert progress[0]["current_frame"] == 300 and progress[0]["total_frames"] == 900
+    assert [e["type"] for e in received[-2:]] == ["processing_complete", "stream_end"]
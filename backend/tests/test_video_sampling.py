@@ -0,0 +1,73 @@
+import numpy as np
+
+from utils.video_sampling import FrameSampler, MotionGate
+
+
+class FakeCapture:
+    """VideoCapture mínimo: el frame n (base 1) tiene todos sus píxeles en n % 256."""
+
+    def __init__(self, total):
+        self.total = total
+        self.position = 0
+
+    def set(self, prop, value):
+        self.position = int(value)
+
+    def grab(self):
+        if self.position >= self.total:
+            return False
+        self.position += 1
+        return True
+
+    def retrieve(self):
+        return True, np.full((4, 4, 3), self.position % 256, dtype=np.uint8)
+
+
+def _run(sampler, gate, hits, total=200):
+    """Recorre el video como los bucles de main.py / video_segments.py."""
+    cap = FakeCapture(total)
+    inferred, accepted = [], []
+    while True:
+        frame, frame_number, finished = sampler.read(cap)
+        if finished:
+            break
+        result = sampler.cached_result(frame_number)
+        gate.has_motion(frame, frame_number)
+        if result is None:
+            inferred.append(frame_number)
+            result = {'numero_detectado': '12' if frame_number in hits else None}
+        if sampler.report(frame_number, bool(result['numero_detectado']), result):
+            continue
+        accepted.append((frame_number, result))
+    return inferred, accepted
+
+
+def test_rewound_hit_reuses_its_result_and_motion_gate_sees_frames_in_order():
+    fed = []
+    gate = MotionGate(warmup=0)
+    gate.detector.detect_motion = lambda frame: (fed.append(int(frame[0, 0, 0])) or False, None)
+    sampler = FrameSampler(30, coarse_ms=500, dense_ms=1500, fine_every=5)
+
+    inferred, accepted = _run(sampler, gate, hits=set(range(40, 61)))
+
+    # La muestra gruesa 45 provoca el retroceso; el paso fino vuelve a ella sin repetir la inferencia
+    assert sampler.stats['rewinds'] == 1 and sampler.stats['reused'] == 1
+    assert inferred.count(45) == 1
+    accepted_frames = [n for n, _ in accepted]
+    assert accepted_frames == sorted(set(accepted_frames))
+    assert 45 in accepted_frames and {40, 50, 55, 60} <= set(accepted_frames)
+    assert dict(accepted)[45]['numero_detectado'] == '12'
+    # El modelo de fondo nunca recibe un frame anterior a otro ya visto
+    assert fed == sorted(set(fed)) and gate.stats['revisited'] > 0
+
+
+def test_replay_targets_hit_frame_off_the_fine_grid():
+    gate = MotionGate(warmup=0)
+    gate.detector.detect_motion = lambda frame: (False, None)
+    # Paso grueso de 7 frames: el acierto (frame 14) no cae en múltiplos del paso fino
+    sampler = FrameSampler(14, coarse_ms=500, dense_ms=1000, fine_every=5)
+
+    inferred, accepted = _run(sampler, gate, hits={14})
+
+    assert inferred.count(14) == 1 and sampler.stats['reused'] == 1
+    assert [n for n, _ in accepted if n in (10, 14, 15)] == [10, 14, 15]
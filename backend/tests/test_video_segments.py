@@ -0,0 +1,31 @@
+import cv2
+import numpy as np
+import pytest
+
+from utils.video_segments import FrameReader
+
+
+@pytest.fixture
+def video_path(tmp_path):
+    """Video MJPG de 60 frames: el frame de índice i (base 0) tiene todos sus píxeles en 4 * i."""
+    path = tmp_path / "v.avi"
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 30, (64, 48))
+    if not writer.isOpened():
+        pytest.skip("OpenCV sin codificador MJPG")
+    for i in range(60):
+        writer.write(np.full((48, 64, 3), 4 * i, dtype=np.uint8))
+    writer.release()
+    return str(path)
+
+
+def test_frame_reader_returns_the_numbered_frame_in_any_order(video_path):
+    reader = FrameReader(video_path)
+    try:
+        # Números base 1, como los de FrameSampler y Passage.frame_mejor
+        for frame_number in (10, 11, 5, 50, 51, 1):
+            frame = reader.read(frame_number)
+            assert frame is not None
+            assert abs(float(frame.mean()) - 4 * (frame_number - 1)) < 2
+        assert reader.read(500) is None
+    finally:
+        reader.release()
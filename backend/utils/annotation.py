@@ -0,0 +1,132 @@
+"""
+Imágenes anotadas bajo demanda.
+
+La detección solo devuelve geometría (cajas y confianzas); nadie dibuja sobre los frames en el
+camino caliente. Cada registro guarda sus cajas en `metadata.geometria` y la imagen anotada se
+genera cuando se pide (GET /vagonetas/{id}/annotated), dibujando sobre la imagen almacenada.
+El resultado se guarda en disco (uploads/annotated/) con una clave que incluye la geometría y
+la fecha de modificación de la imagen, así que un registro corregido o una imagen reemplazada
+generan una nueva versión; los archivos más antiguos se borran al superar el límite.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import cv2
+import numpy as np
+
+ANNOTATED_CACHE_DIR = Path(os.getenv("ANNOTATED_CACHE_DIR", "uploads/annotated"))
+ANNOTATED_CACHE_MAX_FILES = int(os.getenv("ANNOTATED_CACHE_MAX_FILES", 2000))
+
+_GEOMETRY_KEYS = ('bbox_numero', 'bbox_ladrillo', 'bbox_vagoneta')
+
+# Colores BGR: número en azul (como detectar_numero_compuesto_desde_resultados), vagoneta en verde
+_COLOR_NUMERO = (255, 0, 0)
+_COLOR_VAGONETA = (0, 200, 0)
+_COLOR_LADRILLO = (0, 140, 255)
+
+
+def detection_geometry(detection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Cajas del diccionario unificado de detección en forma serializable (para metadata.geometria)."""
+    geometry = {}
+    for key in _GEOMETRY_KEYS:
+        bbox = (detection or {}).get(key)
+        if bbox is not None:
+            geometry[key] = [int(round(float(v))) for v in list(bbox)[:4]]
+    return geometry
+
+
+def draw_number(frame: np.ndarray, numero: str, confianza: Optional[float], bbox) -> np.ndarray:
+    """Dibuja la caja del número compuesto, el número y su confianza sobre `frame` (in situ)."""
+    x1, y1, x2, y2 = [int(v) for v in bbox[:4]]
+    cv2.rectangle(frame, (x1, y1), (x2, y2), _COLOR_NUMERO, 3)
+    cv2.putText(frame, str(numero), (x1, max(0, y1 - 10)), cv2.FONT_HERSHEY_SIMPLEX, 1, _COLOR_NUMERO, 2)
+    if confianza is not None:
+        cv2.putText(frame, f"Conf: {confianza:.2f}", (x1, y2 + 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+    return frame
+
+
+def draw_detection(frame: np.ndarray, geometry: Dict[str, Any], numero: Optional[str] = None,
+                   confianza: Optional[float] = None, modelo_ladrillo: Optional[str] = None) -> np.ndarray:
+    """Dibuja vagoneta, ladrillo y número de un registro sobre `frame` (in situ)."""
+    if geometry.get('bbox_vagoneta'):
+        x1, y1, x2, y2 = geometry['bbox_vagoneta']
+        cv2.rectangle(frame, (x1, y1), (x2, y2), _COLOR_VAGONETA, 2)
+    if geometry.get('bbox_ladrillo'):
+        x1, y1, x2, y2 = geometry['bbox_ladrillo']
+        cv2.rectangle(frame, (x1, y1), (x2, y2), _COLOR_LADRILLO, 2)
+        if modelo_ladrillo:
+            cv2.putText(frame, str(modelo_ladrillo), (x1, max(0, y1 - 8)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, _COLOR_LADRILLO, 2)
+    if geometry.get('bbox_numero') and numero:
+        draw_number(frame, numero, confianza, geometry['bbox_numero'])
+    return frame
+
+
+class AnnotatedImageCache:
+    """Renderiza y guarda en disco las imágenes anotadas de los registros."""
+
+    def __init__(self, cache_dir: Path = ANNOTATED_CACHE_DIR, max_files: int = ANNOTATED_CACHE_MAX_FILES):
+        self.cache_dir = Path(cache_dir)
+        self.max_files = max(1, max_files)
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'renders': 0, 'evictions': 0}
+
+    def _cache_path(self, record_id: str, image_path: Path, geometry: Dict[str, Any],
+                    numero: Optional[str], confianza: Optional[float], modelo_ladrillo: Optional[str]) -> Path:
+        key = json.dumps([str(image_path), os.path.getmtime(image_path), geometry, numero, confianza, modelo_ladrillo],
+                         sort_keys=True, default=str)
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
+        return self.cache_dir / f"{record_id}_{digest}.jpg"
+
+    def render(self, record_id: str, image_path: Path, geometry: Dict[str, Any], numero: Optional[str] = None,
+               confianza: Optional[float] = None, modelo_ladrillo: Optional[str] = None) -> Path:
+        """Ruta de la imagen anotada (la genera si no está en disco). FileNotFoundError si falta la imagen."""
+        image_path = Path(image_path)
+        if not image_path.exists():
+            raise FileNotFoundError(f"No existe la imagen del registro: {image_path}")
+        target = self._cache_path(record_id, image_path, geometry, numero, confianza, modelo_ladrillo)
+        if target.exists():
+            self.stats['hits'] += 1
+            return target
+
+        image = cv2.imread(str(image_path))
+        if image is None:
+            raise FileNotFoundError(f"No se pudo leer la imagen del registro: {image_path}")
+        draw_detection(image, geometry, numero, confianza, modelo_ladrillo)
+
+        ok, encoded = cv2.imencode(".jpg", image)
+        if not ok:
+            raise ValueError(f"No se pudo codificar la imagen anotada de {record_id}")
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(target.name + ".tmp")
+        tmp_path.write_bytes(encoded.tobytes())
+        os.replace(tmp_path, target)  # Dos peticiones simultáneas no ven nunca un JPEG a medias
+        self.stats['renders'] += 1
+        self._evict()
+        return target
+
+    def _evict(self):
+        with self._lock:
+            files = sorted(self.cache_dir.glob("*.jpg"), key=lambda p: p.stat().st_mtime)
+            for path in files[:max(0, len(files) - self.max_files)]:
+                try:
+                    path.unlink()
+                    self.stats['evictions'] += 1
+                except OSError:
+                    pass
+
+
+# Caché compartida por el proceso
+_annotated_cache: Optional[AnnotatedImageCache] = None
+_annotated_cache_lock = threading.Lock()
+
+def get_annotated_cache() -> AnnotatedImageCache:
+    global _annotated_cache
+    with _annotated_cache_lock:
+        if _annotated_cache is None:
+            _annotated_cache = AnnotatedImageCache()
+        return _annotated_cache
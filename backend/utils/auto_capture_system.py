@@ -10,7 +10,12 @@ import asyncio
 import time
 from datetime import datetime, timezone # MODIFIED: Added timezone
 from typing import Dict, List, Optional, Tuple, Any 
-from utils.image_processing import run_detection_on_frame # Updated import
+from utils.image_processing import run_detection_on_frames_async # Updated import
+from utils.plate_prior import get_plate_prior_store, run_detection_with_prior_async
+from utils.tiling import parse_tiling_config
+from utils.temporal_voting import TemporalVoter
+from utils.annotation import detection_geometry
+from utils.image_writer import get_image_writer
 from crud import create_vagoneta_record
 import os
 import json # MODIFIED: Ensured json is imported
@@ -135,7 +140,18 @@ class SmartCameraCapture:
         self.detection_cooldown = config.get('detection_cooldown', 5)
         self.last_detection_time = 0
         self.pre_capture_buffer = []
+        self.pre_capture_indices = []  # Índice en el video de cada frame del buffer (claves de la caché de inferencia)
         self.max_buffer_size = config.get('max_buffer_size', 10) # Made configurable
+        # Backend de inferencia de esta cámara (p. ej. "onnx-int8"); None = INFERENCE_BACKEND
+        self.inference_backend = config.get('inference_backend')
+        # Región aprendida del número (utils/plate_prior.py); se desactiva con "use_plate_prior": false
+        self.use_plate_prior = config.get('use_plate_prior', True)
+        self.plate_prior = get_plate_prior_store().get(self.camera_id) if self.use_plate_prior else None
+        # Inferencia por teselas para cámaras de alta resolución (p. ej. 4K), ver utils/tiling.py
+        self.tiling = parse_tiling_config(config.get('tiling'))
+        # Votación temporal: solo se guarda un registro cuando el número se estabiliza
+        self.voter = TemporalVoter.from_config(self.camera_id, config.get('voting'))
+        self._last_voted_index = -1  # Los frames del buffer se reanalizan: cada uno vota una sola vez
 
         self.ws_manager = ws_manager
         self.upload_dir = upload_dir 
@@ -144,6 +160,7 @@ class SmartCameraCapture:
         self.cap = None
         self.video_frame_count = 0
         self.total_frames = 0
+        self._video_cache_id = None  # (ruta, mtime) del video: identifica sus frames entre vueltas del bucle
         self.stats = {
             'frames_processed': 0,
             'motion_detected': 0,
@@ -182,6 +199,7 @@ class SmartCameraCapture:
                         self.stats['video_loops'] += 1
                         self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
                         self.video_frame_count = 0
+                        self._last_voted_index = -1
                         continue
                     else:
                         print(f"❌ Error leyendo frame de {self.camera_id} o fin del video (no loop). Deteniendo cámara.")
@@ -216,6 +234,7 @@ class SmartCameraCapture:
                 self.is_running = False # Stop if video file not found
                 return # Critical error, cannot proceed
             self.cap = cv2.VideoCapture(self.camera_url)
+            self._video_cache_id = (os.path.abspath(self.camera_url), os.path.getmtime(self.camera_url))
             self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
             fps = self.cap.get(cv2.CAP_PROP_FPS)
             print(f"📊 Video cargado para {self.camera_id}: {self.total_frames} frames, {fps:.1f} FPS")
@@ -253,8 +272,10 @@ class SmartCameraCapture:
         has_motion, _ = self.motion_detector.detect_motion(roi_frame) # motion_mask not used
         
         self.pre_capture_buffer.append(frame.copy()) # Use the original frame for buffer
+        self.pre_capture_indices.append(self.video_frame_count)
         if len(self.pre_capture_buffer) > self.max_buffer_size:
             self.pre_capture_buffer.pop(0)
+            self.pre_capture_indices.pop(0)
         
         if has_motion:
             self.stats['motion_detected'] += 1
@@ -269,31 +290,48 @@ class SmartCameraCapture:
         
         print(f"🔍 Movimiento detectado en {self.camera_id}, analizando...")
         
-        best_detection_result = None
-        best_frame_for_detection = None
           # Analyze frames from buffer + current_frame
         # Ensure buffer frames are used if available, otherwise just current_frame
         if self.pre_capture_buffer:
             frames_to_analyze = self.pre_capture_buffer + [current_frame]
+            frame_indices = self.pre_capture_indices + [self.video_frame_count]
         else:
             frames_to_analyze = [current_frame]
+            frame_indices = [self.video_frame_count]
+        # En videos en bucle cada frame se identifica por (video, índice): no hace falta hashearlo
+        cache_keys = [self._video_cache_id + (i,) for i in frame_indices] if self._video_cache_id else None
         
-        for f_idx, test_frame in enumerate(frames_to_analyze):
-            # run_detection_on_frame expects a numpy array (frame)
-            # and returns a dict with detection results
-            detection_data = run_detection_on_frame(test_frame)
-            
+        # Todo el buffer se encola de una vez para que el modelo lo procese en lote
+        if self.plate_prior is not None:
+            detections_batch = await run_detection_with_prior_async(
+                frames_to_analyze, self.plate_prior, get_plate_prior_store(),
+                backend=self.inference_backend, cache_keys=cache_keys, tiling=self.tiling)
+        else:
+            detections_batch = await run_detection_on_frames_async(
+                frames_to_analyze, backend=self.inference_backend, cache_keys=cache_keys, tiling=self.tiling)
+        
+        any_number = False
+        stable_event = None
+        for test_frame, frame_index, detection_data in zip(frames_to_analyze, frame_indices, detections_batch):
             if detection_data and detection_data.get('numero_detectado'):
-                current_confidence = float(detection_data.get('confianza_numero', 0.0))
-                if not best_detection_result or current_confidence > float(best_detection_result.get('confianza_numero', 0.0)):
-                    best_detection_result = detection_data
-                    best_frame_for_detection = test_frame # Store the frame that yielded best detection
+                any_number = True
+            if frame_index <= self._last_voted_index:
+                continue  # Ya votó en un análisis anterior (o está repetido: el actual también va en el buffer)
+            self._last_voted_index = frame_index
+            event = self.voter.add(detection_data.get('numero_detectado'), detection_data.get('confianza_numero'),
+                                   timestamp=current_time, evidence=(detection_data, test_frame),
+                                   modelo_ladrillo=detection_data.get('modelo_ladrillo'))
+            stable_event = event or stable_event
         
-        if best_detection_result and best_frame_for_detection is not None:
+        if stable_event is not None:
+            # Se guarda la mejor lectura del número estable (no la de cada frame ruidoso)
+            best_detection_result, best_frame_for_detection = stable_event.evidence
             self.last_detection_time = current_time
-            self.stats['vagonetas_detectadas'] += 1
+            self.stats['vagonetas_detected'] += 1
+            print(f"🗳️ Número {stable_event.numero} estable en {self.camera_id} "
+                  f"({stable_event.votos} votos, {stable_event.share:.0%} del peso)")
             await self._save_detection(best_detection_result, best_frame_for_detection)
-        else:
+        elif not any_number:
             self.stats['false_positives'] += 1
             print(f"⚠️ Movimiento sin vagoneta identificable en {self.camera_id}")
 
@@ -305,13 +343,12 @@ class SmartCameraCapture:
             numero_str = str(detection.get('numero_detectado', 'unknown')).replace(' ', '_').replace('/', '_')
             sane_evento = str(self.evento).replace(' ', '_').replace('/', '_')
 
-            image_filename = f"{numero_str}_{sane_evento}_{timestamp_dt.strftime('%Y%m%d_%H%M%S%f')}.jpg"
-
-            save_dir = Path(self.upload_dir)
-            save_dir.mkdir(parents=True, exist_ok=True)
+            image_writer = get_image_writer()
+            image_filename = image_writer.image_name(f"{numero_str}_{sane_evento}_{timestamp_dt.strftime('%Y%m%d_%H%M%S%f')}")
 
-            image_full_save_path = save_dir / image_filename
-            cv2.imwrite(str(image_full_save_path), frame)
+            # El escritor crea el directorio, codifica en sus hilos y renombra al terminar
+            image_full_save_path = Path(self.upload_dir) / image_filename
+            await image_writer.write_async(frame, image_full_save_path)
             image_path_for_db = f"uploads/{image_filename}"
 
             raw_confidence = detection.get('confianza_numero', 0.0)
@@ -333,7 +370,7 @@ class SmartCameraCapture:
                 confianza=confidence_float,
                 origen_deteccion="auto_capture",
                 merma=None, 
-                metadata={"camera_id": self.camera_id}
+                metadata={"camera_id": self.camera_id, "geometria": detection_geometry(detection)}
             )
             
             record_id = create_vagoneta_record(vagoneta_data_create) # This is a sync function
@@ -412,6 +449,7 @@ class AutoCaptureManager:
             await asyncio.gather(*self.tasks, return_exceptions=True)
         
         self.tasks = []
+        get_plate_prior_store().save()  # No perder las observaciones aún no escritas
         print("AutoCaptureManager: Todas las cámaras detenidas y tareas finalizadas.")
 
     def is_running(self) -> bool:
@@ -429,6 +467,9 @@ class AutoCaptureManager:
                 "evento": cam.evento,
                 "stats": cam.stats,
             }
+            if cam.plate_prior is not None:
+                status['plate_prior'] = cam.plate_prior.get_status()
+            status['voting'] = cam.voter.get_status()
             if cam.source_type == 'video':
                 status['video_progress'] = f"{cam.video_frame_count}/{cam.total_frames}" if cam.total_frames > 0 else "N/A"
             camera_statuses.append(status)
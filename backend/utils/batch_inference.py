@@ -0,0 +1,262 @@
+"""
+Servicio de inferencia por micro-lotes (dynamic micro-batching).
+
+Todos los llamadores (subidas, video, cámaras) encolan frames individuales y un hilo
+despachador los agrupa en un único lote para el modelo YOLO. El lote se cierra al llegar
+a `max_batch_size` frames o cuando vence `max_wait_ms` desde el primer frame encolado.
+Cada llamador recibe su propio resultado con la forma de `detect_objects_unified`.
+
+Si se le pasa un `InferenceExecutor`, los lotes se ejecutan en su pool de réplicas y puede
+haber hasta `executor.workers` lotes en vuelo a la vez; mientras todas las réplicas están
+ocupadas los frames siguen acumulándose en la cola y el próximo lote sale más grande.
+"""
+
+import asyncio
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", 8))
+DEFAULT_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", 15))
+
+# (frame, umbral_agrupacion, min_confidence, tiling, future)
+_Request = Tuple[np.ndarray, int, Optional[float], Optional[tuple], Future]
+_STOP = object()
+
+
+class BatchInferenceService:
+    """Agrupa frames de múltiples llamadores y los ejecuta como un solo lote."""
+
+    def __init__(self,
+                 batch_runner: Optional[Callable[..., List[Dict[str, Any]]]] = None,
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+                 executor: Optional[Any] = None):
+        """
+        Args:
+            batch_runner: Función que recibe (frames, umbral_agrupacion, min_confidence, tiling) y devuelve una lista
+                de resultados alineada con los frames (p. ej. ImageProcessor.detect_objects_batch).
+                Se ejecuta en el hilo despachador; se ignora si se pasa `executor`.
+            max_batch_size: Máximo de frames por lote.
+            max_wait_ms: Tiempo máximo que el primer frame de un lote espera a que lleguen otros.
+            executor: InferenceExecutor opcional donde se despachan los lotes.
+        """
+        if batch_runner is None and executor is None:
+            raise ValueError("BatchInferenceService necesita un batch_runner o un executor.")
+        self.batch_runner = batch_runner
+        self.executor = executor
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_s = max(0.0, float(max_wait_ms)) / 1000.0
+        # Un lote en vuelo por réplica disponible
+        self._inflight = threading.Semaphore(executor.workers if executor else 1)
+
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()  # Las estadísticas se actualizan desde varios hilos
+        self.stats = {
+            'requests': 0,
+            'batches': 0,
+            'frames_processed': 0,
+            'largest_batch': 0,
+            'errors': 0,
+            'batch_seconds': 0.0,    # Suma de latencias de los lotes (de envío a resultado)
+            'executor_swaps': 0
+        }
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+    def start(self):
+        """Inicia el hilo despachador si no está corriendo."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._worker_loop, name="batch-inference", daemon=True)
+            self._thread.start()
+            print(f"ℹ️ Servicio de inferencia por lotes iniciado (max_batch_size={self.max_batch_size}, max_wait_ms={self.max_wait_s * 1000:.0f})")
+
+    def stop(self, timeout: float = 5.0):
+        """Procesa lo pendiente y detiene el hilo despachador."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def is_running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+    def submit(self, frame: np.ndarray, umbral_agrupacion: int = 50, min_confidence: Optional[float] = None,
+               tiling: Optional[tuple] = None) -> Future:
+        """
+        Encola un frame y devuelve un Future con su resultado. `min_confidence` (None = el de
+        la réplica) y `tiling` (utils/tiling.py) se aplican por pedido, así un cambio de umbral
+        llega también a los workers y cada cámara puede usar sus propias teselas.
+        """
+        future: Future = Future()
+        if frame is None or frame.size == 0:
+            future.set_result({})
+            return future
+
+        if not self.is_running():
+            self.start()
+        with self._stats_lock:
+            self.stats['requests'] += 1
+        self._queue.put((frame, umbral_agrupacion, min_confidence, tiling, future))
+        return future
+
+    def detect(self, frame: np.ndarray, umbral_agrupacion: int = 50, min_confidence: Optional[float] = None,
+               tiling: Optional[tuple] = None, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Versión bloqueante para código síncrono."""
+        return self.submit(frame, umbral_agrupacion, min_confidence, tiling).result(timeout)
+
+    async def detect_async(self, frame: np.ndarray, umbral_agrupacion: int = 50,
+                           min_confidence: Optional[float] = None, tiling: Optional[tuple] = None) -> Dict[str, Any]:
+        """Versión awaitable: no bloquea el event loop mientras el lote se procesa."""
+        return await asyncio.wrap_future(self.submit(frame, umbral_agrupacion, min_confidence, tiling))
+
+    async def detect_many_async(self, frames: List[np.ndarray], umbral_agrupacion: int = 50,
+                                min_confidence: Optional[float] = None,
+                                tiling: Optional[tuple] = None) -> List[Dict[str, Any]]:
+        """Encola varios frames a la vez (p. ej. un buffer de pre-captura) y espera todos."""
+        futures = [asyncio.wrap_future(self.submit(f, umbral_agrupacion, min_confidence, tiling)) for f in frames]
+        return list(await asyncio.gather(*futures))
+
+    def swap_executor(self, executor: Any) -> Any:
+        """
+        Cambia el ejecutor de forma atómica y devuelve el anterior: los lotes siguientes van al
+        nuevo y los que ya estaban en vuelo terminan en el viejo (apagarlo con wait=True).
+        """
+        if self.executor is None:
+            raise ValueError("Solo se puede cambiar el ejecutor de un servicio creado con executor.")
+        if executor.workers != self.executor.workers:
+            raise ValueError("El ejecutor nuevo debe tener el mismo número de workers.")
+        with self._lock:
+            previous, self.executor = self.executor, executor
+        with self._stats_lock:
+            self.stats['executor_swaps'] += 1
+        return previous
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['avg_batch_size'] = round(stats['frames_processed'] / stats['batches'], 2) if stats['batches'] else 0.0
+        stats['avg_batch_ms'] = round(stats['batch_seconds'] * 1000 / stats['batches'], 1) if stats['batches'] else None
+        stats['batch_seconds'] = round(stats['batch_seconds'], 3)
+        return stats
+
+    # ------------------------------------------------------------------
+    # Hilo despachador
+    # ------------------------------------------------------------------
+    def _worker_loop(self):
+        stop_requested = False
+        while not stop_requested:
+            # Esperar una réplica libre ANTES de armar el lote: mientras tanto la cola crece
+            self._inflight.acquire()
+            item = self._queue.get()
+            if item is _STOP:
+                self._inflight.release()
+                break
+            batch, stop_requested = self._collect_batch(item)
+            self._run_batch(batch)
+
+    def _collect_batch(self, first: _Request) -> Tuple[List[_Request], bool]:
+        """Junta frames hasta llenar el lote o vencer el plazo del primero."""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_s
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run_batch(self, batch: List[_Request]):
+        # Descartar pedidos cancelados por el llamador antes de gastar inferencia en ellos
+        pending = [req for req in batch if req[-1].set_running_or_notify_cancel()]
+        if not pending:
+            self._inflight.release()
+            return
+
+        # Los pedidos con distintos umbrales se ejecutan en sub-lotes separados
+        by_umbral: Dict[Tuple[int, Optional[float], Optional[tuple]], List[_Request]] = {}
+        for req in pending:
+            by_umbral.setdefault((req[1], req[2], req[3]), []).append(req)
+
+        groups = list(by_umbral.items())
+        executor = self.executor  # Un cambio de ejecutor en caliente no parte el lote
+        remaining_groups = [len(groups)]
+        remaining_lock = threading.Lock()
+
+        def group_done():
+            with remaining_lock:
+                remaining_groups[0] -= 1
+                finished = remaining_groups[0] == 0
+            if finished:
+                self._inflight.release()
+
+        for (umbral, min_confidence, tiling), requests in groups:
+            frames = [req[0] for req in requests]
+            started = time.perf_counter()
+            if executor is None:
+                try:
+                    self._resolve(requests, self.batch_runner(frames, umbral, min_confidence, tiling), None, started)
+                except Exception as e:
+                    self._resolve(requests, None, e)
+                group_done()
+                continue
+
+            try:
+                batch_future = executor.submit_batch(frames, umbral, min_confidence, tiling)
+            except Exception as e:
+                self._resolve(requests, None, e)
+                group_done()
+                continue
+
+            def on_done(f: Future, requests=requests, started=started):
+                error = f.exception()
+                self._resolve(requests, None if error else f.result(), error, started)
+                group_done()
+
+            batch_future.add_done_callback(on_done)
+
+    def _resolve(self, requests: List[_Request], results: Optional[List[Dict[str, Any]]], error: Optional[BaseException],
+                 started: Optional[float] = None):
+        """Entrega a cada llamador su resultado (o la excepción del lote)."""
+        if error is None and (results is None or len(results) != len(requests)):
+            # Un backend que devuelve menos (o más) resultados dejaría llamadores esperando para siempre
+            error = RuntimeError(f"El lote de inferencia devolvió {len(results) if results is not None else 'ningún'} "
+                                 f"resultado(s) para {len(requests)} frames")
+        if error is not None:
+            with self._stats_lock:
+                self.stats['errors'] += 1
+            print(f"❌ Error ejecutando lote de inferencia ({len(requests)} frames): {error}")
+            traceback.print_exception(type(error), error, error.__traceback__)
+            for *_, future in requests:
+                future.set_exception(error)
+            return
+
+        for (*_, future), result in zip(requests, results):
+            future.set_result(result)
+        with self._stats_lock:
+            if started is not None:
+                self.stats['batch_seconds'] += time.perf_counter() - started
+            self.stats['batches'] += 1
+            self.stats['frames_processed'] += len(requests)
+            self.stats['largest_batch'] = max(self.stats['largest_batch'], len(requests))
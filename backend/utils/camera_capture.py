@@ -4,6 +4,7 @@ from datetime import datetime
 from typing import Optional, Dict, Any
 import asyncio
 from .image_processing import process_image  # Changed from process_frame
+from .image_writer import get_image_writer
 from crud import create_vagoneta_record  # Changed from ..crud
 from schemas import VagonetaCreate
 
@@ -62,9 +63,10 @@ class CameraCapture:
         """Maneja una detección exitosa"""
         # Guarda la imagen
         timestamp = datetime.now()
-        image_filename = f"{detection['numero']}_{timestamp.strftime('%Y%m%d_%H%M%S')}.jpg"
+        image_writer = get_image_writer()
+        image_filename = image_writer.image_name(f"{detection['numero']}_{timestamp.strftime('%Y%m%d_%H%M%S')}")
         image_path = f"uploads/{image_filename}"
-        cv2.imwrite(image_path, frame)        # Crea el registro en MongoDB
+        await image_writer.write_async(frame, image_path)        # Crea el registro en MongoDB
         record = VagonetaCreate(
             numero=detection['numero'],
             evento=self.evento,
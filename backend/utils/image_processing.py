@@ -1,91 +1,303 @@
-import torch
-from ultralytics import YOLO
-from ultralytics.nn.tasks import DetectionModel
-from ultralytics.nn.modules.conv import Conv as UltralyticsConv # Import Ultralytics Conv
-from ultralytics.nn.modules.conv import Concat # Import Concat
-from torch.nn.modules.container import Sequential, ModuleList # Import ModuleList
-from torch.nn.modules.conv import Conv2d # Importar Conv2d
-from torch.nn.modules.batchnorm import BatchNorm2d # Import BatchNorm2d
-from torch.nn.modules.activation import SiLU # Import SiLU
-from ultralytics.nn.modules.block import C2f, Bottleneck, SPPF # Import C2f, Bottleneck, and SPPF
-from ultralytics.nn.modules.block import DFL # Import DFL
-from torch.nn.modules.pooling import MaxPool2d # Import MaxPool2d
-from torch.nn.modules.upsampling import Upsample # Import Upsample
-from ultralytics.nn.modules.head import Detect # Import Detect
+import asyncio
+import functools
 import os
+import threading
+import time
+import traceback
 import cv2
 import numpy as np
-from typing import Optional, Dict, Any # Add this line
+from typing import Optional, Dict, Any, List, Tuple # Add this line
 from .ocr import extract_number_from_image # <--- Añadir esta línea
-from .number_grouping import detectar_numero_compuesto_desde_resultados, analizar_calidad_deteccion # Importar nueva funcionalidad
+from .number_grouping import agrupar_numeros_compuestos_lote, analizar_calidad_deteccion # Importar nueva funcionalidad
+from .batch_inference import BatchInferenceService
+from .inference_executor import DEFAULT_EXECUTOR_MODE, InferenceExecutor
+from .inference_backends import export_backend, get_backend, load_backend_model
+from .preprocessing import PAD_VALUE, LetterboxParams, PreprocessPipeline
+from .tiling import TilingConfig, merge_tile_detections, needs_tiling, tile_grid
+from .inference_cache import bytes_digest, frame_digest, get_inference_cache
+from .model_registry import DEFAULT_MIN_CONFIDENCE, get_inference_settings, get_model_registry
 
 _PLACEHOLDER_CROPPED_IMAGE = np.zeros((1, 1, 3), dtype=np.uint8)
 
-# Permitir la deserialización de clases específicas si es necesario
-# Esto es crucial si el modelo .pt fue guardado con una versión de PyTorch
-# que incluía estas clases directamente en el archivo de pesos.
-# Solo añade clases aquí si confías plenamente en el origen del archivo .pt.
-try:
-    # Lista de clases que pueden ser necesarias para tu modelo YOLOv8
-    # Es posible que necesites añadir más clases dependiendo de la arquitectura exacta
-    # y cómo fue guardado el modelo.
-    safe_globals_list = [
-        DetectionModel,
-        Sequential,
-        Conv2d,
-        UltralyticsConv, # Add Ultralytics Conv to the list
-        BatchNorm2d, # Add BatchNorm2d to the list
-        SiLU, # Add SiLU to the list
-        C2f, # Add C2f to the list
-        ModuleList, # Add ModuleList to the list
-        Bottleneck, # Add Bottleneck to the list
-        SPPF, # Add SPPF to the list
-        MaxPool2d, # Add MaxPool2d to the list
-        Upsample, # Add Upsample to the list
-        Concat, # Add Concat to the list - Corrected typo here
-        Detect, # Add Detect to the list
-        DFL # Add DFL to the list
-    ]
-    # Añadir más clases si aparecen errores similares para otras clases
-    # Ejemplo: from another_module import AnotherClass
-    # safe_globals_list.append(AnotherClass)
-
-    torch.serialization.add_safe_globals(safe_globals_list)
-    print(f"ℹ️ Clases seguras para deserialización de PyTorch añadidas: {safe_globals_list}")
-except AttributeError:
-    print("⚠️ torch.serialization.add_safe_globals no está disponible. Esto es normal en versiones antiguas de PyTorch.")
-except Exception as e:
-    print(f"❓ Error al intentar añadir clases seguras para PyTorch: {e}")
+# Tamaños (ancho x alto) de los frames con los que se calienta el modelo al arrancar:
+# por defecto los de las cámaras y videos habituales (VGA, 720p y 1080p).
+DEFAULT_WARMUP_SIZES = os.getenv("INFERENCE_WARMUP_SIZES", "640x480,1280x720,1920x1080")
+DEFAULT_WARMUP_RUNS = int(os.getenv("INFERENCE_WARMUP_RUNS", 2))
+# Entregar al modelo un tensor NCHW ya preparado (evita el letterbox y la conversión de ultralytics)
+DEFAULT_TENSOR_INPUT = os.getenv("INFERENCE_TENSOR_INPUT", "true").lower() in ("1", "true", "yes")
+
+# Modo cascada: primera pasada barata a baja resolución para localizar la vagoneta y segunda
+# pasada solo sobre el recorte ampliado para dígitos y ladrillo (el modelo se entrenó a 1280).
+DEFAULT_CASCADE = os.getenv("INFERENCE_CASCADE", "false").lower() in ("1", "true", "yes")
+CASCADE_COARSE_IMGSZ = int(os.getenv("INFERENCE_CASCADE_COARSE_IMGSZ", 640))
+CASCADE_CROP_IMGSZ = int(os.getenv("INFERENCE_CASCADE_CROP_IMGSZ", 640))
+CASCADE_CROP_MARGIN = float(os.getenv("INFERENCE_CASCADE_CROP_MARGIN", 0.1))  # Fracción del tamaño de la caja
+
+_safe_globals_registered = False
+
+
+def _register_safe_globals():
+    """
+    Permitir la deserialización de clases específicas si es necesario.
+    Esto es crucial si el modelo .pt fue guardado con una versión de PyTorch
+    que incluía estas clases directamente en el archivo de pesos.
+    Solo añade clases aquí si confías plenamente en el origen del archivo .pt.
+
+    Se hace al cargar el primer modelo (no al importar el módulo) para que importar
+    main, crud o los scripts no arrastre torch ni ultralytics.
+    """
+    global _safe_globals_registered
+    if _safe_globals_registered:
+        return
+    _safe_globals_registered = True
+    try:
+        import torch
+        from ultralytics.nn.tasks import DetectionModel
+        from ultralytics.nn.modules.conv import Conv as UltralyticsConv # Import Ultralytics Conv
+        from ultralytics.nn.modules.conv import Concat # Import Concat
+        from torch.nn.modules.container import Sequential, ModuleList # Import ModuleList
+        from torch.nn.modules.conv import Conv2d # Importar Conv2d
+        from torch.nn.modules.batchnorm import BatchNorm2d # Import BatchNorm2d
+        from torch.nn.modules.activation import SiLU # Import SiLU
+        from ultralytics.nn.modules.block import C2f, Bottleneck, SPPF # Import C2f, Bottleneck, and SPPF
+        from ultralytics.nn.modules.block import DFL # Import DFL
+        from torch.nn.modules.pooling import MaxPool2d # Import MaxPool2d
+        from torch.nn.modules.upsampling import Upsample # Import Upsample
+        from ultralytics.nn.modules.head import Detect # Import Detect
+
+        # Lista de clases que pueden ser necesarias para tu modelo YOLOv8
+        # Es posible que necesites añadir más clases dependiendo de la arquitectura exacta
+        # y cómo fue guardado el modelo.
+        safe_globals_list = [
+            DetectionModel,
+            Sequential,
+            Conv2d,
+            UltralyticsConv, # Add Ultralytics Conv to the list
+            BatchNorm2d, # Add BatchNorm2d to the list
+            SiLU, # Add SiLU to the list
+            C2f, # Add C2f to the list
+            ModuleList, # Add ModuleList to the list
+            Bottleneck, # Add Bottleneck to the list
+            SPPF, # Add SPPF to the list
+            MaxPool2d, # Add MaxPool2d to the list
+            Upsample, # Add Upsample to the list
+            Concat, # Add Concat to the list - Corrected typo here
+            Detect, # Add Detect to the list
+            DFL # Add DFL to the list
+        ]
+        # Añadir más clases si aparecen errores similares para otras clases
+        # Ejemplo: from another_module import AnotherClass
+        # safe_globals_list.append(AnotherClass)
+
+        torch.serialization.add_safe_globals(safe_globals_list)
+        print(f"ℹ️ Clases seguras para deserialización de PyTorch añadidas: {safe_globals_list}")
+    except ImportError as e:
+        print(f"ℹ️ PyTorch no disponible, no se registran clases seguras: {e}")
+    except AttributeError:
+        print("⚠️ torch.serialization.add_safe_globals no está disponible. Esto es normal en versiones antiguas de PyTorch.")
+    except Exception as e:
+        print(f"❓ Error al intentar añadir clases seguras para PyTorch: {e}")
 
 
 class ImageProcessor:
-    def __init__(self, model_path: Optional[str] = None): # Hacer model_path opcional
-        """Inicializa el procesador de imágenes con YOLOv8"""
-        if model_path is None:            # Construir la ruta al modelo desde la ubicación de este archivo (backend/utils/image_processing.py)
-            # Sube tres niveles para llegar a la raíz del proyecto (ElDorado)
-            project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))              # Construye la ruta al modelo dentro de backend/models/numeros_enteros
-            model_path = os.path.join(project_root, "backend", "models", "numeros_enteros", "yolo_model", "training", "best.pt")
+    def __init__(self, model_path: Optional[str] = None, backend: Optional[str] = None): # Hacer model_path opcional
+        """
+        Inicializa el procesador de imágenes con YOLOv8.
+
+        Args:
+            model_path: Ruta a best.pt (los artefactos de otros backends se buscan a su lado);
+                por defecto, la versión activa del registro de modelos (utils/model_registry.py).
+            backend: "pytorch", "torchscript", "onnx", "openvino" u "onnx-int8"; por defecto INFERENCE_BACKEND.
+        """
+        if model_path is None:            # Por defecto: backend/models/numeros_enteros/yolo_model/training/best.pt
+            model_path = get_model_registry().get().weights_path
 
         if not os.path.exists(model_path):            raise FileNotFoundError(
                 f"El archivo del modelo YOLOv8 no se encontró en la ruta: {model_path}. "
                 f"Verifica que el archivo \'best.pt\' exista en \'ElDorado\\backend\\models\\numeros_enteros\\yolo_model\\training\\\'.")
         
-        print(f"ℹ️ Cargando modelo YOLO desde: {model_path}")
-        self.model = YOLO(model_path)
+        self.model_path = model_path
+        self.backend = get_backend(backend)
+        print(f"ℹ️ Cargando modelo YOLO desde: {self.backend.artifact_path(model_path)} (backend: {self.backend.name})")
+        _register_safe_globals()
+        start = time.perf_counter()
+        self.model = load_backend_model(self.backend.name, model_path)
+        self.load_seconds = time.perf_counter() - start
         self.last_detection = None
-        self.min_confidence = 0.15  # Reducido para mejorar detección de números enteros
+        self.min_confidence = DEFAULT_MIN_CONFIDENCE  # MIN_CONFIDENCE; cada llamada puede pasar otro umbral
+        self.preprocessor = PreprocessPipeline()
+        self.tensor_input = DEFAULT_TENSOR_INPUT
+        self.cascade = DEFAULT_CASCADE
+        self._input_geometry: Optional[Tuple[Tuple[int, int], bool, int]] = None
+        self._vagoneta_class_ids = [i for i, name in self.model.names.items() if name == 'vagoneta']
+        self._ladrillo_class_ids = [i for i, name in self.model.names.items() if 'ladrillo' in name]
+
+    def _get_input_geometry(self) -> Tuple[Tuple[int, int], bool, int]:
+        """(imgsz (alto, ancho), letterbox rectangular, stride) tal como los usa el predictor de ultralytics."""
+        if self._input_geometry is None:
+            if self.model.predictor is None:
+                # Una pasada mínima inicializa el predictor (tamaño de exportación, stride, ejes dinámicos)
+                self.model(np.full((64, 64, 3), PAD_VALUE, dtype=np.uint8), conf=self.min_confidence, verbose=False)
+            predictor = self.model.predictor
+            backend_model = predictor.model
+            rect = getattr(backend_model, "format", None) == "pt" or getattr(backend_model, "pt", False) \
+                or getattr(backend_model, "dynamic", False)
+            self._input_geometry = (tuple(predictor.imgsz), bool(predictor.args.rect and rect),
+                                    int(getattr(backend_model, "stride", 32)))
+        return self._input_geometry
 
     def preprocess_image(self, image: np.ndarray) -> np.ndarray:
-        """Preprocesa la imagen para mejorar la detección"""
-        # Convertir a escala de grises
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        # Mejorar contraste
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        enhanced = clahe.apply(gray)
-        # Volver a BGR para YOLO
-        return cv2.cvtColor(enhanced, cv2.COLOR_GRAY2BGR)
-
-    def detect_objects_unified(self, image: np.ndarray, umbral_agrupacion: int = 50) -> Dict[str, Any]:
+        """
+        Preprocesa la imagen para mejorar la detección: letterbox al tamaño del modelo y CLAHE
+        sobre la imagen ya reducida. Devuelve el lienzo BGR (buffer reutilizado por hilo).
+        """
+        imgsz, auto, stride = self._get_input_geometry()
+        canvas, _ = self.preprocessor.letterbox_bgr(image, imgsz, auto, stride)
+        return canvas
+
+    def _run_model(self, images: List[np.ndarray], imgsz: Optional[Tuple[int, int]] = None,
+                   conf: Optional[float] = None) -> list:
+        """
+        Preprocesa y ejecuta el modelo; las cajas de cada Results quedan en coordenadas originales.
+        `imgsz` permite otro tamaño de entrada (solo backends con forma dinámica) y `conf` otro
+        umbral de confianza (por defecto self.min_confidence).
+        """
+        model_imgsz, auto, stride = self._get_input_geometry()
+        imgsz = imgsz or model_imgsz
+        # Backends exportados con batch fijo: se ejecuta imagen por imagen
+        groups = [images] if self.backend.supports_batch else [[img] for img in images]
+        results = []
+        for group in groups:
+            model_input, params = self.preprocessor.prepare_batch(group, imgsz, auto, stride, as_tensor=self.tensor_input)
+            if self.tensor_input:
+                import torch
+                model_input = torch.from_numpy(model_input)
+            outputs = self.model(model_input, conf=self.min_confidence if conf is None else conf, imgsz=list(imgsz))
+            for results_obj, letterbox in zip(outputs, params):
+                self._restore_original_coordinates(results_obj, letterbox)
+                results.append(results_obj)
+        return results
+
+    @staticmethod
+    def _restore_original_coordinates(results_obj, letterbox: LetterboxParams):
+        """Lleva las cajas del lienzo del modelo al frame original."""
+        results_obj.orig_shape = letterbox.orig_shape
+        if results_obj.boxes is None or len(results_obj.boxes) == 0:
+            return
+        data = results_obj.boxes.data.clone()
+        xyxy = letterbox.map_boxes_to_original(data[:, :4].cpu().numpy().copy())
+        data[:, :4] = data.new_tensor(xyxy)
+        results_obj.update(boxes=data)
+
+    def cascade_available(self) -> bool:
+        """La cascada necesita cambiar el tamaño de entrada: no aplica a exportaciones de forma fija."""
+        return bool(self._vagoneta_class_ids) and self._get_input_geometry()[1]
+
+    def _detect_results(self, images: List[np.ndarray], conf: Optional[float] = None,
+                        tiling: Optional[TilingConfig] = None) -> list:
+        """Resultados YOLO en coordenadas del frame original, en una pasada, en cascada o por teselas."""
+        tiled = [i for i, image in enumerate(images) if needs_tiling(image.shape, tiling)]
+        if tiled:
+            # Los frames grandes van por teselas (un lote por frame); el resto, por el camino normal
+            results = [None] * len(images)
+            rest = [i for i in range(len(images)) if i not in tiled]
+            if rest:
+                for i, results_obj in zip(rest, self._detect_results([images[i] for i in rest], conf)):
+                    results[i] = results_obj
+            for i in tiled:
+                results[i] = self._run_tiled(images[i], tiling, conf)
+            return results
+        if self.cascade and self.cascade_available():
+            return self._run_cascade(images, conf)
+        return self._run_model(images, conf=conf)
+
+    def _run_tiled(self, image: np.ndarray, tiling: TilingConfig, conf: Optional[float] = None):
+        """
+        Ejecuta las teselas solapadas de un frame (más el frame completo reducido, si se pide)
+        como un solo lote y fusiona sus cajas en las costuras (utils/tiling.py).
+        """
+        tile_size, overlap, include_full_frame = tiling
+        rects = tile_grid(image.shape, tile_size, overlap)
+        crops = [image[y1:y2, x1:x2] for x1, y1, x2, y2 in rects]
+        outputs = self._run_model(crops + [image] if include_full_frame else crops, conf=conf)
+
+        rows = []
+        for (x1, y1, _, _), results_obj in zip(rects, outputs):
+            if results_obj.boxes is not None and len(results_obj.boxes):
+                data = results_obj.boxes.data.cpu().numpy().copy()
+                data[:, [0, 2]] += x1
+                data[:, [1, 3]] += y1
+                rows.append(data)
+        base = outputs[-1]
+        if include_full_frame and base.boxes is not None and len(base.boxes):
+            rows.append(base.boxes.data.cpu().numpy())
+        merged = merge_tile_detections(np.concatenate(rows)) if rows else np.zeros((0, 6), dtype=np.float32)
+
+        import torch
+        base.orig_shape = image.shape[:2]
+        base.update(boxes=torch.from_numpy(np.ascontiguousarray(merged, dtype=np.float32)))
+        return base
+
+    def _run_cascade(self, images: List[np.ndarray], conf: Optional[float] = None) -> list:
+        """
+        1) Pasada gruesa a CASCADE_COARSE_IMGSZ sobre el frame completo para hallar la vagoneta.
+        2) Pasada fina a CASCADE_CROP_IMGSZ solo sobre el recorte (con margen) de cada vagoneta.
+        Los frames sin vagoneta se quedan con el resultado de la pasada gruesa.
+        """
+        coarse = self._run_model(images, (CASCADE_COARSE_IMGSZ, CASCADE_COARSE_IMGSZ), conf)
+
+        crops, crop_info = [], []
+        for index, (image, results_obj) in enumerate(zip(images, coarse)):
+            wagon = self._best_vagoneta_row(results_obj)
+            if wagon is None:
+                continue
+            x1, y1, x2, y2 = wagon[:4].tolist()
+            margin_x, margin_y = (x2 - x1) * CASCADE_CROP_MARGIN, (y2 - y1) * CASCADE_CROP_MARGIN
+            h, w = image.shape[:2]
+            cx1, cy1 = max(0, int(x1 - margin_x)), max(0, int(y1 - margin_y))
+            cx2, cy2 = min(w, int(np.ceil(x2 + margin_x))), min(h, int(np.ceil(y2 + margin_y)))
+            if cx2 - cx1 < 2 or cy2 - cy1 < 2:
+                continue
+            crops.append(image[cy1:cy2, cx1:cx2])
+            crop_info.append((index, cx1, cy1, wagon))
+
+        if not crops:
+            return coarse
+
+        fine = self._run_model(crops, (CASCADE_CROP_IMGSZ, CASCADE_CROP_IMGSZ), conf)
+        for (index, offset_x, offset_y, wagon), results_obj in zip(crop_info, fine):
+            coarse[index] = self._merge_crop_results(results_obj, images[index].shape[:2], offset_x, offset_y, wagon)
+        return coarse
+
+    def _best_vagoneta_row(self, results_obj):
+        """Fila (x1, y1, x2, y2, conf, cls) de la vagoneta más confiable, o None."""
+        if results_obj.boxes is None or len(results_obj.boxes) == 0:
+            return None
+        data = results_obj.boxes.data
+        best = None
+        for class_id in self._vagoneta_class_ids:
+            rows = data[data[:, 5] == class_id]
+            if len(rows) and (best is None or rows[:, 4].max() > best[4]):
+                best = rows[rows[:, 4].argmax()]
+        return best
+
+    def _merge_crop_results(self, results_obj, full_shape: Tuple[int, int], offset_x: int, offset_y: int, wagon):
+        """Lleva las cajas del recorte al frame completo y conserva la vagoneta de la pasada gruesa."""
+        data = results_obj.boxes.data if results_obj.boxes is not None else wagon.new_zeros((0, 6))
+        keep = data.new_ones(len(data), dtype=bool)
+        for class_id in self._vagoneta_class_ids:
+            keep &= data[:, 5] != class_id
+        data = data[keep].clone()
+        data[:, [0, 2]] += offset_x
+        data[:, [1, 3]] += offset_y
+        import torch
+        results_obj.orig_shape = full_shape
+        results_obj.update(boxes=torch.cat([data, wagon[None].to(data.dtype)], dim=0))
+        return results_obj
+
+    def detect_objects_unified(self, image: np.ndarray, umbral_agrupacion: int = 50,
+                               min_confidence: Optional[float] = None,
+                               tiling: Optional[TilingConfig] = None) -> Dict[str, Any]:
         """
         Función unificada que detecta todos los objetos de interés en una sola pasada del modelo.
         Detecta: vagoneta, número de vagoneta (agrupando dígitos), y tipo de ladrillo.
@@ -94,21 +306,38 @@ class ImageProcessor:
             print("❌ Error: Imagen de entrada es None o está vacía en detect_objects_unified.")
             return {}
 
-        # 1. Ejecutar el modelo UNA SOLA VEZ
-        processed_image = self.preprocess_image(image)
-        results = self.model(processed_image, conf=self.min_confidence)
+        # 1. Ejecutar el modelo UNA SOLA VEZ (o la cascada vagoneta -> recorte si está activa)
+        return self.detect_objects_batch([image], umbral_agrupacion, min_confidence, tiling)[0]
 
-        if not results or not results[0].boxes:
-            return {}
-        
-        results_obj = results[0] # Main result object
+    def detect_objects_batch(self, images: List[np.ndarray], umbral_agrupacion: int = 50,
+                             min_confidence: Optional[float] = None,
+                             tiling: Optional[TilingConfig] = None) -> List[Dict[str, Any]]:
+        """
+        Igual que detect_objects_unified, pero ejecuta el modelo UNA SOLA VEZ sobre un lote de imágenes.
+        Devuelve una lista alineada con `images`; las imágenes vacías o None producen {}.
+        """
+        outputs: List[Dict[str, Any]] = [{} for _ in images]
+        valid_indices = [i for i, img in enumerate(images) if img is not None and img.size > 0]
+        if not valid_indices:
+            return outputs
+
+        results = self._detect_results([images[i] for i in valid_indices], min_confidence, tiling)
+
+        # Una sola copia a CPU por imagen: array N×6 (x1, y1, x2, y2, conf, cls) para todo el post-procesamiento
+        detecciones = [r.boxes.data.cpu().numpy() if r.boxes else None for r in results]
+
+        # 2. Agrupar los dígitos de todo el lote en una sola pasada para formar los números de vagoneta
+        agrupaciones = agrupar_numeros_compuestos_lote(detecciones, umbral_agrupacion)
 
-        # 2. Agrupar los dígitos para formar el número de vagoneta
-        _, numero_compuesto, info_numero = detectar_numero_compuesto_desde_resultados(
-            results, 
-            image.copy(), 
-            umbral_agrupacion
-        )
+        for i, results_obj, det, agrupacion in zip(valid_indices, results, detecciones, agrupaciones):
+            if det is not None:
+                outputs[i] = self._build_detection_result(results_obj, det, agrupacion)
+        return outputs
+
+    def _build_detection_result(self, results_obj, detecciones: np.ndarray,
+                                agrupacion: Tuple[Optional[str], Dict[str, Any]]) -> Dict[str, Any]:
+        """Convierte el resultado YOLO de UNA imagen (y su número ya agrupado) al diccionario unificado."""
+        numero_compuesto, info_numero = agrupacion
 
         final_result = {
             'numero_detectado': None,
@@ -126,74 +355,400 @@ class ImageProcessor:
             final_result['confianza_numero'] = info_numero.get('confidence')
             final_result['bbox_numero'] = info_numero.get('bbox')
 
-        # 3. Extraer detecciones de ladrillo y vagoneta del MISMO resultado
-        best_ladrillo = None
-        best_vagoneta = None
-
-        for box in results_obj.boxes:
-            confidence = float(box.conf[0])
-            class_id = int(box.cls[0])
-            class_name = results_obj.names[class_id]
-            bbox = box.xyxy[0].cpu().numpy()
-
-            if 'ladrillo' in class_name:
-                if best_ladrillo is None or confidence > best_ladrillo['confidence']:
-                    best_ladrillo = {
-                        'tipo': class_name,
-                        'confidence': confidence,
-                        'bbox': bbox
-                    }
-
-            if class_name == 'vagoneta':
-                 if best_vagoneta is None or confidence > best_vagoneta['confidence']:
-                    best_vagoneta = {
-                        'confidence': confidence,
-                        'bbox': bbox
-                    }
-        
-        if best_ladrillo:
-            final_result['modelo_ladrillo'] = best_ladrillo['tipo']
-            final_result['confianza_ladrillo'] = best_ladrillo['confidence']
-            final_result['bbox_ladrillo'] = best_ladrillo['bbox']
+        # 3. Extraer detecciones de ladrillo y vagoneta del MISMO resultado (máscaras por clase)
+        clases = detecciones[:, -1].astype(np.int64)
+        confianzas = detecciones[:, -2]
 
-        if best_vagoneta:
-            final_result['bbox_vagoneta'] = best_vagoneta['bbox']
-            final_result['confianza_vagoneta'] = best_vagoneta['confidence']
+        best_ladrillo = self._best_index(confianzas, np.isin(clases, self._ladrillo_class_ids))
+        if best_ladrillo is not None:
+            final_result['modelo_ladrillo'] = results_obj.names[int(clases[best_ladrillo])]
+            final_result['confianza_ladrillo'] = float(confianzas[best_ladrillo])
+            final_result['bbox_ladrillo'] = detecciones[best_ladrillo, :4].copy()
+
+        best_vagoneta = self._best_index(confianzas, np.isin(clases, self._vagoneta_class_ids))
+        if best_vagoneta is not None:
+            final_result['bbox_vagoneta'] = detecciones[best_vagoneta, :4].copy()
+            final_result['confianza_vagoneta'] = float(confianzas[best_vagoneta])
 
         self.last_detection = final_result # Update last detection
         return final_result
 
+    @staticmethod
+    def _best_index(confianzas: np.ndarray, mascara: np.ndarray) -> Optional[int]:
+        """Índice de la caja más confiable dentro de la máscara (la primera en caso de empate)."""
+        if not mascara.any():
+            return None
+        candidatos = np.flatnonzero(mascara)
+        return int(candidatos[np.argmax(confianzas[candidatos])])
+
     def get_last_detection(self) -> Optional[Dict[str, Any]]:
         """Retorna la última detección exitosa"""
         return self.last_detection
 
-# Inicializar el procesador como singleton
-processor = ImageProcessor()
+# El procesador principal se carga de forma diferida (get_processor), normalmente desde el
+# lifespan de FastAPI mediante initialize_inference, y no al importar este módulo.
+_processor: Optional[ImageProcessor] = None
+_processor_lock = threading.Lock()
+
+def get_processor() -> ImageProcessor:
+    """Devuelve (cargando si hace falta) el procesador singleton del backend por defecto."""
+    global _processor
+    if _processor is None:
+        with _processor_lock:
+            if _processor is None:
+                _processor = ImageProcessor()
+    return _processor
+
+# Servicio de micro-lotes compartido por todos los llamadores (subidas, video, cámaras).
+# Los lotes se ejecutan en el ejecutor de inferencia, fuera del event loop de FastAPI,
+# repartidos entre INFERENCE_WORKERS réplicas del modelo. Hay un servicio (y un ejecutor)
+# por backend, para que una cámara pueda usar p. ej. "onnx-int8" y el resto el de por defecto.
+_batch_services: Dict[str, BatchInferenceService] = {}
+_inference_executors: Dict[str, InferenceExecutor] = {}
+_batch_service_lock = threading.Lock()
+
+def _resolve_backend_name(backend: Optional[str]) -> str:
+    return get_backend(backend).name
+
+def _create_executor(name: str, model_path: Optional[str] = None,
+                     primary: Optional[ImageProcessor] = None) -> InferenceExecutor:
+    """Ejecutor del backend `name` cuyas réplicas cargan `model_path` (None = versión activa)."""
+    return InferenceExecutor(
+        functools.partial(ImageProcessor, model_path, backend=name),
+        primary_replica=primary,
+        backend=None if name == get_backend().name else name,
+        model_path=model_path
+    )
+
+def get_inference_executor(backend: Optional[str] = None) -> InferenceExecutor:
+    """Devuelve (creando si hace falta) el ejecutor de inferencia del backend con su pool de réplicas."""
+    name = _resolve_backend_name(backend)
+    is_default = name == get_backend().name
+    with _batch_service_lock:
+        if name not in _inference_executors:
+            # En modo hilos el procesador principal se reutiliza como primera réplica del pool;
+            # en los modos con procesos el proceso principal no necesita cargar el modelo.
+            primary = get_processor() if is_default and DEFAULT_EXECUTOR_MODE == "thread" else None
+            _inference_executors[name] = _create_executor(name, primary=primary)
+        return _inference_executors[name]
+
+def get_batch_service(backend: Optional[str] = None) -> BatchInferenceService:
+    """Devuelve (creando si hace falta) el servicio de inferencia por lotes del backend."""
+    name = _resolve_backend_name(backend)
+    executor = get_inference_executor(name)
+    with _batch_service_lock:
+        if name not in _batch_services:
+            _batch_services[name] = BatchInferenceService(executor=executor)
+            _batch_services[name].start()
+        return _batch_services[name]
+
+# Estado de preparación que expone /ready: no se enruta tráfico a un proceso en frío.
+_readiness: Dict[str, Any] = {
+    'ready': False,
+    'state': 'pending',       # pending -> loading -> warming -> ready | error
+    'backends': [],
+    'load_seconds': None,
+    'warmup_seconds': None,
+    'warmup': [],
+    'error': None
+}
+
+def parse_warmup_sizes(spec: str) -> List[Tuple[int, int]]:
+    """Convierte "640x480,1280x720" en [(640, 480), (1280, 720)] (ancho, alto)."""
+    sizes = []
+    for item in spec.split(","):
+        item = item.strip().lower()
+        if not item:
+            continue
+        width, height = item.split("x")
+        sizes.append((int(width), int(height)))
+    return sizes
+
+def get_readiness() -> Dict[str, Any]:
+    return dict(_readiness)
+
+def _warm_executor(name: str, executor: InferenceExecutor, sizes: List[Tuple[int, int]],
+                   runs: int) -> List[Dict[str, Any]]:
+    """Calienta todas las réplicas con frames sintéticos; devuelve los tiempos por tamaño."""
+    rng = np.random.default_rng(0)
+    entries = []
+    for width, height in sizes:
+        frame = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+        timings = []
+        for _ in range(max(1, runs)):
+            run_start = time.perf_counter()
+            executor.warmup([frame])
+            timings.append(round((time.perf_counter() - run_start) * 1000, 1))
+        # El último pase ya es en caliente: sirve como medida de rendimiento de la réplica
+        entries.append({'backend': name, 'size': f"{width}x{height}", 'runs_ms': timings,
+                        'fps': round(1000 / timings[-1], 1) if timings[-1] else None})
+        print(f"🔥 Calentamiento {name} {width}x{height}: {timings} ms")
+    return entries
 
-def run_detection_on_path(image_path: str) -> Dict[str, Any]:
+def initialize_inference(backends: Optional[List[str]] = None,
+                         sizes: Optional[List[Tuple[int, int]]] = None,
+                         runs: int = DEFAULT_WARMUP_RUNS) -> Dict[str, Any]:
+    """
+    Carga los modelos, crea ejecutores y servicios de lotes y los calienta con frames
+    sintéticos de los tamaños configurados. Pensado para el lifespan de FastAPI.
+
+    Args:
+        backends: Backends a preparar (además del de por defecto), p. ej. los de las cámaras.
+        sizes: Tamaños (ancho, alto) de calentamiento; por defecto INFERENCE_WARMUP_SIZES.
+        runs: Pasadas por tamaño y réplica; la primera paga el arranque en frío.
+    """
+    names = []
+    for backend in [None] + list(backends or []):
+        name = _resolve_backend_name(backend)
+        if name not in names:
+            names.append(name)
+    sizes = sizes if sizes is not None else parse_warmup_sizes(DEFAULT_WARMUP_SIZES)
+    _readiness.update({'ready': False, 'state': 'loading', 'backends': names, 'warmup': [], 'error': None})
+
+    try:
+        start = time.perf_counter()
+        executors = {name: get_inference_executor(name) for name in names}
+        for name in names:
+            get_batch_service(name)
+        _readiness['load_seconds'] = round(time.perf_counter() - start, 3)
+        print(f"✅ Modelos cargados en {_readiness['load_seconds']:.2f}s (backends: {', '.join(names)})")
+
+        _readiness['state'] = 'warming'
+        warmup_start = time.perf_counter()
+        for name, executor in executors.items():
+            _readiness['warmup'].extend(_warm_executor(name, executor, sizes, runs))
+        _readiness['warmup_seconds'] = round(time.perf_counter() - warmup_start, 3)
+        _model_state.update({'version': get_model_registry().active_version, 'loaded_at': time.time(),
+                             'warmup': list(_readiness['warmup'])})
+
+        _readiness.update({'ready': True, 'state': 'ready'})
+        print(f"✅ Inferencia lista (calentamiento: {_readiness['warmup_seconds']:.2f}s)")
+    except Exception as e:
+        _readiness.update({'ready': False, 'state': 'error', 'error': f"{type(e).__name__}: {e}"})
+        print(f"❌ Error inicializando la inferencia: {e}")
+        traceback.print_exc()
+    return get_readiness()
+
+# Versión en uso y mediciones de rendimiento que expone /model/info
+_model_state: Dict[str, Any] = {'version': None, 'loaded_at': None, 'warmup': [], 'swaps': 0, 'last_swap': None}
+_swap_lock = threading.Lock()
+
+def _retire_executors(executors: List[InferenceExecutor]):
+    """Apaga los ejecutores reemplazados cuando terminan sus lotes en vuelo."""
+    for executor in executors:
+        try:
+            executor.shutdown(wait=True)
+        except Exception as e:
+            print(f"⚠️ Error apagando un ejecutor reemplazado: {e}")
+
+def swap_model(version: str, sizes: Optional[List[Tuple[int, int]]] = None, runs: int = 1) -> Dict[str, Any]:
+    """
+    Cambia en caliente a otra versión del registro de modelos. Las réplicas nuevas se cargan y
+    calientan mientras las actuales siguen atendiendo; después los servicios de lotes pasan de
+    forma atómica a los ejecutores nuevos y los anteriores se apagan al vaciarse. Si la carga o
+    el calentamiento fallan, la versión anterior sigue activa.
+    """
+    global _processor
+    if not _swap_lock.acquire(blocking=False):
+        raise RuntimeError("Ya hay un cambio de modelo en curso")
+    try:
+        registry = get_model_registry()
+        target = registry.get(version)
+        if not os.path.exists(target.weights_path):
+            raise FileNotFoundError(f"No existen los pesos de la versión '{version}': {target.weights_path}")
+        previous_version = registry.active_version
+        default_name = get_backend().name
+        with _batch_service_lock:
+            names = list(_inference_executors) or [default_name]
+        sizes = sizes if sizes is not None else parse_warmup_sizes(DEFAULT_WARMUP_SIZES)
+        print(f"🔄 Cargando la versión '{version}' del modelo (backends: {', '.join(names)})")
+
+        start = time.perf_counter()
+        new_executors: Dict[str, InferenceExecutor] = {}
+        new_primary: Optional[ImageProcessor] = None
+        warmup: List[Dict[str, Any]] = []
+        try:
+            for name in names:
+                export_backend(name, target.weights_path)  # Genera el artefacto de la versión si falta
+                primary = None
+                if name == default_name and DEFAULT_EXECUTOR_MODE == "thread":
+                    primary = new_primary = ImageProcessor(target.weights_path)
+                new_executors[name] = _create_executor(name, target.weights_path, primary)
+                warmup.extend(_warm_executor(name, new_executors[name], sizes, runs))
+        except Exception:
+            for executor in new_executors.values():
+                executor.shutdown(wait=False)
+            raise
+
+        # Cambio atómico: los lotes siguientes usan la versión nueva
+        registry.set_active(version)
+        retired = []
+        with _batch_service_lock:
+            for name, executor in new_executors.items():
+                previous = _inference_executors.get(name)
+                _inference_executors[name] = executor
+                service = _batch_services.get(name)
+                if service is not None:
+                    previous = service.swap_executor(executor)
+                if previous is not None:
+                    retired.append(previous)
+            # En los modos con procesos se vuelve a cargar bajo demanda con la versión activa
+            _processor = new_primary
+        invalidate_inference_cache(f"versión del modelo cambiada a '{version}'")
+        threading.Thread(target=_retire_executors, args=(retired,), name="retire-executors", daemon=True).start()
+
+        swap = {'from': previous_version, 'to': version, 'at': time.time(),
+                'seconds': round(time.perf_counter() - start, 3), 'backends': names}
+        _model_state.update({'version': version, 'loaded_at': time.time(), 'warmup': warmup,
+                             'swaps': _model_state['swaps'] + 1, 'last_swap': swap})
+        print(f"✅ Modelo cambiado a '{version}' en {swap['seconds']:.2f}s")
+        return swap
+    finally:
+        _swap_lock.release()
+
+def get_model_info() -> Dict[str, Any]:
+    """Versión activa, tamaño de entrada, umbrales y rendimiento medido (GET /model/info)."""
+    registry = get_model_registry()
+    version = registry.get()
+    details = version.to_dict()
+    settings = get_inference_settings().to_dict()
+
+    classes_count, input_size = details['classes_count'], None
+    processor = _processor
+    if processor is not None and processor.model_path == version.weights_path:
+        classes_count = len(processor.model.names)
+        if processor._input_geometry is not None:
+            input_size = list(processor._input_geometry[0])
+    if input_size is None and version.metadata.get('imgsz'):
+        input_size = [version.metadata['imgsz'], version.metadata['imgsz']]
+
+    with _batch_service_lock:
+        services = dict(_batch_services)
+    live = {}
+    for name, service in services.items():
+        stats = service.get_stats()
+        live[name] = {
+            'frames_processed': stats['frames_processed'],
+            'avg_batch_size': stats['avg_batch_size'],
+            'avg_batch_ms': stats['avg_batch_ms'],
+            # Lotes en paralelo entre réplicas: esto es el rendimiento de una réplica
+            'fps_per_replica': round(stats['frames_processed'] / stats['batch_seconds'], 1) if stats['batch_seconds'] else None,
+        }
+
+    return {
+        'version': version.version,
+        'backend': get_backend().name,
+        'executor_mode': DEFAULT_EXECUTOR_MODE,
+        'weights_path': version.weights_path,
+        'classes_count': classes_count,
+        'input_size': input_size,
+        'confidence_threshold': settings['min_confidence'],
+        'umbral_agrupacion': settings['umbral_agrupacion'],
+        'model_size': f"{details['size_mb']} MB" if details['size_mb'] is not None else None,
+        'training_epochs': version.metadata.get('training_epochs'),
+        'ready': _readiness['ready'],
+        'loaded_at': _model_state['loaded_at'],
+        'swaps': _model_state['swaps'],
+        'last_swap': _model_state['last_swap'],
+        'throughput': {'warmup': _model_state['warmup'], 'live': live},
+        'available_versions': [v.version for v in registry.list_versions()],
+    }
+
+def get_inference_stats() -> Dict[str, Any]:
+    """Contadores de la caché de resultados y de los servicios de lotes activos."""
+    with _batch_service_lock:
+        services = dict(_batch_services)
+    return {
+        'cache': get_inference_cache().get_stats(),
+        'batch_services': {name: service.get_stats() for name, service in services.items()},
+    }
+
+def shutdown_inference():
+    """Detiene los servicios de lotes y libera los ejecutores (llamar al apagar la aplicación)."""
+    with _batch_service_lock:
+        services, executors = list(_batch_services.values()), list(_inference_executors.values())
+        _batch_services.clear()
+        _inference_executors.clear()
+    for service in services:
+        service.stop()
+    for executor in executors:
+        executor.shutdown(wait=False)
+    invalidate_inference_cache("servicios de inferencia detenidos")
+    _readiness.update({'ready': False, 'state': 'pending'})
+
+def invalidate_inference_cache(reason: str = "modelo cambiado"):
+    """Descarta los resultados cacheados (llamar siempre que cambie el modelo)."""
+    get_inference_cache().invalidate(reason)
+
+def _cached_detect_keys(backend: Optional[str], keys: List[Any], settings: Dict[str, Any]) -> List[Any]:
+    """Claves completas de la caché: el mismo frame da resultados distintos según backend y umbrales."""
+    backend_name = _resolve_backend_name(backend)
+    thresholds = (settings['umbral_agrupacion'], settings['min_confidence'], settings['tiling'])
+    return [(backend_name, thresholds, key) for key in keys]
+
+def _read_file_bytes(path: str) -> Optional[bytes]:
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def _detection_settings(tiling: Optional[TilingConfig]) -> Dict[str, Any]:
+    """Argumentos por llamada del servicio de lotes: umbrales vigentes y teselas de la cámara."""
+    return {**get_inference_settings().detection_kwargs(), 'tiling': tiling}
+
+def run_detection_on_path(image_path: str, cache_key: Optional[Any] = None,
+                          tiling: Optional[TilingConfig] = None) -> Dict[str, Any]:
     """
     Función principal para ejecutar la detección unificada en una imagen desde una ruta.
     Carga una imagen, la procesa y devuelve todos los objetos detectados.
 
     Args:
         image_path (str): Ruta a la imagen a procesar.
+        cache_key: Clave explícita para la caché; por defecto, el hash del archivo.
+        tiling: (tile_size, overlap, include_full_frame) para inferir por teselas (utils/tiling.py).
 
     Returns:
         Dict[str, Any]: Un diccionario con los resultados de la detección.
     """
-    image = cv2.imread(image_path)
+    cache = get_inference_cache()
+    settings = _detection_settings(tiling)
+    if not cache.enabled:
+        image = cv2.imread(image_path)
+        if image is None:
+            print(f"Error: No se pudo cargar la imagen desde {image_path}")
+            return {}
+        return get_batch_service().detect(image, **settings)
+
+    # Se hashean los bytes del archivo: un acierto evita también la decodificación
+    data = _read_file_bytes(image_path)
+    if data is None:
+        print(f"Error: No se pudo cargar la imagen desde {image_path}")
+        return {}
+    key = _cached_detect_keys(None, [cache_key if cache_key is not None else bytes_digest(data)], settings)[0]
+    generation = cache.generation
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
     if image is None:
         print(f"Error: No se pudo cargar la imagen desde {image_path}")
         return {}
-    
-    return processor.detect_objects_unified(image)
+    result = get_batch_service().detect(image, **settings)
+    cache.put(key, result, generation)
+    return result
 
-def run_detection_on_frame(frame: np.ndarray) -> Dict[str, Any]:
+def run_detection_on_frame(frame: np.ndarray, cache_key: Optional[Any] = None,
+                           tiling: Optional[TilingConfig] = None) -> Dict[str, Any]:
     """
     Función principal para ejecutar la detección unificada en un frame (np.ndarray).
 
     Args:
         frame (np.ndarray): El frame de video a procesar.
+        cache_key: Clave explícita para la caché (p. ej. (video, índice de frame));
+            por defecto, el hash del contenido del frame.
+        tiling: (tile_size, overlap, include_full_frame) para inferir por teselas (utils/tiling.py).
 
     Returns:
         Dict[str, Any]: Un diccionario con los resultados de la detección.
@@ -201,5 +756,108 @@ def run_detection_on_frame(frame: np.ndarray) -> Dict[str, Any]:
     if frame is None or frame.size == 0:
         print("Error: El frame de entrada está vacío o es None.")
         return {}
-        
-    return processor.detect_objects_unified(frame)
+
+    cache = get_inference_cache()
+    settings = _detection_settings(tiling)
+    if not cache.enabled:
+        return get_batch_service().detect(frame, **settings)
+
+    key = _cached_detect_keys(None, [cache_key if cache_key is not None else frame_digest(frame)], settings)[0]
+    generation = cache.generation
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    result = get_batch_service().detect(frame, **settings)
+    cache.put(key, result, generation)
+    return result
+
+async def run_detection_on_path_async(image_path: str, backend: Optional[str] = None,
+                                      cache_key: Optional[Any] = None,
+                                      tiling: Optional[TilingConfig] = None) -> Dict[str, Any]:
+    """Versión awaitable de run_detection_on_path; el frame se agrupa con los de otros llamadores."""
+    cache = get_inference_cache()
+    settings = _detection_settings(tiling)
+    if not cache.enabled:
+        # La decodificación también sale del event loop
+        image = await asyncio.to_thread(cv2.imread, image_path)
+        if image is None:
+            print(f"Error: No se pudo cargar la imagen desde {image_path}")
+            return {}
+        return await get_batch_service(backend).detect_async(image, **settings)
+
+    data = await asyncio.to_thread(_read_file_bytes, image_path)
+    if data is None:
+        print(f"Error: No se pudo cargar la imagen desde {image_path}")
+        return {}
+    key = _cached_detect_keys(backend, [cache_key if cache_key is not None else bytes_digest(data)], settings)[0]
+    generation = cache.generation
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    image = await asyncio.to_thread(cv2.imdecode, np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        print(f"Error: No se pudo cargar la imagen desde {image_path}")
+        return {}
+    result = await get_batch_service(backend).detect_async(image, **settings)
+    cache.put(key, result, generation)
+    return result
+
+async def run_detection_on_frame_async(frame: np.ndarray, backend: Optional[str] = None,
+                                       cache_key: Optional[Any] = None,
+                                       tiling: Optional[TilingConfig] = None) -> Dict[str, Any]:
+    """Versión awaitable de run_detection_on_frame; el frame se agrupa con los de otros llamadores."""
+    if frame is None or frame.size == 0:
+        print("Error: El frame de entrada está vacío o es None.")
+        return {}
+
+    results = await run_detection_on_frames_async([frame], backend=backend, cache_keys=[cache_key], tiling=tiling)
+    return results[0]
+
+async def run_detection_on_frames_async(frames: List[np.ndarray], backend: Optional[str] = None,
+                                        cache_keys: Optional[List[Optional[Any]]] = None,
+                                        tiling: Optional[TilingConfig] = None) -> List[Dict[str, Any]]:
+    """
+    Encola varios frames a la vez (se procesan en el mismo lote cuando caben). Solo los frames
+    que no están en la caché llegan al modelo; `cache_keys` (opcional, alineada con `frames`)
+    permite claves explícitas, y donde falte se usa el hash del contenido. Con `tiling` cada
+    frame mayor que una tesela se infiere por teselas solapadas.
+    """
+    cache = get_inference_cache()
+    settings = _detection_settings(tiling)
+    service = get_batch_service(backend)
+    if not cache.enabled:
+        return await service.detect_many_async(frames, **settings)
+
+    keys = list(cache_keys) if cache_keys is not None else [None] * len(frames)
+    valid = [i for i, f in enumerate(frames) if f is not None and f.size > 0]
+    missing = [i for i in valid if keys[i] is None]
+    if missing:
+        # Hashear varios frames grandes lleva milisegundos: fuera del event loop
+        digests = await asyncio.to_thread(lambda: [frame_digest(frames[i]) for i in missing])
+        for i, digest in zip(missing, digests):
+            keys[i] = digest
+    full_keys = dict(zip(valid, _cached_detect_keys(backend, [keys[i] for i in valid], settings)))
+
+    generation = cache.generation
+    results: List[Dict[str, Any]] = [{} for _ in frames]
+    pending: Dict[Any, List[int]] = {}  # clave -> posiciones (frames repetidos se infieren una vez)
+    for i in valid:
+        key = full_keys[i]
+        if key in pending:
+            pending[key].append(i)
+            continue
+        cached = cache.get(key)
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending[key] = [i]
+
+    if pending:
+        order = list(pending)
+        detected = await service.detect_many_async([frames[pending[key][0]] for key in order], **settings)
+        for key, result in zip(order, detected):
+            cache.put(key, result, generation)
+            for i in pending[key]:
+                results[i] = dict(result)
+    return results
@@ -0,0 +1,231 @@
+"""
+Escritura de imágenes de detecciones fuera del event loop.
+
+Guardar un frame a resolución completa (codificar el JPEG y escribirlo en disco) tarda varios
+milisegundos y en los caminos calientes (video, monitoreo en vivo, captura automática) se hacía
+con `cv2.imwrite` dentro del event loop. ImageWriter tiene una cola acotada y un pool de hilos
+(OpenCV libera el GIL al codificar): los llamadores encolan el frame y reciben un Future con
+la ruta final, que pueden esperar (`write_async`) o guardar para esperar más tarde. Si la cola
+está llena, encolar espera (sin bloquear el event loop en `enqueue`/`write_async`): la memoria
+de frames pendientes queda acotada.
+
+El formato sale de la extensión de la ruta (`.jpg`/`.jpeg` o `.webp`); `image_name()` añade la
+del formato configurado. Cada imagen se escribe en un `.tmp` junto al destino y se renombra al
+terminar, así nadie lee nunca un archivo a medias.
+
+El frame encolado no debe modificarse después (no se copia).
+
+Configuración:
+
+    IMAGE_FORMAT=jpg              # jpg | webp
+    IMAGE_JPEG_QUALITY=90
+    IMAGE_WEBP_QUALITY=90
+    IMAGE_WRITER_THREADS=2
+    IMAGE_WRITER_QUEUE_SIZE=64    # Imágenes pendientes como máximo
+"""
+
+import asyncio
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "jpg").lower().lstrip(".")
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", 90))
+IMAGE_WEBP_QUALITY = int(os.getenv("IMAGE_WEBP_QUALITY", 90))
+IMAGE_WRITER_THREADS = int(os.getenv("IMAGE_WRITER_THREADS", 2))
+IMAGE_WRITER_QUEUE_SIZE = int(os.getenv("IMAGE_WRITER_QUEUE_SIZE", 64))
+
+_EXTENSIONS = {"jpg": ".jpg", "jpeg": ".jpg", "webp": ".webp"}
+
+# (frame, ruta destino, future)
+_Request = Tuple[np.ndarray, Path, Future]
+_STOP = object()
+
+
+class ImageWriter:
+    """Codifica y escribe imágenes en hilos propios con una cola acotada."""
+
+    def __init__(self, image_format: str = IMAGE_FORMAT, jpeg_quality: int = IMAGE_JPEG_QUALITY,
+                 webp_quality: int = IMAGE_WEBP_QUALITY, threads: int = IMAGE_WRITER_THREADS,
+                 queue_size: int = IMAGE_WRITER_QUEUE_SIZE):
+        if image_format not in _EXTENSIONS:
+            raise ValueError(f"Formato de imagen no soportado: {image_format} (jpg o webp)")
+        self.extension = _EXTENSIONS[image_format]
+        self.jpeg_quality = max(1, min(100, int(jpeg_quality)))
+        self.webp_quality = max(1, min(100, int(webp_quality)))
+        self.threads = max(1, int(threads))
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._workers: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self.stats = {
+            'submitted': 0,
+            'written': 0,
+            'errors': 0,
+            'bytes_written': 0,
+            'encode_seconds': 0.0,   # Suma de tiempos de codificación
+            'write_seconds': 0.0,    # Suma de tiempos de escritura + renombrado
+            'max_encode_ms': 0.0,
+            'max_queue_depth': 0,
+            'queue_full_waits': 0,   # Veces que un llamador tuvo que esperar hueco en la cola
+        }
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+    def start(self):
+        """Inicia los hilos de escritura si no están corriendo."""
+        with self._lock:
+            if self._workers and all(t.is_alive() for t in self._workers):
+                return
+            self._workers = [threading.Thread(target=self._worker_loop, name=f"image-writer-{i}", daemon=True)
+                             for i in range(self.threads)]
+            for thread in self._workers:
+                thread.start()
+            print(f"ℹ️ Escritor de imágenes iniciado ({self.threads} hilos, formato {self.extension})")
+
+    def stop(self, timeout: float = 5.0):
+        """Escribe lo pendiente y detiene los hilos."""
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for _ in workers:
+            self._queue.put(_STOP)
+        for thread in workers:
+            thread.join(timeout)
+
+    def is_running(self) -> bool:
+        return bool(self._workers) and all(t.is_alive() for t in self._workers)
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+    def image_name(self, stem: str) -> str:
+        """Nombre de archivo con la extensión del formato configurado."""
+        return f"{stem}{self.extension}"
+
+    def _request(self, frame: np.ndarray, path: Union[str, Path]) -> _Request:
+        if frame is None or frame.size == 0:
+            raise ValueError(f"Frame vacío para {path}")
+        if not self.is_running():
+            self.start()
+        self.stats['submitted'] += 1
+        return frame, Path(path), Future()
+
+    def _track_depth(self):
+        self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], self._queue.qsize())
+
+    def submit(self, frame: np.ndarray, path: Union[str, Path]) -> Future:
+        """
+        Encola el frame para escribirlo en `path` y devuelve un Future con la ruta final.
+        Versión para código síncrono: si la cola está llena, espera a que haya hueco.
+        """
+        request = self._request(frame, path)
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            self.stats['queue_full_waits'] += 1
+            self._queue.put(request)
+        self._track_depth()
+        return request[2]
+
+    async def enqueue(self, frame: np.ndarray, path: Union[str, Path]) -> "asyncio.Future[Path]":
+        """
+        Como `submit` pero sin bloquear el event loop si la cola está llena. Devuelve un awaitable
+        con la ruta final, para esperar la escritura ahora o más tarde (p. ej. en un checkpoint).
+        """
+        request = self._request(frame, path)
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            self.stats['queue_full_waits'] += 1
+            await asyncio.to_thread(self._queue.put, request)
+        self._track_depth()
+        return asyncio.wrap_future(request[2])
+
+    async def write_async(self, frame: np.ndarray, path: Union[str, Path]) -> Path:
+        """Encola el frame y espera a que esté en disco."""
+        return await (await self.enqueue(frame, path))
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        written = stats['written']
+        stats['queue_depth'] = self._queue.qsize()
+        stats['queue_size'] = self._queue.maxsize
+        stats['threads'] = self.threads
+        stats['format'] = self.extension.lstrip(".")
+        stats['avg_encode_ms'] = round(stats['encode_seconds'] * 1000 / written, 2) if written else None
+        stats['avg_write_ms'] = round(stats['write_seconds'] * 1000 / written, 2) if written else None
+        stats['encode_seconds'] = round(stats['encode_seconds'], 3)
+        stats['write_seconds'] = round(stats['write_seconds'], 3)
+        stats['max_encode_ms'] = round(stats['max_encode_ms'], 2)
+        return stats
+
+    # ------------------------------------------------------------------
+    # Hilos de escritura
+    # ------------------------------------------------------------------
+    def _encode_params(self, extension: str) -> Tuple[str, List[int]]:
+        if extension == ".webp":
+            return ".webp", [cv2.IMWRITE_WEBP_QUALITY, self.webp_quality]
+        if extension in (".jpg", ".jpeg"):
+            return ".jpg", [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+        raise ValueError(f"Extensión de imagen no soportada: {extension}")
+
+    def _write(self, frame: np.ndarray, path: Path) -> Path:
+        extension, params = self._encode_params(path.suffix.lower())
+        start = time.perf_counter()
+        ok, encoded = cv2.imencode(extension, frame, params)
+        encode_s = time.perf_counter() - start
+        if not ok:
+            raise ValueError(f"No se pudo codificar la imagen {path.name}")
+
+        start = time.perf_counter()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        data = encoded.tobytes()
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)  # Quien lea la ruta ve la imagen completa o no la ve
+        write_s = time.perf_counter() - start
+
+        with self._lock:
+            self.stats['written'] += 1
+            self.stats['bytes_written'] += len(data)
+            self.stats['encode_seconds'] += encode_s
+            self.stats['write_seconds'] += write_s
+            self.stats['max_encode_ms'] = max(self.stats['max_encode_ms'], encode_s * 1000)
+        return path
+
+    def _worker_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            frame, path, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self._write(frame, path))
+            except Exception as e:
+                with self._lock:
+                    self.stats['errors'] += 1
+                print(f"❌ Error guardando la imagen {path}: {e}")
+                traceback.print_exc()
+                future.set_exception(e)
+
+
+# Escritor compartido por el proceso
+_image_writer: Optional[ImageWriter] = None
+_image_writer_lock = threading.Lock()
+
+def get_image_writer() -> ImageWriter:
+    global _image_writer
+    with _image_writer_lock:
+        if _image_writer is None:
+            _image_writer = ImageWriter()
+        return _image_writer
@@ -0,0 +1,157 @@
+"""
+Backends de inferencia intercambiables para ImageProcessor.
+
+El backend se elige con la variable de entorno INFERENCE_BACKEND (o el argumento `backend`
+de ImageProcessor):
+
+    - "pytorch":     best.pt en PyTorch eager (comportamiento original).
+    - "torchscript": best.torchscript
+    - "onnx":        best.onnx con ONNX Runtime
+    - "openvino":    best_openvino_model/ con OpenVINO
+    - "onnx-int8":   best_int8.onnx, cuantizado post-entrenamiento (utils/quantization.py)
+
+Todos los artefactos se generan a partir de best.pt con `export_backend` (ver
+scripts/export_backends.py) y se cargan a través de `ultralytics.YOLO`, que devuelve el
+mismo objeto `Results` para todos ellos; así el post-procesamiento de
+`detect_objects_unified` es idéntico sea cual sea el backend.
+"""
+
+import importlib
+import importlib.util
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_BACKEND = os.getenv("INFERENCE_BACKEND", "pytorch").lower()
+
+# Construir la ruta al modelo desde la ubicación de este archivo (backend/utils/inference_backends.py)
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_WEIGHTS_PATH = os.path.join(_BACKEND_DIR, "models", "numeros_enteros", "yolo_model", "training", "best.pt")
+
+
+class InferenceBackend:
+    """Descripción de un backend: formato de exportación, artefacto y capacidades."""
+
+    def __init__(self, name: str, export_format: Optional[str], artifact_suffix: str,
+                 supports_batch: bool, requires: tuple = (), export_kwargs: Optional[Dict[str, Any]] = None,
+                 exporter: Optional[str] = None):
+        self.name = name
+        self.export_format = export_format          # Formato de YOLO.export(); None = best.pt tal cual
+        self.artifact_suffix = artifact_suffix      # Se añade al nombre base de best.pt
+        self.supports_batch = supports_batch        # False => el lote se ejecuta imagen por imagen
+        self.requires = requires                    # Paquetes Python necesarios en tiempo de ejecución
+        self.export_kwargs = export_kwargs or {}
+        self.exporter = exporter                    # "modulo:funcion" propia en lugar de YOLO.export()
+
+    def artifact_path(self, weights_path: str) -> str:
+        """Ruta del artefacto de este backend junto a best.pt."""
+        if self.export_format is None:
+            return weights_path
+        base, _ = os.path.splitext(weights_path)
+        return base + self.artifact_suffix
+
+    def missing_requirements(self) -> List[str]:
+        return [pkg for pkg in self.requires if importlib.util.find_spec(pkg) is None]
+
+
+BACKENDS: Dict[str, InferenceBackend] = {
+    "pytorch": InferenceBackend("pytorch", None, ".pt", supports_batch=True, requires=("torch",)),
+    # TorchScript se exporta con forma de entrada fija (batch 1)
+    "torchscript": InferenceBackend("torchscript", "torchscript", ".torchscript", supports_batch=False, requires=("torch",)),
+    "onnx": InferenceBackend("onnx", "onnx", ".onnx", supports_batch=True, requires=("onnxruntime",),
+                             export_kwargs={"dynamic": True, "simplify": True}),
+    "openvino": InferenceBackend("openvino", "openvino", "_openvino_model", supports_batch=True, requires=("openvino",),
+                                 export_kwargs={"dynamic": True}),
+    # ONNX cuantizado a INT8 con calibración sobre frames de uploads/ (utils/quantization.py)
+    "onnx-int8": InferenceBackend("onnx-int8", "onnx", "_int8.onnx", supports_batch=True, requires=("onnxruntime",),
+                                  exporter="utils.quantization:quantize_int8"),
+}
+
+
+def get_backend(name: Optional[str] = None) -> InferenceBackend:
+    """Devuelve la descripción del backend pedido (o el configurado por defecto)."""
+    name = (name or DEFAULT_BACKEND).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Backend de inferencia desconocido: '{name}'. Opciones: {list(BACKENDS)}")
+    return BACKENDS[name]
+
+
+def export_backend(name: str, weights_path: str, force: bool = False, **overrides) -> str:
+    """
+    Construye el artefacto del backend a partir de best.pt y devuelve su ruta.
+    Si el artefacto ya existe y no se pide `force`, se reutiliza.
+    """
+    from ultralytics import YOLO
+
+    backend = get_backend(name)
+    artifact = backend.artifact_path(weights_path)
+    if backend.export_format is None:
+        return artifact
+    if os.path.exists(artifact) and not force:
+        print(f"ℹ️ Artefacto {backend.name} ya existe: {artifact}")
+        return artifact
+
+    if backend.exporter:
+        module_name, function_name = backend.exporter.split(":")
+        exporter = getattr(importlib.import_module(module_name), function_name)
+        return exporter(weights_path, force=force, **overrides)
+
+    print(f"🔧 Exportando {os.path.basename(weights_path)} a {backend.name}...")
+    export_kwargs = {**backend.export_kwargs, **overrides}
+    exported = YOLO(weights_path).export(format=backend.export_format, **export_kwargs)
+    exported = str(exported)
+    if os.path.abspath(exported) != os.path.abspath(artifact):
+        # Algunos formatos (p. ej. con int8) usan otro nombre; se respeta lo que devuelve YOLO
+        artifact = exported
+    print(f"✅ Artefacto {backend.name} generado: {artifact}")
+    return artifact
+
+
+def load_backend_model(name: str, weights_path: str):
+    """Carga el modelo YOLO sobre el artefacto del backend indicado."""
+    from ultralytics import YOLO
+
+    backend = get_backend(name)
+    missing = backend.missing_requirements()
+    if missing:
+        raise ImportError(f"El backend '{backend.name}' requiere los paquetes: {', '.join(missing)}")
+
+    artifact = backend.artifact_path(weights_path)
+    if not os.path.exists(artifact):
+        raise FileNotFoundError(
+            f"No existe el artefacto del backend '{backend.name}' en {artifact}. "
+            f"Generarlo con: python scripts/export_backends.py --backends {backend.name}")
+
+    if backend.export_format is None:
+        return YOLO(artifact)
+    return YOLO(artifact, task="detect")
+
+
+def compare_detections(reference: Dict[str, Any], candidate: Dict[str, Any],
+                       conf_tol: float = 0.05, bbox_tol: float = 4.0) -> List[str]:
+    """
+    Compara dos salidas de detect_objects_unified y devuelve la lista de diferencias
+    (vacía si son equivalentes dentro de las tolerancias).
+    """
+    differences = []
+    for key in ('numero_detectado', 'modelo_ladrillo'):
+        if reference.get(key) != candidate.get(key):
+            differences.append(f"{key}: {reference.get(key)!r} != {candidate.get(key)!r}")
+
+    for key in ('confianza_numero', 'confianza_ladrillo', 'confianza_vagoneta'):
+        ref_val, cand_val = reference.get(key), candidate.get(key)
+        if (ref_val is None) != (cand_val is None):
+            differences.append(f"{key}: {ref_val!r} != {cand_val!r}")
+        elif ref_val is not None and abs(float(ref_val) - float(cand_val)) > conf_tol:
+            differences.append(f"{key}: {float(ref_val):.3f} vs {float(cand_val):.3f}")
+
+    for key in ('bbox_numero', 'bbox_ladrillo', 'bbox_vagoneta'):
+        ref_box, cand_box = reference.get(key), candidate.get(key)
+        if (ref_box is None) != (cand_box is None):
+            differences.append(f"{key}: {ref_box!r} != {cand_box!r}")
+        elif ref_box is not None:
+            delta = np.max(np.abs(np.asarray(ref_box, dtype=np.float32) - np.asarray(cand_box, dtype=np.float32)))
+            if delta > bbox_tol:
+                differences.append(f"{key}: desplazamiento máximo {delta:.1f}px")
+    return differences
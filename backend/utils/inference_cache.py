@@ -0,0 +1,116 @@
+"""
+Caché acotada de resultados de inferencia.
+
+La misma imagen llega varias veces: re-subidas por /upload/ y /upload-multiple/, y cámaras
+en demo_mode con loop_video que repiten exactamente los mismos frames en cada vuelta. Los
+resultados se guardan por:
+    - hash del contenido (bytes del frame decodificado o del archivo subido), o
+    - una clave explícita, p. ej. (ruta del video, mtime, índice de frame) para videos en bucle.
+
+Cada entrada caduca a los `ttl_seconds` y, al superar `max_entries`, se expulsa la menos
+usada recientemente (LRU). `invalidate()` vacía la caché y sube la generación, de modo que
+los resultados de inferencias lanzadas con el modelo anterior tampoco se guardan.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+import numpy as np
+
+DEFAULT_CACHE_SIZE = int(os.getenv("INFERENCE_CACHE_SIZE", 512))       # 0 = desactivada
+DEFAULT_CACHE_TTL = float(os.getenv("INFERENCE_CACHE_TTL", 600))       # segundos
+
+
+def frame_digest(frame: np.ndarray) -> str:
+    """Hash del contenido de un frame (incluye forma y tipo para no confundir buffers iguales)."""
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(f"{frame.shape}|{frame.dtype}".encode())
+    hasher.update(np.ascontiguousarray(frame).data)
+    return hasher.hexdigest()
+
+
+def bytes_digest(data: bytes) -> str:
+    """Hash del contenido de un archivo ya leído (p. ej. una imagen subida)."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class InferenceResultCache:
+    """LRU con TTL y contadores; segura entre hilos."""
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_SIZE, ttl_seconds: float = DEFAULT_CACHE_TTL):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl_seconds = float(ttl_seconds)
+        self.generation = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # clave -> (expira_en, resultado)
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        """Devuelve una copia del resultado guardado, o None (y cuenta un fallo)."""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                self.stats['expirations'] += 1
+                entry = None
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return dict(entry[1])
+
+    def put(self, key: Hashable, result: Dict[str, Any], generation: Optional[int] = None):
+        """Guarda un resultado; se descarta si se calculó antes de la última invalidación."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, dict(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def invalidate(self, reason: str = ""):
+        """Vacía la caché (p. ej. al cambiar el modelo)."""
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+            self.stats['invalidations'] += 1
+        if reason:
+            print(f"ℹ️ Caché de inferencia invalidada: {reason}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['max_entries'] = self.max_entries
+        stats['ttl_seconds'] = self.ttl_seconds
+        return stats
+
+
+# Caché compartida por todos los llamadores del proceso
+_inference_cache: Optional[InferenceResultCache] = None
+_cache_lock = threading.Lock()
+
+def get_inference_cache() -> InferenceResultCache:
+    global _inference_cache
+    with _cache_lock:
+        if _inference_cache is None:
+            _inference_cache = InferenceResultCache()
+        return _inference_cache
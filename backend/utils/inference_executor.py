@@ -0,0 +1,212 @@
+"""
+Ejecutor dedicado de inferencia.
+
+Saca las llamadas síncronas a PyTorch del event loop de asyncio y las reparte entre un pool
+de réplicas del modelo, de modo que dos llamadas concurrentes nunca comparten la misma
+instancia de `YOLO`.
+
+Modos (variable de entorno INFERENCE_EXECUTOR):
+    - "thread":  ThreadPoolExecutor + pool de réplicas ImageProcessor en el mismo proceso.
+    - "process": ProcessPoolExecutor; cada proceso carga su propia réplica del modelo.
+    - "shm":     SharedMemoryWorkerPool (utils/inference_workers.py); procesos con frames en
+                 memoria compartida, fijación de núcleos y relanzamiento automático.
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_EXECUTOR_MODE = os.getenv("INFERENCE_EXECUTOR", "thread").lower()
+DEFAULT_INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", 2))
+DEFAULT_WARMUP_TIMEOUT = float(os.getenv("INFERENCE_WARMUP_TIMEOUT", 300))  # Segundos para cargar y calentar
+
+EXECUTOR_MODES = ("thread", "process", "shm")
+
+
+class ModelReplicaPool:
+    """Pool de réplicas del modelo; cada réplica la usa un solo hilo a la vez."""
+
+    def __init__(self, factory: Callable[[], Any], size: int, initial: Optional[List[Any]] = None):
+        self._factory = factory
+        self.size = max(1, int(size))
+        self._idle: "queue.Queue[Any]" = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+        for replica in (initial or [])[:self.size]:
+            self._idle.put(replica)
+            self._created += 1
+
+    @contextmanager
+    def acquire(self):
+        """Presta una réplica libre; crea una nueva si aún no se alcanzó el tamaño del pool."""
+        replica = self._get_replica()
+        try:
+            yield replica
+        finally:
+            self._idle.put(replica)
+
+    def _get_replica(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+                replica_number = self._created
+        if create:
+            try:
+                print(f"ℹ️ Creando réplica del modelo {replica_number}/{self.size}")
+                return self._factory()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get()
+
+    def warm_all(self, fn: Callable[[Any], Any]):
+        """Crea todas las réplicas que falten y ejecuta `fn` sobre cada una (calentamiento)."""
+        replicas = []
+        try:
+            for _ in range(self.size):
+                replicas.append(self._get_replica())
+            for replica in replicas:
+                fn(replica)
+        finally:
+            for replica in replicas:
+                self._idle.put(replica)
+
+    @property
+    def created(self) -> int:
+        return self._created
+
+
+# ----------------------------------------------------------------------
+# Modo "process": cada proceso del pool mantiene su propia réplica
+# ----------------------------------------------------------------------
+_process_replicas: Dict[Any, Any] = {}
+
+
+def _get_process_replica(backend: Optional[str] = None, model_path: Optional[str] = None):
+    # Importación diferida: el módulo se resuelve dentro del proceso hijo
+    from utils.image_processing import ImageProcessor, get_processor
+    if backend is None and model_path is None:
+        return get_processor()
+    key = (backend, model_path)
+    if key not in _process_replicas:
+        _process_replicas[key] = ImageProcessor(model_path, backend=backend)
+    return _process_replicas[key]
+
+
+def _process_detect_batch(frames: List[np.ndarray], umbral_agrupacion: int,
+                          backend: Optional[str] = None, min_confidence: Optional[float] = None,
+                          model_path: Optional[str] = None, tiling: Optional[tuple] = None) -> List[Dict[str, Any]]:
+    return _get_process_replica(backend, model_path).detect_objects_batch(frames, umbral_agrupacion, min_confidence, tiling)
+
+
+class InferenceExecutor:
+    """Ejecuta lotes de inferencia fuera del event loop, en hilos o procesos."""
+
+    def __init__(self,
+                 replica_factory: Callable[[], Any],
+                 mode: str = DEFAULT_EXECUTOR_MODE,
+                 workers: int = DEFAULT_INFERENCE_WORKERS,
+                 primary_replica: Optional[Any] = None,
+                 backend: Optional[str] = None,
+                 model_path: Optional[str] = None):
+        """
+        Args:
+            replica_factory: Crea una nueva réplica (ImageProcessor) para el modo "thread".
+            mode: "thread", "process" o "shm".
+            workers: Número de hilos/procesos y, por tanto, de réplicas del modelo.
+            primary_replica: Réplica ya cargada que se reutiliza como la primera del pool.
+            backend: Backend de inferencia que cargan las réplicas de los modos "process" y "shm".
+            model_path: Pesos que cargan esas réplicas (None = versión activa del registro).
+        """
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Modo de ejecutor de inferencia inválido: '{mode}'. Opciones: {EXECUTOR_MODES}")
+
+        self.mode = mode
+        self.workers = max(1, int(workers))
+        self.backend = backend
+        self.model_path = model_path
+
+        if mode == "shm":
+            from .inference_workers import SharedMemoryWorkerPool
+            self._pool = None
+            self._executor = SharedMemoryWorkerPool(self.workers, backend=backend, model_path=model_path)
+        elif mode == "process":
+            self._pool = None
+            # "spawn" evita heredar por fork el estado de hilos de PyTorch del proceso padre
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_get_process_replica,
+                initargs=(backend, model_path)
+            )
+        else:
+            initial = [primary_replica] if primary_replica is not None else None
+            self._pool = ModelReplicaPool(replica_factory, self.workers, initial)
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+
+        print(f"ℹ️ Ejecutor de inferencia listo (modo={self.mode}, workers={self.workers}, backend={backend or 'por defecto'})")
+
+    def submit_batch(self, frames: List[np.ndarray], umbral_agrupacion: int = 50,
+                     min_confidence: Optional[float] = None, tiling: Optional[tuple] = None) -> Future:
+        """Programa un lote y devuelve un Future con la lista de resultados."""
+        if self.mode == "shm":
+            return self._executor.submit_batch(frames, umbral_agrupacion, min_confidence, tiling)
+        if self.mode == "process":
+            return self._executor.submit(_process_detect_batch, frames, umbral_agrupacion,
+                                         self.backend, min_confidence, self.model_path, tiling)
+        return self._executor.submit(self._thread_detect_batch, frames, umbral_agrupacion, min_confidence, tiling)
+
+    def warmup(self, frames: List[np.ndarray], umbral_agrupacion: int = 50,
+               timeout: Optional[float] = DEFAULT_WARMUP_TIMEOUT):
+        """
+        Ejecuta `frames` en todas las réplicas para que ninguna atienda tráfico real en frío
+        (carga del modelo, JIT y reserva de memoria del primer pase). TimeoutError si no lo
+        logran en `timeout` segundos (None = sin límite).
+        """
+        if self.mode == "thread":
+            # En un hilo del ejecutor para poder esperar con límite; si vence, termina en segundo plano
+            future = self._executor.submit(
+                self._pool.warm_all, lambda replica: replica.detect_objects_batch(frames, umbral_agrupacion))
+            future.result(timeout)
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if self.mode == "shm" and not self._executor.wait_ready(timeout):
+            raise TimeoutError(f"Los workers de inferencia no terminaron de cargar el modelo en {timeout:.0f}s")
+        # Un lote por worker en paralelo: el pool los reparte entre procesos
+        futures = [self.submit_batch(frames, umbral_agrupacion) for _ in range(self.workers)]
+        for future in futures:
+            future.result(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def _thread_detect_batch(self, frames: List[np.ndarray], umbral_agrupacion: int,
+                             min_confidence: Optional[float] = None,
+                             tiling: Optional[tuple] = None) -> List[Dict[str, Any]]:
+        with self._pool.acquire() as replica:
+            return replica.detect_objects_batch(frames, umbral_agrupacion, min_confidence, tiling)
+
+    def get_status(self) -> Dict[str, Any]:
+        status = {
+            "mode": self.mode,
+            "workers": self.workers,
+            "backend": self.backend,
+            "model_path": self.model_path,
+            "replicas_loaded": self._pool.created if self._pool else self.workers
+        }
+        if self.mode == "shm":
+            status["shm_pool"] = self._executor.get_status()
+        return status
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
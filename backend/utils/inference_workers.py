@@ -0,0 +1,480 @@
+"""
+Pool de procesos de inferencia con transporte de frames por memoria compartida.
+
+Cada proceso worker carga su propia copia de `best.pt`, de modo que el post-procesamiento en
+Python (agrupación de dígitos en number_grouping.py) escala con los núcleos en lugar de
+competir por el GIL. Los frames viajan al worker escritos en "slots" de un anillo
+`multiprocessing.shared_memory` (sin pickle del array) y los resultados vuelven como
+structs binarios pequeños (cabecera fija y textos con su longitud).
+
+El proceso padre:
+    - asigna slots libres del anillo y reparte los lotes entre workers (el menos cargado);
+    - recoge los resultados en un hilo y resuelve los Futures;
+    - vigila los workers y relanza automáticamente los que mueren, fallando sólo los lotes
+      que ese worker tenía en curso. Un worker que muere `INFERENCE_WORKER_MAX_FAILED_STARTS`
+      veces seguidas sin cargar el modelo (pesos dañados, falta de memoria) no se relanza más:
+      `wait_ready` falla en lugar de esperar para siempre.
+"""
+
+import multiprocessing
+import os
+import queue
+import struct
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_SHM_SLOT_BYTES = int(float(os.getenv("INFERENCE_SHM_SLOT_MB", 6.3)) * 1024 * 1024)  # ~1080p BGR
+DEFAULT_SHM_SLOTS_PER_WORKER = int(os.getenv("INFERENCE_SHM_SLOTS_PER_WORKER", 8))
+DEFAULT_PIN_CORES = os.getenv("INFERENCE_PIN_CORES", "true").lower() in ("1", "true", "yes")
+# Relanzamientos seguidos de un worker que muere sin llegar a cargar el modelo antes de darlo por perdido
+DEFAULT_MAX_FAILED_STARTS = int(os.getenv("INFERENCE_WORKER_MAX_FAILED_STARTS", 3))
+
+_WORKER_STOP = None
+
+# ----------------------------------------------------------------------
+# Resultados como structs pequeños
+# ----------------------------------------------------------------------
+# Cabecera fija + textos de longitud variable (número y modelo de ladrillo, UTF-8 sin recortar):
+# flags | len_numero | len_ladrillo | conf_numero | bbox_numero(4) | conf_ladrillo | bbox_ladrillo(4) | conf_vagoneta | bbox_vagoneta(4)
+# Confianzas y cajas en float64: el resultado es idéntico al del modo hilo (0.9 vuelve como 0.9)
+_RESULT_HEADER = struct.Struct("<BHHd4id4dd4d")
+
+_HAS_RESULT = 1
+_HAS_NUMERO = 2
+_HAS_LADRILLO = 4
+_HAS_VAGONETA = 8
+_BBOX_FLOAT64 = 16   # Las cajas de ladrillo/vagoneta venían en float64 (por defecto float32, como YOLO)
+
+
+def pack_detection(result: Dict[str, Any]) -> bytes:
+    """Serializa el diccionario de detect_objects_unified: cabecera fija y textos con su longitud."""
+    if not result:
+        return _RESULT_HEADER.pack(0, 0, 0, 0.0, 0, 0, 0, 0, 0.0, 0, 0, 0, 0, 0.0, 0, 0, 0, 0)
+
+    flags = _HAS_RESULT
+    numero = result.get('numero_detectado')
+    bbox_numero = result.get('bbox_numero') or (0, 0, 0, 0)
+    if numero:
+        flags |= _HAS_NUMERO
+
+    ladrillo = result.get('modelo_ladrillo')
+    bbox_ladrillo = result.get('bbox_ladrillo')
+    if ladrillo:
+        flags |= _HAS_LADRILLO
+    else:
+        bbox_ladrillo = (0, 0, 0, 0)
+
+    bbox_vagoneta = result.get('bbox_vagoneta')
+    if bbox_vagoneta is not None:
+        flags |= _HAS_VAGONETA
+    else:
+        bbox_vagoneta = (0, 0, 0, 0)
+    if any(getattr(b, 'dtype', None) == np.float64 for b in (bbox_ladrillo, bbox_vagoneta)):
+        flags |= _BBOX_FLOAT64
+
+    numero_bytes = str(numero or "").encode("utf-8")
+    ladrillo_bytes = str(ladrillo or "").encode("utf-8")
+    if len(numero_bytes) > 0xFFFF or len(ladrillo_bytes) > 0xFFFF:
+        raise ValueError("Número o modelo de ladrillo demasiado largo para el resultado empaquetado")
+    return _RESULT_HEADER.pack(
+        flags,
+        len(numero_bytes),
+        len(ladrillo_bytes),
+        float(result.get('confianza_numero') or 0.0),
+        *(int(v) for v in bbox_numero),
+        float(result.get('confianza_ladrillo') or 0.0),
+        *(float(v) for v in bbox_ladrillo),
+        float(result.get('confianza_vagoneta') or 0.0),
+        *(float(v) for v in bbox_vagoneta),
+    ) + numero_bytes + ladrillo_bytes
+
+
+def unpack_detection(data: bytes) -> Dict[str, Any]:
+    """Reconstruye el diccionario de detect_objects_unified a partir de pack_detection."""
+    values = _RESULT_HEADER.unpack_from(data)
+    flags = values[0]
+    if not flags & _HAS_RESULT:
+        return {}
+    numero_end = _RESULT_HEADER.size + values[1]
+    ladrillo_end = numero_end + values[2]
+    bbox_dtype = np.float64 if flags & _BBOX_FLOAT64 else np.float32
+
+    result = {
+        'numero_detectado': None,
+        'confianza_numero': None,
+        'bbox_numero': None,
+        'modelo_ladrillo': None,
+        'confianza_ladrillo': None,
+        'bbox_ladrillo': None,
+        'bbox_vagoneta': None,
+        'confianza_vagoneta': None,
+    }
+    if flags & _HAS_NUMERO:
+        result['numero_detectado'] = data[_RESULT_HEADER.size:numero_end].decode("utf-8")
+        result['confianza_numero'] = values[3]
+        result['bbox_numero'] = tuple(values[4:8])
+    if flags & _HAS_LADRILLO:
+        result['modelo_ladrillo'] = data[numero_end:ladrillo_end].decode("utf-8")
+        result['confianza_ladrillo'] = values[8]
+        result['bbox_ladrillo'] = np.array(values[9:13], dtype=bbox_dtype)
+    if flags & _HAS_VAGONETA:
+        result['confianza_vagoneta'] = values[13]
+        result['bbox_vagoneta'] = np.array(values[14:18], dtype=bbox_dtype)
+    return result
+
+
+# ----------------------------------------------------------------------
+# Anillo de slots en memoria compartida
+# ----------------------------------------------------------------------
+class SharedFrameRing:
+    """Bloque de memoria compartida dividido en slots de tamaño fijo para frames."""
+
+    def __init__(self, num_slots: int, slot_bytes: int = DEFAULT_SHM_SLOT_BYTES):
+        self.num_slots = max(1, int(num_slots))
+        self.slot_bytes = int(slot_bytes)
+        self.shm = shared_memory.SharedMemory(create=True, size=self.num_slots * self.slot_bytes)
+        self._free: "queue.Queue[int]" = queue.Queue()
+        for slot in range(self.num_slots):
+            self._free.put(slot)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def fits(self, frame: np.ndarray) -> bool:
+        return frame.nbytes <= self.slot_bytes
+
+    def acquire(self, timeout: Optional[float] = None) -> int:
+        """Reserva un slot libre (bloquea si el anillo está lleno: contrapresión)."""
+        return self._free.get(timeout=timeout)
+
+    def release(self, slot: int):
+        self._free.put(slot)
+
+    def write(self, slot: int, frame: np.ndarray) -> Tuple[int, Tuple[int, ...], str]:
+        """Copia el frame al slot y devuelve el descriptor (slot, shape, dtype) para el worker."""
+        view = np.ndarray(frame.shape, dtype=frame.dtype, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+        view[...] = frame
+        return slot, frame.shape, frame.dtype.str
+
+    def free_slots(self) -> int:
+        return self._free.qsize()
+
+    def close(self):
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+# ----------------------------------------------------------------------
+# Proceso worker
+# ----------------------------------------------------------------------
+def _pin_to_cores(worker_index: int, cores: Optional[List[int]]):
+    if not cores:
+        return
+    if not hasattr(os, "sched_setaffinity"):
+        print(f"⚠️ Worker {worker_index}: fijación de núcleos no soportada en esta plataforma.")
+        return
+    try:
+        os.sched_setaffinity(0, cores)
+        import torch
+        torch.set_num_threads(len(cores))
+        print(f"📌 Worker de inferencia {worker_index} fijado a núcleos {cores}")
+    except Exception as e:
+        print(f"⚠️ Worker {worker_index}: no se pudo fijar a núcleos {cores}: {e}")
+
+
+def _worker_main(worker_index: int, shm_name: str, slot_bytes: int,
+                 task_queue, result_queue, cores: Optional[List[int]], backend: Optional[str] = None,
+                 model_path: Optional[str] = None):
+    """Bucle del proceso worker: lee frames del anillo, detecta y devuelve structs."""
+    _pin_to_cores(worker_index, cores)
+    try:
+        # El anillo pertenece al padre: el worker no debe registrarlo para limpieza (Python 3.13+)
+        shm = shared_memory.SharedMemory(name=shm_name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        # Importación diferida: cada proceso carga su propia réplica del modelo
+        from utils.inference_executor import _get_process_replica
+        processor = _get_process_replica(backend, model_path)
+        result_queue.put(("ready", worker_index, os.getpid()))
+
+        while True:
+            task = task_queue.get()
+            if task is _WORKER_STOP:
+                break
+            task_id, descriptors, umbral_agrupacion, min_confidence, tiling = task
+            try:
+                frames = []
+                for descriptor in descriptors:
+                    if descriptor[0] == "inline":  # Frame demasiado grande para un slot
+                        frames.append(descriptor[1])
+                        continue
+                    slot, shape, dtype = descriptor
+                    view = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=slot * slot_bytes)
+                    # Copia privada: el slot se libera en cuanto el padre recibe el resultado
+                    frames.append(view.copy())
+                results = processor.detect_objects_batch(frames, umbral_agrupacion, min_confidence, tiling)
+                result_queue.put(("result", task_id, [pack_detection(r) for r in results]))
+            except Exception as e:
+                result_queue.put(("error", task_id, f"{type(e).__name__}: {e}"))
+    finally:
+        shm.close()
+
+
+# ----------------------------------------------------------------------
+# Pool (lado del proceso padre)
+# ----------------------------------------------------------------------
+class _WorkerHandle:
+    def __init__(self, index: int, cores: Optional[List[int]]):
+        self.index = index
+        self.cores = cores
+        self.process: Optional[multiprocessing.Process] = None
+        self.task_queue = None
+        self.inflight: Dict[int, Tuple[Future, List[int]]] = {}
+        self.ready = False
+        self.restarts = 0
+        self.failed_starts = 0   # Muertes seguidas antes de cargar el modelo
+        self.failed = False      # Superó el máximo de arranques fallidos: no se relanza
+        self.last_exitcode: Optional[int] = None
+
+
+class SharedMemoryWorkerPool:
+    """N procesos de inferencia alimentados por un anillo de memoria compartida."""
+
+    def __init__(self,
+                 workers: int,
+                 slots_per_worker: int = DEFAULT_SHM_SLOTS_PER_WORKER,
+                 slot_bytes: int = DEFAULT_SHM_SLOT_BYTES,
+                 pin_cores: bool = DEFAULT_PIN_CORES,
+                 monitor_interval: float = 1.0,
+                 backend: Optional[str] = None,
+                 model_path: Optional[str] = None,
+                 max_failed_starts: int = DEFAULT_MAX_FAILED_STARTS):
+        self.workers = max(1, int(workers))
+        self.max_failed_starts = max(1, int(max_failed_starts))
+        self.backend = backend
+        self.model_path = model_path
+        self._ctx = multiprocessing.get_context("spawn")
+        self.ring = SharedFrameRing(self.workers * max(1, int(slots_per_worker)), slot_bytes)
+        self._result_queue = self._ctx.Queue()
+        self._lock = threading.Lock()
+        self._next_task_id = 0
+        self._running = True
+        self.stats = {'tasks': 0, 'frames_via_shm': 0, 'frames_inline': 0, 'worker_restarts': 0, 'worker_errors': 0}
+
+        core_groups = self._plan_core_groups(self.workers) if pin_cores else [None] * self.workers
+        self._handles = [_WorkerHandle(i, core_groups[i]) for i in range(self.workers)]
+        for handle in self._handles:
+            self._spawn(handle)
+
+        self._collector = threading.Thread(target=self._collect_results, name="shm-inference-results", daemon=True)
+        self._collector.start()
+        self._monitor_interval = monitor_interval
+        self._monitor = threading.Thread(target=self._monitor_workers, name="shm-inference-monitor", daemon=True)
+        self._monitor.start()
+
+    @staticmethod
+    def _plan_core_groups(workers: int) -> List[Optional[List[int]]]:
+        """Reparte los núcleos disponibles en grupos contiguos, uno por worker."""
+        if hasattr(os, "sched_getaffinity"):
+            available = sorted(os.sched_getaffinity(0))
+        else:
+            available = list(range(os.cpu_count() or 1))
+        per_worker = max(1, len(available) // workers)
+        groups = []
+        for i in range(workers):
+            start = (i * per_worker) % len(available)
+            groups.append(available[start:start + per_worker])
+        return groups
+
+    def _spawn(self, handle: _WorkerHandle):
+        handle.task_queue = self._ctx.Queue()
+        handle.ready = False
+        handle.process = self._ctx.Process(
+            target=_worker_main,
+            args=(handle.index, self.ring.name, self.ring.slot_bytes,
+                  handle.task_queue, self._result_queue, handle.cores, self.backend, self.model_path),
+            name=f"inference-worker-{handle.index}",
+            daemon=True
+        )
+        handle.process.start()
+        print(f"🚀 Worker de inferencia {handle.index} lanzado (PID {handle.process.pid})")
+
+    # ------------------------------------------------------------------
+    def submit_batch(self, frames: List[np.ndarray], umbral_agrupacion: int = 50,
+                     min_confidence: Optional[float] = None, tiling: Optional[tuple] = None) -> Future:
+        """Copia los frames al anillo y envía el lote al worker con menos trabajo en curso."""
+        future: Future = Future()
+        slots: List[int] = []
+        descriptors = []
+        try:
+            for frame in frames:
+                if frame is not None and frame.size > 0 and self.ring.fits(frame):
+                    slot = self.ring.acquire()
+                    slots.append(slot)
+                    descriptors.append(self.ring.write(slot, np.ascontiguousarray(frame)))
+                    self.stats['frames_via_shm'] += 1
+                else:
+                    descriptors.append(("inline", frame))
+                    self.stats['frames_inline'] += 1
+
+            with self._lock:
+                task_id = self._next_task_id
+                self._next_task_id += 1
+                # Preferir workers con el modelo ya cargado (p. ej. mientras otro se relanza)
+                usable = [h for h in self._handles if not h.failed]
+                if not usable:
+                    raise RuntimeError(self.failure_reason())
+                candidates = [h for h in usable if h.ready] or usable
+                handle = min(candidates, key=lambda h: len(h.inflight))
+                handle.inflight[task_id] = (future, slots)
+                task_queue = handle.task_queue
+            task_queue.put((task_id, descriptors, umbral_agrupacion, min_confidence, tiling))
+            self.stats['tasks'] += 1
+        except Exception as e:
+            for slot in slots:
+                self.ring.release(slot)
+            future.set_exception(e)
+        return future
+
+    def _pop_task(self, task_id: int) -> Optional[Tuple[Future, List[int]]]:
+        with self._lock:
+            for handle in self._handles:
+                if task_id in handle.inflight:
+                    return handle.inflight.pop(task_id)
+        return None
+
+    def _collect_results(self):
+        while self._running:
+            try:
+                message = self._result_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+
+            kind = message[0]
+            if kind == "ready":
+                _, index, pid = message
+                self._handles[index].ready = True
+                self._handles[index].failed_starts = 0
+                print(f"✅ Worker de inferencia {index} listo (PID {pid})")
+                continue
+
+            entry = self._pop_task(message[1])
+            if entry is None:
+                continue
+            future, slots = entry
+            for slot in slots:
+                self.ring.release(slot)
+            if kind == "result":
+                future.set_result([unpack_detection(packed) for packed in message[2]])
+            else:
+                self.stats['worker_errors'] += 1
+                future.set_exception(RuntimeError(f"Error en worker de inferencia: {message[2]}"))
+
+    def _monitor_workers(self):
+        """Relanza los workers caídos y falla los lotes que tenían en curso."""
+        while self._running:
+            time.sleep(self._monitor_interval)
+            for handle in self._handles:
+                if not self._running or handle.failed or handle.process is None or handle.process.is_alive():
+                    continue
+                exitcode = handle.process.exitcode
+                handle.last_exitcode = exitcode
+                if not handle.ready:
+                    handle.failed_starts += 1
+                with self._lock:
+                    lost = list(handle.inflight.values())
+                    handle.inflight.clear()
+                print(f"💥 Worker de inferencia {handle.index} terminó (exitcode={exitcode}). Lotes perdidos: {len(lost)}")
+                for future, slots in lost:
+                    for slot in slots:
+                        self.ring.release(slot)
+                    if not future.done():
+                        future.set_exception(RuntimeError(f"El worker de inferencia {handle.index} se cayó (exitcode={exitcode})"))
+                if handle.failed_starts >= self.max_failed_starts:
+                    handle.failed = True
+                    print(f"❌ Worker de inferencia {handle.index} no logró cargar el modelo en "
+                          f"{handle.failed_starts} intentos seguidos; no se relanza más")
+                    continue
+                handle.restarts += 1
+                self.stats['worker_restarts'] += 1
+                try:
+                    self._spawn(handle)
+                except Exception as e:
+                    print(f"❌ No se pudo relanzar el worker {handle.index}: {e}")
+                    traceback.print_exc()
+
+    def failure_reason(self) -> str:
+        failed = [f"{h.index} (exitcode={h.last_exitcode})" for h in self._handles if h.failed]
+        return (f"Workers de inferencia sin poder cargar el modelo tras {self.max_failed_starts} "
+                f"intentos: {', '.join(failed)}")
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """
+        Espera a que todos los workers hayan cargado su modelo (True si lo lograron a tiempo).
+        Lanza RuntimeError si alguno superó el máximo de arranques fallidos.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not all(h.ready for h in self._handles):
+            if any(h.failed for h in self._handles):
+                raise RuntimeError(self.failure_reason())
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    # ------------------------------------------------------------------
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "workers": [
+                {
+                    "index": h.index,
+                    "pid": h.process.pid if h.process else None,
+                    "alive": bool(h.process and h.process.is_alive()),
+                    "ready": h.ready,
+                    "cores": h.cores,
+                    "inflight": len(h.inflight),
+                    "restarts": h.restarts,
+                    "failed": h.failed
+                }
+                for h in self._handles
+            ],
+            "shm_slots_total": self.ring.num_slots,
+            "shm_slots_free": self.ring.free_slots(),
+            "shm_slot_bytes": self.ring.slot_bytes,
+            **self.stats
+        }
+
+    def shutdown(self, wait: bool = True):
+        self._running = False
+        for handle in self._handles:
+            try:
+                handle.task_queue.put(_WORKER_STOP)
+            except Exception:
+                pass
+        for handle in self._handles:
+            if handle.process is None:
+                continue
+            handle.process.join(timeout=5 if wait else 0.1)
+            if handle.process.is_alive():
+                handle.process.terminate()
+        with self._lock:
+            pending = [entry for h in self._handles for entry in h.inflight.values()]
+            for h in self._handles:
+                h.inflight.clear()
+        for future, _ in pending:
+            if not future.done():
+                future.set_exception(RuntimeError("Pool de inferencia detenido"))
+        self.ring.close()
@@ -0,0 +1,223 @@
+"""
+Registro de versiones del modelo y umbrales de inferencia ajustables en caliente.
+
+Cada versión es un directorio dentro de MODEL_REGISTRY_DIR con su best.pt (y, si se
+exportan, los artefactos de los demás backends a su lado); los metadatos de cada versión
+se guardan en registry.json:
+
+    versions/
+        registry.json            # {"active": "v20250101-120000",
+                                 #  "versions": {"v20250101-120000": {"created_at": ..., "metadata": {...}}}}
+        v20250101-120000/
+            best.pt
+            best.onnx
+            data.yaml            # Copiado de junto a los pesos originales, si existe
+
+La versión "training" apunta siempre a training/best.pt (el modelo entrenado con train.py)
+y es la activa mientras no se registre y active otra. MODEL_VERSION fuerza la versión
+activa al arrancar.
+
+El cambio de versión en caliente (carga, calentamiento y cambio atómico de ejecutores) lo
+hace `swap_model` en utils/image_processing.py; aquí solo se guarda qué versión está activa.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .inference_backends import DEFAULT_WEIGHTS_PATH
+
+DEFAULT_REGISTRY_DIR = Path(os.getenv(
+    "MODEL_REGISTRY_DIR", str(Path(DEFAULT_WEIGHTS_PATH).parent.parent / "versions")))
+BASE_VERSION = "training"
+# Parámetros de train.py para la versión base (no está en registry.json)
+BASE_METADATA = {"training_epochs": 150, "imgsz": 1280, "notes": "Modelo entrenado con training/train.py"}
+
+DEFAULT_MIN_CONFIDENCE = float(os.getenv("MIN_CONFIDENCE", 0.15))
+DEFAULT_GROUPING_THRESHOLD = int(os.getenv("GROUPING_THRESHOLD", 50))
+
+
+def _read_classes_count(weights_path: str) -> Optional[int]:
+    """`nc` del data.yaml que acompaña a los pesos, si existe (sin cargar el modelo)."""
+    data_yaml = Path(weights_path).parent / "data.yaml"
+    if not data_yaml.exists():
+        return None
+    try:
+        for line in data_yaml.read_text(encoding="utf-8").splitlines():
+            if line.startswith("nc:"):
+                return int(line.split(":", 1)[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class ModelVersion:
+    """Una versión registrada de los pesos del detector."""
+
+    def __init__(self, version: str, weights_path: str, metadata: Optional[Dict[str, Any]] = None,
+                 created_at: Optional[float] = None):
+        self.version = version
+        self.weights_path = weights_path
+        self.metadata = metadata or {}
+        self.created_at = created_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        exists = os.path.exists(self.weights_path)
+        return {
+            "version": self.version,
+            "weights_path": self.weights_path,
+            "available": exists,
+            "size_mb": round(os.path.getsize(self.weights_path) / (1024 * 1024), 2) if exists else None,
+            "classes_count": self.metadata.get("classes_count", _read_classes_count(self.weights_path)),
+            "created_at": self.created_at,
+            "metadata": self.metadata,
+        }
+
+
+class ModelRegistry:
+    """Versiones disponibles y versión activa, persistidas en registry.json."""
+
+    def __init__(self, root: Path = DEFAULT_REGISTRY_DIR):
+        self.root = Path(root)
+        self.index_path = self.root / "registry.json"
+        self._lock = threading.Lock()
+        self._index = self._load()
+        self._active = self._index["active"]
+        forced = os.getenv("MODEL_VERSION")
+        if forced:
+            if forced not in self._versions():
+                raise ValueError(f"MODEL_VERSION='{forced}' no está registrada en {self.root}")
+            self._active = forced
+
+    def _load(self) -> Dict[str, Any]:
+        if not self.index_path.exists():
+            return {"active": BASE_VERSION, "versions": {}}
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            data.setdefault("active", BASE_VERSION)
+            data.setdefault("versions", {})
+            return data
+        except Exception as e:
+            print(f"⚠️ No se pudo leer {self.index_path}: {e}")
+            return {"active": BASE_VERSION, "versions": {}}
+
+    def _save(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def _versions(self) -> Dict[str, ModelVersion]:
+        # Se relee el índice: scripts/register_model.py puede registrar versiones con el servidor en marcha
+        self._index["versions"] = self._load()["versions"]
+        versions = {BASE_VERSION: ModelVersion(BASE_VERSION, DEFAULT_WEIGHTS_PATH, dict(BASE_METADATA))}
+        for name, entry in self._index["versions"].items():
+            versions[name] = ModelVersion(name, str(self.root / name / "best.pt"),
+                                          entry.get("metadata"), entry.get("created_at"))
+        return versions
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+    @property
+    def active_version(self) -> str:
+        return self._active
+
+    def list_versions(self) -> List[ModelVersion]:
+        with self._lock:
+            return list(self._versions().values())
+
+    def get(self, version: Optional[str] = None) -> ModelVersion:
+        """Devuelve la versión pedida (o la activa)."""
+        with self._lock:
+            versions = self._versions()
+            version = version or self._active
+            if version not in versions:
+                raise KeyError(f"Versión de modelo desconocida: '{version}'. Opciones: {list(versions)}")
+            return versions[version]
+
+    def register(self, weights_path: str, version: Optional[str] = None,
+                 metadata: Optional[Dict[str, Any]] = None) -> ModelVersion:
+        """Copia unos pesos al registro como versión nueva (no la activa)."""
+        if not os.path.exists(weights_path):
+            raise FileNotFoundError(f"No existe el archivo de pesos: {weights_path}")
+        version = version or time.strftime("v%Y%m%d-%H%M%S")
+        with self._lock:
+            if version in self._versions():
+                raise ValueError(f"La versión '{version}' ya está registrada")
+            target_dir = self.root / version
+            target_dir.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(weights_path, target_dir / "best.pt")
+            data_yaml = Path(weights_path).parent / "data.yaml"
+            if data_yaml.exists():
+                shutil.copy2(data_yaml, target_dir / "data.yaml")
+            self._index["versions"][version] = {"created_at": time.time(), "metadata": metadata or {}}
+            self._save()
+        print(f"✅ Modelo registrado como versión '{version}'")
+        return self.get(version)
+
+    def set_active(self, version: str):
+        """Marca la versión como activa (la llama swap_model tras el cambio en caliente)."""
+        with self._lock:
+            if version not in self._versions():
+                raise KeyError(f"Versión de modelo desconocida: '{version}'")
+            self._active = self._index["active"] = version
+            self._save()
+
+
+class InferenceSettings:
+    """Umbrales de inferencia que se pueden cambiar sin reiniciar (POST /model/config)."""
+
+    def __init__(self, min_confidence: float = DEFAULT_MIN_CONFIDENCE,
+                 umbral_agrupacion: int = DEFAULT_GROUPING_THRESHOLD):
+        self.min_confidence = min_confidence
+        self.umbral_agrupacion = umbral_agrupacion
+        self._lock = threading.Lock()
+
+    def update(self, min_confidence: Optional[float] = None, umbral_agrupacion: Optional[int] = None) -> bool:
+        """Valida y aplica los cambios; devuelve True si algo cambió."""
+        if min_confidence is not None and not 0.0 < float(min_confidence) < 1.0:
+            raise ValueError("min_confidence debe estar entre 0 y 1")
+        if umbral_agrupacion is not None and int(umbral_agrupacion) <= 0:
+            raise ValueError("umbral_agrupacion debe ser un entero positivo")
+        with self._lock:
+            before = (self.min_confidence, self.umbral_agrupacion)
+            if min_confidence is not None:
+                self.min_confidence = float(min_confidence)
+            if umbral_agrupacion is not None:
+                self.umbral_agrupacion = int(umbral_agrupacion)
+            return before != (self.min_confidence, self.umbral_agrupacion)
+
+    def detection_kwargs(self) -> Dict[str, Any]:
+        """Argumentos por llamada para BatchInferenceService.detect*."""
+        with self._lock:
+            return {"umbral_agrupacion": self.umbral_agrupacion, "min_confidence": self.min_confidence}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self.detection_kwargs()
+
+
+# Registro y umbrales compartidos por el proceso
+_registry: Optional[ModelRegistry] = None
+_settings: Optional[InferenceSettings] = None
+_singleton_lock = threading.Lock()
+
+def get_model_registry() -> ModelRegistry:
+    global _registry
+    with _singleton_lock:
+        if _registry is None:
+            _registry = ModelRegistry()
+        return _registry
+
+def get_inference_settings() -> InferenceSettings:
+    global _settings
+    with _singleton_lock:
+        if _settings is None:
+            _settings = InferenceSettings()
+        return _settings
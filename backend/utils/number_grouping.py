@@ -1,6 +1,104 @@
-import cv2
 import numpy as np
-from typing import List, Dict, Optional, Tuple, Any
+from typing import List, Dict, Optional, Sequence, Tuple, Any
+
+from .annotation import draw_number
+
+# Mapeo basado en las clases del nuevo modelo numeros_enteros (31 clases)
+MAPEO_CLASES = {
+    0: "01", 1: "010", 2: "011", 3: "012", 4: "013", 5: "014", 6: "015", 7: "016", 8: "017", 9: "018",
+    10: "019", 11: "02", 12: "020", 13: "021", 14: "03", 15: "030", 16: "035", 17: "04", 18: "040",
+    19: "05", 20: "050", 21: "06", 22: "060", 23: "07", 24: "070", 25: "08", 26: "080", 27: "085", 28: "09", 29: "094", 30: "125"
+}
+
+TOLERANCIA_VERTICAL = 30  # píxeles entre centros para considerar dos dígitos en la misma línea
+
+def agrupar_numero_compuesto(detecciones: np.ndarray, umbral_agrupacion: int = 50) -> Tuple[Optional[str], Dict[str, Any]]:
+    """
+    Agrupa los dígitos de un array N×6 (x1, y1, x2, y2, conf, cls) en el número compuesto.
+    Envoltorio de un solo frame sobre agrupar_numeros_compuestos_lote.
+
+    Returns:
+        (numero_compuesto, info) con info = {numero, confidence, bbox, detecciones_individuales,
+        grupos_totales}; (None, {}) si no hay detecciones.
+    """
+    return agrupar_numeros_compuestos_lote([detecciones], umbral_agrupacion)[0]
+
+def agrupar_numeros_compuestos_lote(detecciones_por_frame: Sequence[Optional[np.ndarray]],
+                                    umbral_agrupacion: int = 50) -> List[Tuple[Optional[str], Dict[str, Any]]]:
+    """
+    Agrupa los dígitos de muchos frames a la vez: las cajas de todos los frames se concatenan
+    y el orden, los cortes entre grupos y las reducciones por grupo se hacen con una sola
+    pasada de NumPy; solo la composición del texto del grupo ganador es por frame.
+
+    Misma regla que detectar_numero_compuesto_desde_resultados: se ordena por centro X, se
+    corta un grupo cuando la separación horizontal supera `umbral_agrupacion` o la vertical
+    TOLERANCIA_VERTICAL, y gana el grupo con mayor confianza media * (1 + 0.1 * dígitos).
+
+    Returns:
+        Lista alineada con `detecciones_por_frame` de (numero_compuesto, info), como
+        agrupar_numero_compuesto; (None, {}) para los frames sin detecciones.
+    """
+    n_frames = len(detecciones_por_frame)
+    salida: List[Tuple[Optional[str], Dict[str, Any]]] = [(None, {}) for _ in range(n_frames)]
+    conteos = np.array([0 if d is None else len(d) for d in detecciones_por_frame], dtype=np.int64)
+    if conteos.sum() == 0:
+        return salida
+
+    detecciones = np.concatenate([d for d in detecciones_por_frame if d is not None and len(d)])
+    frames = np.repeat(np.arange(n_frames), conteos)
+
+    # int() de las coordenadas trunca; las cajas ya vienen recortadas a >= 0
+    cajas = detecciones[:, :4].astype(np.int64)
+    centros_x = (cajas[:, 0] + cajas[:, 2]) // 2
+
+    # Ordenar por frame y, dentro del frame, de izquierda a derecha (lexsort es estable, como sort())
+    orden = np.lexsort((centros_x, frames))
+    cajas, frames = cajas[orden], frames[orden]
+    confianzas = detecciones[orden, -2].astype(np.float64)
+    clases = detecciones[orden, -1].astype(np.int64)
+    centros_y = (cajas[:, 1] + cajas[:, 3]) // 2
+
+    # Cortes entre cajas consecutivas: cambio de frame, o borde izquierdo actual - borde derecho anterior
+    distancia = cajas[1:, 0] - cajas[:-1, 2]
+    distancia_vertical = np.abs(centros_y[1:] - centros_y[:-1])
+    cortes = (frames[1:] != frames[:-1]) | ~((distancia < umbral_agrupacion) & (distancia_vertical < TOLERANCIA_VERTICAL))
+    inicios = np.concatenate(([0], np.flatnonzero(cortes) + 1))
+    tamanos = np.diff(np.append(inicios, len(cajas)))
+    frame_grupo = frames[inicios]
+
+    # Priorizar grupos con más dígitos y mayor confianza
+    confianza_promedio = np.add.reduceat(confianzas, inicios) / tamanos
+    scores = confianza_promedio * (1 + tamanos * 0.1)
+
+    # Mejor grupo de cada frame: primero por frame y score descendente (empates: el primero, como argmax)
+    orden_grupos = np.lexsort((-scores, frame_grupo))
+    primeros = np.concatenate(([True], frame_grupo[orden_grupos][1:] != frame_grupo[orden_grupos][:-1]))
+    mejores = orden_grupos[primeros]
+    grupos_totales = np.bincount(frame_grupo, minlength=n_frames)
+
+    bbox_x1 = np.minimum.reduceat(cajas[:, 0], inicios)
+    bbox_y1 = np.minimum.reduceat(cajas[:, 1], inicios)
+    bbox_x2 = np.maximum.reduceat(cajas[:, 2], inicios)
+    bbox_y2 = np.maximum.reduceat(cajas[:, 3], inicios)
+
+    # Dentro de cada grupo, los dígitos se componen por borde izquierdo (orden estable)
+    grupo_de_caja = np.repeat(np.arange(len(inicios)), tamanos)
+    clases_compuestas = clases[np.lexsort((cajas[:, 0], grupo_de_caja))]
+
+    for g in mejores:
+        mejor_confianza = float(scores[g])
+        if mejor_confianza <= 0:
+            continue
+        inicio, n_digitos = int(inicios[g]), int(tamanos[g])
+        numero_compuesto = "".join(mapear_clases_a_numeros(int(c)) for c in clases_compuestas[inicio:inicio + n_digitos])
+        salida[int(frame_grupo[g])] = (numero_compuesto, {
+            'numero': numero_compuesto,
+            'confidence': min(mejor_confianza / n_digitos, 1.0),  # Asegurar que nunca sea > 1.0
+            'bbox': (int(bbox_x1[g]), int(bbox_y1[g]), int(bbox_x2[g]), int(bbox_y2[g])),
+            'detecciones_individuales': n_digitos,
+            'grupos_totales': int(grupos_totales[frame_grupo[g]]),
+        })
+    return salida
 
 def detectar_numero_compuesto_desde_resultados(resultados_yolo, frame=None, umbral_agrupacion=50):
     """
@@ -15,91 +113,32 @@ def detectar_numero_compuesto_desde_resultados(resultados_yolo, frame=None, umbr
     Returns:
         tuple: (frame_procesado, numero_compuesto, info_deteccion)
     """
-    detecciones_actuales = []
-
-    # Procesar resultados de YOLO
-    if resultados_yolo and len(resultados_yolo) > 0 and resultados_yolo[0].boxes is not None:
-        for box, cls, conf in zip(resultados_yolo[0].boxes.xyxy, resultados_yolo[0].boxes.cls, resultados_yolo[0].boxes.conf):
-            x1, y1, x2, y2 = map(int, box)
-            detecciones_actuales.append({
-                'bbox': (x1, y1, x2, y2),
-                'class': int(cls),
-                'confidence': float(conf),
-                'x_center': (x1 + x2) // 2,
-                'y_center': (y1 + y2) // 2
-            })
-
-    if not detecciones_actuales:
+    if not resultados_yolo or len(resultados_yolo) == 0 or resultados_yolo[0].boxes is None:
         return frame, None, {}
 
-    # Ordenar de izquierda a derecha para composición correcta
-    detecciones_actuales.sort(key=lambda x: x['x_center'])
-
-    # Agrupar números cercanos
-    grupos = []
-    if detecciones_actuales:
-        grupo_actual = [detecciones_actuales[0]]
-        
-        for i in range(1, len(detecciones_actuales)):
-            # Distancia entre el borde derecho del anterior y el izquierdo del actual
-            distancia = detecciones_actuales[i]['bbox'][0] - detecciones_actuales[i - 1]['bbox'][2]
-            
-            # También verificar distancia vertical para evitar agrupar números de diferentes líneas
-            distancia_vertical = abs(detecciones_actuales[i]['y_center'] - detecciones_actuales[i - 1]['y_center'])
-            
-            if distancia < umbral_agrupacion and distancia_vertical < 30:  # 30 píxeles de tolerancia vertical
-                grupo_actual.append(detecciones_actuales[i])
-            else:
-                grupos.append(grupo_actual)
-                grupo_actual = [detecciones_actuales[i]]
-        grupos.append(grupo_actual)
-
-    # Procesar grupos y encontrar el mejor
-    mejor_grupo = None
-    mejor_confianza = 0
-    
-    for grupo in grupos:
-        confianza_promedio = sum(d['confidence'] for d in grupo) / len(grupo)
-        # Priorizar grupos con más dígitos y mayor confianza
-        score = confianza_promedio * (1 + len(grupo) * 0.1)  # Bonus por más dígitos
-        
-        if score > mejor_confianza:
-            mejor_confianza = score
-            mejor_grupo = grupo
-
-    if not mejor_grupo:
+    detecciones = resultados_yolo[0].boxes.data.cpu().numpy()
+    numero_compuesto, info_deteccion = agrupar_numero_compuesto(detecciones, umbral_agrupacion)
+    if not numero_compuesto:
         return frame, None, {}
 
-    # Mapear clases a números reales usando tu mapeo existente
-    numero_compuesto = "".join(
-        mapear_clases_a_numeros(d['class']) for d in sorted(mejor_grupo, key=lambda x: x['bbox'][0])
-    )
-    
-    # Calcular bbox que engloba todo el grupo
-    x1_min = min(d['bbox'][0] for d in mejor_grupo)
-    y1_min = min(d['bbox'][1] for d in mejor_grupo)
-    x2_max = max(d['bbox'][2] for d in mejor_grupo)
-    y2_max = max(d['bbox'][3] for d in mejor_grupo)
-    bbox_completo = (x1_min, y1_min, x2_max, y2_max)
-
-    # Dibujar en el frame si se proporciona
+    # Dibujar en el frame si se proporciona (el camino de producción no dibuja: ver utils/annotation.py)
     if frame is not None:
-        cv2.rectangle(frame, (x1_min, y1_min), (x2_max, y2_max), (255, 0, 0), 3)
-        cv2.putText(frame, numero_compuesto, (x1_min, y1_min - 10), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2)
-          # Dibujar confianza
-        confianza_texto = f"Conf: {mejor_confianza/len(mejor_grupo):.2f}"
-        cv2.putText(frame, confianza_texto, (x1_min, y2_max + 20), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-
-    info_deteccion = {
-        'numero': numero_compuesto,
-        'confidence': min(mejor_confianza / len(mejor_grupo), 1.0),  # Asegurar que nunca sea > 1.0
-        'bbox': bbox_completo,
-        'detecciones_individuales': len(mejor_grupo),
-        'grupos_totales': len(grupos),
-        'detecciones_raw': detecciones_actuales
-    }
+        draw_number(frame, numero_compuesto, info_deteccion['confidence'], info_deteccion['bbox'])
+
+    # Detalle por caja (solo para esta API de compatibilidad; el camino de producción no lo usa)
+    cajas = detecciones[:, :4].astype(np.int64)
+    centros_x = (cajas[:, 0] + cajas[:, 2]) // 2
+    centros_y = (cajas[:, 1] + cajas[:, 3]) // 2
+    info_deteccion['detecciones_raw'] = [
+        {
+            'bbox': tuple(int(v) for v in cajas[i]),
+            'class': int(detecciones[i, -1]),
+            'confidence': float(detecciones[i, -2]),
+            'x_center': int(centros_x[i]),
+            'y_center': int(centros_y[i])
+        }
+        for i in np.argsort(centros_x, kind='stable')
+    ]
 
     return frame, numero_compuesto, info_deteccion
 
@@ -107,20 +146,14 @@ def mapear_clases_a_numeros(clase_detectada: int) -> str:
     """
     Mapea las clases del modelo YOLO a números reales.
     Basado en tu modelo numeros_enteros existente.
-    """    # Mapeo basado en las clases del nuevo modelo numeros_enteros (31 clases)
-    mapeo_clases = {
-        0: "01", 1: "010", 2: "011", 3: "012", 4: "013", 5: "014", 6: "015", 7: "016", 8: "017", 9: "018",
-        10: "019", 11: "02", 12: "020", 13: "021", 14: "03", 15: "030", 16: "035", 17: "04", 18: "040",
-        19: "05", 20: "050", 21: "06", 22: "060", 23: "07", 24: "070", 25: "08", 26: "080", 27: "085", 28: "09", 29: "094", 30: "125"
-    }
-    
-    return mapeo_clases.get(clase_detectada, str(clase_detectada))
+    """
+    return MAPEO_CLASES.get(clase_detectada, str(clase_detectada))
 
 def aplicar_estabilizacion_video(historial_detecciones: List[Dict], nueva_deteccion: Dict, 
                                 max_historial: int = 5) -> str:
     """
     Estabiliza detecciones en video usando historial de frames anteriores.
-    Útil para sistemas de captura automática.
+    Para flujos continuos (cámaras, videos) se usa TemporalVoter en utils/temporal_voting.py.
     """
     # Agregar nueva detección al historial
     historial_detecciones.append(nueva_deteccion)
@@ -0,0 +1,192 @@
+"""
+Agregación de lecturas de video en pasadas de vagoneta.
+
+Una vagoneta que cruza el encuadre produce decenas de lecturas del mismo número en frames
+consecutivos. En lugar de un registro (y un JPEG) por lectura, las lecturas de un mismo número
+se agrupan en una pasada mientras no haya un hueco mayor que `max_gap_seconds` (en tiempo de
+video) entre dos de ellas; lecturas sueltas de otro número en medio no la cortan. Al cerrarse,
+la pasada conserva un único frame (el de mayor confianza), el rango de frames y un resumen de
+confianzas, que es lo que se guarda en `metadata.pasada` del registro.
+
+Con el seguimiento (utils/tracking.py) el modelo solo corre cada muchos pasos mientras la
+vagoneta sigue a la vista, así que sus lecturas pueden separarse más que `max_gap_seconds`:
+cada paso propagado llama a `extend`, que mantiene abierta la pasada del número de la pista sin
+contar una lectura (`pasos_seguidos` en el resumen).
+
+Las pasadas con menos de `min_reads` lecturas o cuya mejor confianza no llega a
+`min_confidence` se descartan como ruido, igual que las que se solapan con otra pasada con al
+menos `dominance` veces más lecturas (lecturas erróneas del número de la vagoneta que pasa).
+"""
+
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+PASSAGE_MAX_GAP_SECONDS = float(os.getenv("PASSAGE_MAX_GAP_SECONDS", 2.0))
+PASSAGE_MIN_READS = int(os.getenv("PASSAGE_MIN_READS", 2))
+PASSAGE_MIN_CONFIDENCE = 0.5   # Mismo umbral que usaban los registros por frame
+PASSAGE_DOMINANCE = 2.0
+
+
+class Passage:
+    """Lecturas consecutivas de un mismo número en un video."""
+
+    def __init__(self, numero: str, frame_number: int):
+        self.numero = numero
+        self.frame_inicio = frame_number
+        self.frame_fin = frame_number
+        self.lecturas = 0
+        self.pasos_seguidos = 0    # Pasos propagados por el seguimiento (sin lectura del modelo)
+        self._suma_confianza = 0.0
+        self.confianza_min = 1.0
+        self.confianza_max = 0.0
+        self.frame_mejor = frame_number
+        self.best_frame: Optional[np.ndarray] = None
+        self.geometry: Dict[str, Any] = {}   # Cajas de la mejor lectura (metadata.geometria)
+        self.modelo_ladrillo: Optional[str] = None
+
+    def add(self, frame_number: int, confianza: float, frame: np.ndarray, modelo_ladrillo: Optional[str],
+            geometry: Optional[Dict[str, Any]] = None):
+        self.frame_fin = frame_number
+        self.lecturas += 1
+        self._suma_confianza += confianza
+        self.confianza_min = min(self.confianza_min, confianza)
+        if confianza > self.confianza_max:
+            self.confianza_max = confianza
+            self.frame_mejor = frame_number
+            self.best_frame = frame
+            self.geometry = geometry or {}
+            self.modelo_ladrillo = modelo_ladrillo or self.modelo_ladrillo
+        elif modelo_ladrillo and not self.modelo_ladrillo:
+            self.modelo_ladrillo = modelo_ladrillo
+
+    def merge(self, other: "Passage"):
+        """Incorpora otra pasada del mismo número (la continuación de esta en el siguiente segmento)."""
+        self.frame_inicio = min(self.frame_inicio, other.frame_inicio)
+        self.frame_fin = max(self.frame_fin, other.frame_fin)
+        self.lecturas += other.lecturas
+        self.pasos_seguidos += other.pasos_seguidos
+        self._suma_confianza += other._suma_confianza
+        self.confianza_min = min(self.confianza_min, other.confianza_min)
+        if other.confianza_max > self.confianza_max:
+            self.confianza_max = other.confianza_max
+            self.frame_mejor = other.frame_mejor
+            self.best_frame = other.best_frame
+            self.geometry = other.geometry
+            self.modelo_ladrillo = other.modelo_ladrillo or self.modelo_ladrillo
+        elif other.modelo_ladrillo and not self.modelo_ladrillo:
+            self.modelo_ladrillo = other.modelo_ladrillo
+
+    @property
+    def confianza_media(self) -> float:
+        return self._suma_confianza / self.lecturas if self.lecturas else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        """Resumen serializable (va a metadata.pasada y a los eventos del stream)."""
+        return {
+            'numero': self.numero,
+            'frame_inicio': self.frame_inicio,
+            'frame_fin': self.frame_fin,
+            'frame_mejor': self.frame_mejor,
+            'lecturas': self.lecturas,
+            'pasos_seguidos': self.pasos_seguidos,
+            'confianza_media': round(self.confianza_media, 4),
+            'confianza_min': round(self.confianza_min, 4),
+            'confianza_max': round(self.confianza_max, 4),
+        }
+
+
+class PassageAggregator:
+    """Agrupa las lecturas (número, confianza) de un video en pasadas, en orden de frames."""
+
+    def __init__(self, fps: float, max_gap_seconds: float = PASSAGE_MAX_GAP_SECONDS,
+                 min_reads: int = PASSAGE_MIN_READS, min_confidence: float = PASSAGE_MIN_CONFIDENCE,
+                 dominance: float = PASSAGE_DOMINANCE):
+        self.max_gap_frames = max(1, int(round(max_gap_seconds * (fps or 30.0))))
+        self.min_reads = max(1, min_reads)
+        self.min_confidence = min_confidence
+        self.dominance = dominance
+        self._open: Dict[str, Passage] = {}
+        self._recent: List[Passage] = []   # Pasadas cerradas que aún pueden solaparse con las abiertas
+        self.stats = {'reads': 0, 'tracked_steps': 0, 'passages': 0, 'discarded': 0}
+
+    def add(self, frame_number: int, numero: Optional[str], confianza: Optional[float],
+            frame: np.ndarray, modelo_ladrillo: Optional[str] = None,
+            geometry: Optional[Dict[str, Any]] = None) -> List[Passage]:
+        """
+        Añade la lectura de un frame (número None = sin número) y devuelve las pasadas que se
+        cerraron por hueco hasta este frame (solo las válidas).
+        """
+        closed = self._close(lambda p: frame_number - p.frame_fin > self.max_gap_frames)
+        if numero and confianza is not None:
+            self.stats['reads'] += 1
+            passage = self._open.get(numero)
+            if passage is None:
+                passage = self._open[numero] = Passage(numero, frame_number)
+            passage.add(frame_number, float(confianza), frame, modelo_ladrillo, geometry)
+        return closed
+
+    def extend(self, frame_number: int, numero: Optional[str]) -> List[Passage]:
+        """
+        Paso propagado por el seguimiento en el que la pista sigue viendo `numero`: la pasada
+        abierta de ese número se extiende hasta `frame_number` sin contar una lectura (el
+        seguimiento no abre pasadas nuevas). Devuelve las pasadas cerradas por hueco, igual que `add`.
+        """
+        closed = self._close(lambda p: frame_number - p.frame_fin > self.max_gap_frames)
+        passage = self._open.get(numero) if numero else None
+        if passage is not None:
+            passage.frame_fin = frame_number
+            passage.pasos_seguidos += 1
+            self.stats['tracked_steps'] += 1
+        return closed
+
+    def add_passage(self, other: Passage) -> List[Passage]:
+        """
+        Añade una pasada ya agregada (de un segmento procesado en paralelo, ver utils/video_segments.py).
+        Hay que llamarla en orden de `frame_inicio`; si continúa una pasada abierta del mismo número
+        se fusionan. Devuelve las pasadas cerradas hasta su inicio, igual que `add`.
+        """
+        closed = self._close(lambda p: other.frame_inicio - p.frame_fin > self.max_gap_frames)
+        self.stats['reads'] += other.lecturas
+        passage = self._open.get(other.numero)
+        if passage is None:
+            self._open[other.numero] = other
+        else:
+            passage.merge(other)
+        return closed
+
+    @property
+    def has_open(self) -> bool:
+        """True mientras haya pasadas abiertas (no es un punto seguro para reanudar el video)."""
+        return bool(self._open)
+
+    def close_all(self) -> List[Passage]:
+        """Cierra las pasadas abiertas (fin del video)."""
+        return self._close(lambda p: True)
+
+    def _overlaps(self, a: Passage, b: Passage) -> bool:
+        return a.frame_inicio <= b.frame_fin + self.max_gap_frames and b.frame_inicio <= a.frame_fin + self.max_gap_frames
+
+    def _dominated(self, passage: Passage) -> bool:
+        return any(other is not passage and other.lecturas >= self.dominance * passage.lecturas
+                   and self._overlaps(passage, other)
+                   for other in list(self._open.values()) + self._recent)
+
+    def _close(self, should_close) -> List[Passage]:
+        to_close = [p for p in self._open.values() if should_close(p)]
+        closed = []
+        # Se evalúan antes de sacarlas de las abiertas: dos pasadas que cierran juntas se comparan entre sí
+        for passage in to_close:
+            if (passage.lecturas >= self.min_reads and passage.confianza_max >= self.min_confidence
+                    and not self._dominated(passage)):
+                closed.append(passage)
+        for passage in to_close:
+            del self._open[passage.numero]
+        self.stats['passages'] += len(closed)
+        self.stats['discarded'] += len(to_close) - len(closed)
+        if closed:
+            latest = max(p.frame_fin for p in closed)
+            self._recent = [p for p in self._recent + closed if latest - p.frame_fin <= self.max_gap_frames]
+        closed.sort(key=lambda p: p.frame_inicio)
+        return closed
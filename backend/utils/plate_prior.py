@@ -0,0 +1,225 @@
+"""
+Prior espacial por cámara de la zona donde aparece el número de la vagoneta.
+
+Las cámaras son fijas: el número de una vagoneta que pasa cae siempre en la misma franja de
+la imagen. Cada cámara aprende esa región a partir del historial de `bbox_numero` y, una vez
+aprendida, la inferencia se ejecuta solo sobre el recorte (que el modelo amplía a su tamaño
+de entrada, es decir, a más resolución efectiva). Cada `full_frame_every` llamadas, o tras
+`max_misses` recortes seguidos sin número, se vuelve a mirar el frame completo para detectar
+deriva (cámara movida, cambio de vía).
+
+Los priors se guardan en plate_priors.json, junto a cameras_config.json.
+"""
+
+import json
+import os
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_PRIORS_PATH = Path(os.getenv(
+    "PLATE_PRIORS_PATH", str(Path(__file__).parent.parent / "plate_priors.json")))
+PRIOR_MIN_SAMPLES = int(os.getenv("PLATE_PRIOR_MIN_SAMPLES", 10))
+PRIOR_HISTORY = int(os.getenv("PLATE_PRIOR_HISTORY", 200))
+PRIOR_FULL_FRAME_EVERY = int(os.getenv("PLATE_PRIOR_FULL_FRAME_EVERY", 20))
+PRIOR_MARGIN = float(os.getenv("PLATE_PRIOR_MARGIN", 0.5))  # Fracción del tamaño de la región añadida a cada lado
+
+_BBOX_KEYS = ('bbox_numero', 'bbox_ladrillo', 'bbox_vagoneta')
+
+
+class PlateRegionPrior:
+    """Región aprendida (normalizada a [0, 1]) donde aparece el número en una cámara."""
+
+    def __init__(self, camera_id: str,
+                 samples: Optional[List[List[float]]] = None,
+                 min_samples: int = PRIOR_MIN_SAMPLES,
+                 history: int = PRIOR_HISTORY,
+                 full_frame_every: int = PRIOR_FULL_FRAME_EVERY,
+                 margin: float = PRIOR_MARGIN,
+                 max_misses: int = 3):
+        self.camera_id = camera_id
+        self.samples = deque(samples or [], maxlen=history)  # [x1, y1, x2, y2] normalizados
+        self.min_samples = min_samples
+        self.full_frame_every = max(1, full_frame_every)
+        self.margin = margin
+        self.max_misses = max_misses
+        self.calls = 0
+        self.consecutive_misses = 0
+        self.stats = {'roi_runs': 0, 'full_frame_runs': 0, 'roi_misses': 0}
+
+    @property
+    def is_learned(self) -> bool:
+        return len(self.samples) >= self.min_samples
+
+    def observe(self, bbox, frame_shape: Tuple[int, ...]):
+        """Añade un bbox_numero (coordenadas del frame completo) al historial."""
+        h, w = frame_shape[:2]
+        x1, y1, x2, y2 = [float(v) for v in bbox[:4]]
+        if w <= 0 or h <= 0 or x2 <= x1 or y2 <= y1:
+            return
+        self.samples.append([x1 / w, y1 / h, x2 / w, y2 / h])
+        self.consecutive_misses = 0
+
+    def record_miss(self):
+        """Un recorte sin número: tras `max_misses` seguidos se fuerza el frame completo."""
+        self.consecutive_misses += 1
+        self.stats['roi_misses'] += 1
+
+    def normalized_region(self) -> Optional[Tuple[float, float, float, float]]:
+        """Región normalizada (percentiles 5-95 del historial más margen), o None si no está aprendida."""
+        if not self.is_learned:
+            return None
+        data = np.asarray(self.samples, dtype=np.float32)
+        x1, y1 = np.percentile(data[:, 0], 5), np.percentile(data[:, 1], 5)
+        x2, y2 = np.percentile(data[:, 2], 95), np.percentile(data[:, 3], 95)
+        mx, my = (x2 - x1) * self.margin, (y2 - y1) * self.margin
+        return (max(0.0, float(x1 - mx)), max(0.0, float(y1 - my)),
+                min(1.0, float(x2 + mx)), min(1.0, float(y2 + my)))
+
+    def next_region(self, frame_shape: Tuple[int, ...]) -> Optional[Tuple[int, int, int, int]]:
+        """
+        Región en píxeles para la próxima inferencia, o None si toca frame completo
+        (prior sin aprender, chequeo periódico de deriva o demasiados fallos seguidos).
+        """
+        self.calls += 1
+        region = self.normalized_region()
+        if (region is None or self.calls % self.full_frame_every == 0
+                or self.consecutive_misses >= self.max_misses):
+            self.stats['full_frame_runs'] += 1
+            return None
+        h, w = frame_shape[:2]
+        x1, y1 = int(region[0] * w), int(region[1] * h)
+        x2, y2 = int(np.ceil(region[2] * w)), int(np.ceil(region[3] * h))
+        if x2 - x1 < 2 or y2 - y1 < 2:
+            self.stats['full_frame_runs'] += 1
+            return None
+        self.stats['roi_runs'] += 1
+        return x1, y1, x2, y2
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'samples': [list(map(float, s)) for s in self.samples], 'region': self.normalized_region()}
+
+    def get_status(self) -> Dict[str, Any]:
+        return {'learned': self.is_learned, 'samples': len(self.samples),
+                'region': self.normalized_region(), **self.stats}
+
+
+class PlatePriorStore:
+    """Priors de todas las cámaras, persistidos en JSON (escritura atómica y espaciada)."""
+
+    def __init__(self, path: Path = DEFAULT_PRIORS_PATH, save_every: int = 5):
+        self.path = Path(path)
+        self.save_every = max(1, save_every)
+        self._priors: Dict[str, PlateRegionPrior] = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._stored = self._load()
+
+    def _load(self) -> Dict[str, Any]:
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except Exception as e:
+            print(f"⚠️ No se pudo leer {self.path}: {e}")
+            return {}
+
+    def get(self, camera_id: str) -> PlateRegionPrior:
+        with self._lock:
+            if camera_id not in self._priors:
+                stored = self._stored.get(camera_id, {})
+                self._priors[camera_id] = PlateRegionPrior(camera_id, samples=stored.get('samples'))
+            return self._priors[camera_id]
+
+    def mark_updated(self):
+        """Guarda a disco cada `save_every` observaciones nuevas."""
+        with self._lock:
+            self._pending += 1
+            should_save = self._pending >= self.save_every
+        if should_save:
+            self.save()
+
+    def save(self):
+        with self._lock:
+            self._pending = 0
+            data = {**self._stored, **{cid: prior.to_dict() for cid, prior in self._priors.items()}}
+            self._stored = data
+        tmp_path = self.path.with_suffix('.json.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"⚠️ No se pudo guardar {self.path}: {e}")
+
+
+def offset_detection(result: Dict[str, Any], offset_x: int, offset_y: int) -> Dict[str, Any]:
+    """Lleva los bbox de un resultado obtenido sobre un recorte a coordenadas del frame completo."""
+    if not result or (offset_x == 0 and offset_y == 0):
+        return result
+    shifted = dict(result)
+    delta = np.array([offset_x, offset_y, offset_x, offset_y])
+    for key in _BBOX_KEYS:
+        bbox = result.get(key)
+        if bbox is None:
+            continue
+        moved = np.asarray(bbox)[:4] + delta.astype(np.asarray(bbox).dtype, copy=False)
+        shifted[key] = tuple(int(v) for v in moved) if isinstance(bbox, tuple) else moved
+    return shifted
+
+
+async def run_detection_with_prior_async(frames: List[np.ndarray], prior: PlateRegionPrior,
+                                         store: Optional[PlatePriorStore] = None,
+                                         backend: Optional[str] = None,
+                                         cache_keys: Optional[List[Any]] = None,
+                                         tiling: Optional[tuple] = None) -> List[Dict[str, Any]]:
+    """
+    Detecta en un grupo de frames de la misma cámara usando (y actualizando) su prior: o todos
+    sobre el recorte aprendido o todos sobre el frame completo. Los bbox devueltos están siempre
+    en coordenadas del frame completo. `cache_keys` identifica los frames completos en la caché
+    de inferencia; para los recortes se les añade la región. Con `tiling` (utils/tiling.py) el
+    frame o el recorte se infiere por teselas si es mayor que una tesela.
+    """
+    from .image_processing import run_detection_on_frames_async
+
+    valid = [f for f in frames if f is not None and f.size > 0]
+    if not valid:
+        return [{} for _ in frames]
+    region = prior.next_region(valid[0].shape)
+    if region is None:
+        results = await run_detection_on_frames_async(frames, backend=backend, cache_keys=cache_keys, tiling=tiling)
+    else:
+        x1, y1, x2, y2 = region
+        crops = [f[y1:y2, x1:x2] if f is not None and f.size > 0 else f for f in frames]
+        crop_keys = [(key, region) if key is not None else None for key in cache_keys] if cache_keys else None
+        results = [offset_detection(r, x1, y1)
+                   for r in await run_detection_on_frames_async(crops, backend=backend, cache_keys=crop_keys,
+                                                                tiling=tiling)]
+
+    found = False
+    for frame, result in zip(frames, results):
+        if result and result.get('numero_detectado') and result.get('bbox_numero') is not None:
+            prior.observe(result['bbox_numero'], frame.shape)
+            found = True
+            if store:
+                store.mark_updated()
+    if region is not None and not found:
+        prior.record_miss()
+    elif region is None and not found:
+        prior.consecutive_misses = 0  # Tampoco había número en el frame completo: el recorte no era el problema
+    return results
+
+
+# Almacén compartido por SmartCameraCapture y el monitor en vivo
+_prior_store: Optional[PlatePriorStore] = None
+
+def get_plate_prior_store() -> PlatePriorStore:
+    global _prior_store
+    if _prior_store is None:
+        _prior_store = PlatePriorStore()
+    return _prior_store
@@ -0,0 +1,213 @@
+"""
+Preprocesamiento sin asignaciones por frame para el detector.
+
+En lugar de aplicar CLAHE a resolución completa y dejar que YOLO reduzca después, el
+pipeline:
+    1. Convierte el frame a gris a resolución original (un solo canal para el resize).
+    2. Redimensiona con letterbox al tamaño de entrada del modelo.
+    3. Aplica CLAHE (instancia cacheada por hilo) sobre la imagen ya reducida.
+    4. Entrega un lienzo BGR o directamente un tensor NCHW float32 en [0, 1].
+
+Todos los pasos escriben en buffers preasignados por hilo, de modo que en régimen estable no se
+reserva memoria nueva por frame. Los buffers del lado del modelo (lienzo, BGR, tensor) dependen
+solo del tamaño del lienzo y de la posición dentro del lote, y se guardan en una LRU pequeña
+por hilo (`PREPROCESS_BUFFER_CACHE`): los recortes de vagoneta o las subidas de tamaños
+arbitrarios no acumulan buffers. El gris a resolución original usa un único buffer por hilo
+que crece hasta `PREPROCESS_GRAY_MAX_PIXELS`; los frames más grandes usan uno temporal.
+Los arrays devueltos se reutilizan en la siguiente llamada del mismo hilo: deben consumirse
+(pasarse al modelo) antes de volver a preprocesar.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+PAD_VALUE = 114  # Mismo gris de relleno que el letterbox de ultralytics
+PREPROCESS_BUFFER_CACHE = int(os.getenv("PREPROCESS_BUFFER_CACHE", 8))  # Juegos de buffers del modelo por hilo
+PREPROCESS_GRAY_MAX_PIXELS = int(os.getenv("PREPROCESS_GRAY_MAX_PIXELS", 3840 * 2160))  # Tope del buffer gris por hilo
+
+
+class LetterboxParams:
+    """Escala y relleno aplicados a un frame; permite llevar las cajas a coordenadas originales."""
+
+    __slots__ = ("scale", "pad_left", "pad_top", "orig_shape", "input_shape")
+
+    def __init__(self, scale: float, pad_left: int, pad_top: int,
+                 orig_shape: Tuple[int, int], input_shape: Tuple[int, int]):
+        self.scale = scale
+        self.pad_left = pad_left
+        self.pad_top = pad_top
+        self.orig_shape = orig_shape      # (alto, ancho) del frame original
+        self.input_shape = input_shape    # (alto, ancho) del lienzo entregado al modelo
+
+    def map_boxes_to_original(self, xyxy: np.ndarray) -> np.ndarray:
+        """Convierte cajas xyxy (N x 4) del lienzo a coordenadas del frame original (in situ)."""
+        xyxy[:, [0, 2]] -= self.pad_left
+        xyxy[:, [1, 3]] -= self.pad_top
+        xyxy /= self.scale
+        xyxy[:, [0, 2]] = np.clip(xyxy[:, [0, 2]], 0, self.orig_shape[1])
+        xyxy[:, [1, 3]] = np.clip(xyxy[:, [1, 3]], 0, self.orig_shape[0])
+        return xyxy
+
+
+def letterbox_geometry(orig_shape: Tuple[int, int], imgsz: Tuple[int, int], auto: bool,
+                       stride: int = 32) -> Tuple[Tuple[int, int], Tuple[int, int], int, int]:
+    """
+    Misma geometría que ultralytics.data.augment.LetterBox (centrado, con escalado hacia arriba).
+
+    Returns:
+        ((alto, ancho) redimensionado, (alto, ancho) del lienzo, relleno izquierdo, relleno superior)
+    """
+    h, w = orig_shape
+    r = min(imgsz[0] / h, imgsz[1] / w)
+    new_w, new_h = round(w * r), round(h * r)
+    dw, dh = imgsz[1] - new_w, imgsz[0] - new_h
+    if auto:  # Rectángulo mínimo múltiplo del stride
+        dw, dh = dw % stride, dh % stride
+    left, right = round(dw / 2 - 0.1), round(dw / 2 + 0.1)
+    top, bottom = round(dh / 2 - 0.1), round(dh / 2 + 0.1)
+    return (new_h, new_w), (new_h + top + bottom, new_w + left + right), left, top
+
+
+class PreprocessPipeline:
+    """Letterbox + CLAHE en gris con buffers y objetos CLAHE reutilizados por hilo."""
+
+    def __init__(self, clip_limit: float = 2.0, tile_grid_size: Tuple[int, int] = (8, 8),
+                 max_cached: int = PREPROCESS_BUFFER_CACHE, gray_max_pixels: int = PREPROCESS_GRAY_MAX_PIXELS):
+        self.clip_limit = clip_limit
+        self.tile_grid_size = tile_grid_size
+        self.max_cached = max(1, max_cached)
+        self.gray_max_pixels = gray_max_pixels
+        self._local = threading.local()
+
+    # ------------------------------------------------------------------
+    # Caches por hilo
+    # ------------------------------------------------------------------
+    def _clahe(self):
+        clahe = getattr(self._local, "clahe", None)
+        if clahe is None:
+            # cv2.CLAHE no es seguro entre hilos: una instancia por hilo
+            clahe = cv2.createCLAHE(clipLimit=self.clip_limit, tileGridSize=self.tile_grid_size)
+            self._local.clahe = clahe
+        return clahe
+
+    def _lru(self, name: str) -> "OrderedDict":
+        cache = getattr(self._local, name, None)
+        if cache is None:
+            cache = OrderedDict()
+            setattr(self._local, name, cache)
+        return cache
+
+    def _cached(self, name: str, key, factory):
+        """Entrada de la LRU `name` del hilo; crea con `factory` y expulsa la más antigua si sobra."""
+        cache = self._lru(name)
+        value = cache.get(key)
+        if value is None:
+            value = cache[key] = factory()
+            while len(cache) > self.max_cached:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(key)
+        return value
+
+    def _buffers(self, slot: int, canvas_shape: Tuple[int, int]) -> Dict[str, np.ndarray]:
+        pixels = canvas_shape[0] * canvas_shape[1]
+        return self._cached("buffers", (slot, canvas_shape), lambda: {
+            # Reducido y CLAHE caben siempre en el lienzo: vistas contiguas de un buffer plano
+            "resized": np.empty(pixels, dtype=np.uint8),
+            "enhanced": np.empty(pixels, dtype=np.uint8),
+            "canvas": np.full(canvas_shape, PAD_VALUE, dtype=np.uint8),
+            "bgr": np.empty(canvas_shape + (3,), dtype=np.uint8),
+            "layout": None,   # (alto, ancho, izquierda, arriba) de la zona útil pintada
+        })
+
+    def _gray(self, orig_shape: Tuple[int, int]) -> np.ndarray:
+        """Buffer gris a resolución original: uno por hilo, temporal por encima del tope."""
+        pixels = orig_shape[0] * orig_shape[1]
+        if pixels > self.gray_max_pixels:
+            return np.empty(orig_shape, dtype=np.uint8)
+        scratch = getattr(self._local, "gray", None)
+        if scratch is None or scratch.size < pixels:
+            scratch = self._local.gray = np.empty(pixels, dtype=np.uint8)
+        return scratch[:pixels].reshape(orig_shape)
+
+    def _tensor_buffer(self, batch: int, canvas_shape: Tuple[int, int]) -> np.ndarray:
+        return self._cached("tensors", (batch, canvas_shape),
+                            lambda: np.empty((batch, 3) + canvas_shape, dtype=np.float32))
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+    def _letterbox(self, image: np.ndarray, imgsz: Tuple[int, int], auto: bool, stride: int,
+                   slot: int) -> Tuple[Dict[str, np.ndarray], LetterboxParams]:
+        orig_shape = image.shape[:2]
+        resized_shape, canvas_shape, left, top = letterbox_geometry(orig_shape, imgsz, auto, stride)
+        buffers = self._buffers(slot, canvas_shape)
+        h, w = resized_shape
+        resized = buffers["resized"][:h * w].reshape(resized_shape)
+        enhanced = buffers["enhanced"][:h * w].reshape(resized_shape)
+
+        if image.ndim == 3:
+            gray = self._gray(orig_shape)
+            cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=gray)
+        else:
+            gray = image
+        if resized_shape == orig_shape:
+            np.copyto(resized, gray)
+        else:
+            cv2.resize(gray, (w, h), dst=resized, interpolation=cv2.INTER_LINEAR)
+        self._clahe().apply(resized, dst=enhanced)
+
+        canvas = buffers["canvas"]
+        layout = (h, w, left, top)
+        if buffers["layout"] != layout:
+            # Otra zona útil en el mismo lienzo: se repinta el relleno (solo al cambiar de forma)
+            canvas.fill(PAD_VALUE)
+            buffers["layout"] = layout
+        canvas[top:top + h, left:left + w] = enhanced
+        scale = min(imgsz[0] / orig_shape[0], imgsz[1] / orig_shape[1])  # Misma ganancia que scale_boxes
+        return buffers, LetterboxParams(scale, left, top, orig_shape, canvas_shape)
+
+    def letterbox_gray(self, image: np.ndarray, imgsz: Tuple[int, int], auto: bool, stride: int = 32,
+                       slot: int = 0) -> Tuple[np.ndarray, LetterboxParams]:
+        """Devuelve el lienzo en gris (alto x ancho del modelo) con CLAHE aplicado tras reducir."""
+        buffers, params = self._letterbox(image, imgsz, auto, stride, slot)
+        return buffers["canvas"], params
+
+    def letterbox_bgr(self, image: np.ndarray, imgsz: Tuple[int, int], auto: bool, stride: int = 32,
+                      slot: int = 0) -> Tuple[np.ndarray, LetterboxParams]:
+        """Igual que letterbox_gray pero en BGR de 3 canales (entrada numpy para YOLO)."""
+        buffers, params = self._letterbox(image, imgsz, auto, stride, slot)
+        cv2.cvtColor(buffers["canvas"], cv2.COLOR_GRAY2BGR, dst=buffers["bgr"])
+        return buffers["bgr"], params
+
+    def to_tensor(self, canvases: List[np.ndarray]) -> np.ndarray:
+        """Apila lienzos grises del mismo tamaño como tensor NCHW float32 en [0, 1] (3 canales iguales)."""
+        tensor = self._tensor_buffer(len(canvases), canvases[0].shape[:2])
+        for i, canvas in enumerate(canvases):
+            np.multiply(canvas, np.float32(1.0 / 255.0), out=tensor[i, 0], casting="unsafe")
+            tensor[i, 1] = tensor[i, 0]
+            tensor[i, 2] = tensor[i, 0]
+        return tensor
+
+    def prepare_batch(self, images: List[np.ndarray], imgsz: Tuple[int, int], auto: bool, stride: int = 32,
+                      as_tensor: bool = False) -> Tuple[object, List[LetterboxParams]]:
+        """
+        Preprocesa un lote completo. Si los frames no comparten resolución se usa el lienzo
+        cuadrado completo (igual que ultralytics) para que todos tengan la misma forma.
+
+        Returns:
+            (tensor NCHW o lista de lienzos BGR, parámetros de letterbox por frame)
+        """
+        same_shapes = len({img.shape[:2] for img in images}) == 1
+        auto = auto and same_shapes
+        if not as_tensor:
+            prepared = [self.letterbox_bgr(image, imgsz, auto, stride, slot) for slot, image in enumerate(images)]
+            return [canvas for canvas, _ in prepared], [p for _, p in prepared]
+
+        prepared = [self.letterbox_gray(image, imgsz, auto, stride, slot) for slot, image in enumerate(images)]
+        return self.to_tensor([canvas for canvas, _ in prepared]), [p for _, p in prepared]
@@ -0,0 +1,137 @@
+"""
+Limitación y agrupación de los eventos de progreso de los videos antes de publicarlos.
+
+El procesamiento emite un `progress` por cada frame muestreado y un `detection_update` por
+cada lectura; en videos largos eso inunda el navegador y gasta CPU serializando eventos que
+nadie llega a ver. ProgressCoalescer se sitúa entre el procesamiento y los suscriptores:
+
+- `progress`: como mucho uno cada `SSE_PROGRESS_INTERVAL_SECONDS` (modo "time") o uno por
+  cada `SSE_PROGRESS_PERCENT_STEP` % del video (modo "percent"). El último descartado se
+  publica antes de cualquier otro evento, así la barra nunca se queda atrás.
+- `detection_update`: se acumulan en un `detection_digest` periódico (cada
+  `SSE_DIGEST_INTERVAL_SECONDS`) con, por número, las lecturas, la mejor confianza y su frame.
+- El resto de eventos (pasadas, números estables, registros, resultado final...) pasan sin
+  cambios, después de vaciar lo acumulado para conservar el orden.
+
+Configuración:
+
+    SSE_PROGRESS_MODE=time              # time | percent
+    SSE_PROGRESS_INTERVAL_SECONDS=0.5
+    SSE_PROGRESS_PERCENT_STEP=1
+    SSE_DIGEST_INTERVAL_SECONDS=1
+"""
+
+import os
+import time
+from typing import Any, Callable, Dict, Optional
+
+SSE_PROGRESS_MODE = os.getenv("SSE_PROGRESS_MODE", "time").lower()
+SSE_PROGRESS_INTERVAL_SECONDS = float(os.getenv("SSE_PROGRESS_INTERVAL_SECONDS", 0.5))
+SSE_PROGRESS_PERCENT_STEP = float(os.getenv("SSE_PROGRESS_PERCENT_STEP", 1.0))
+SSE_DIGEST_INTERVAL_SECONDS = float(os.getenv("SSE_DIGEST_INTERVAL_SECONDS", 1.0))
+
+
+class ProgressCoalescer:
+    """Filtra los `progress` y agrupa los `detection_update` de un trabajo antes de `emit`."""
+
+    def __init__(self, emit: Callable[[Dict[str, Any]], None], mode: str = SSE_PROGRESS_MODE,
+                 interval_seconds: float = SSE_PROGRESS_INTERVAL_SECONDS,
+                 percent_step: float = SSE_PROGRESS_PERCENT_STEP,
+                 digest_seconds: float = SSE_DIGEST_INTERVAL_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.emit = emit
+        self.mode = mode
+        self.interval_seconds = interval_seconds
+        self.percent_step = percent_step
+        self.digest_seconds = digest_seconds
+        self.clock = clock
+        self._last_progress_time: Optional[float] = None
+        self._last_percent: Optional[float] = None
+        self._pending_progress: Optional[Dict[str, Any]] = None
+        self._digest: Dict[str, Dict[str, Any]] = {}
+        self._digest_count = 0
+        self._digest_frames = [None, None]
+        self._digest_started: Optional[float] = None
+        self.stats = {'received': 0, 'emitted': 0, 'progress_dropped': 0, 'detections_digested': 0}
+
+    def _send(self, event: Dict[str, Any]):
+        self.stats['emitted'] += 1
+        self.emit(event)
+
+    def _progress_due(self, event: Dict[str, Any], now: float) -> bool:
+        if self._last_progress_time is None:
+            return True
+        total = event.get("total_frames") or 0
+        if self.mode == "percent" and total > 0:
+            percent = 100.0 * (event.get("current_frame") or 0) / total
+            return self._last_percent is None or percent - self._last_percent >= self.percent_step
+        return now - self._last_progress_time >= self.interval_seconds
+
+    def _emit_progress(self, event: Dict[str, Any], now: float):
+        self._last_progress_time = now
+        total = event.get("total_frames") or 0
+        if total > 0:
+            self._last_percent = 100.0 * (event.get("current_frame") or 0) / total
+        if self._pending_progress is not None and self._pending_progress is not event:
+            self.stats['progress_dropped'] += 1  # Lo reemplaza este progreso más reciente
+        self._pending_progress = None
+        self._send(event)
+
+    def _add_detection(self, event: Dict[str, Any], now: float):
+        numero = str(event.get("numero"))
+        frame = event.get("frame")
+        confianza = event.get("confianza") or 0.0
+        entry = self._digest.get(numero)
+        if entry is None:
+            entry = self._digest[numero] = {"numero": numero, "lecturas": 0, "confianza": confianza,
+                                            "frame": frame, "modelo": event.get("modelo")}
+        elif confianza > entry["confianza"]:
+            entry.update(confianza=confianza, frame=frame, modelo=event.get("modelo") or entry["modelo"])
+        entry["lecturas"] += 1
+        self._digest_count += 1
+        self._digest_frames = [frame if self._digest_frames[0] is None else self._digest_frames[0], frame]
+        if self._digest_started is None:
+            self._digest_started = now
+        self.stats['detections_digested'] += 1
+
+    def _flush_digest(self):
+        if not self._digest:
+            return
+        self._send({
+            "type": "detection_digest",
+            "stage": "frame_processing",
+            "frame_inicio": self._digest_frames[0],
+            "frame_fin": self._digest_frames[1],
+            "total": self._digest_count,
+            "detections": sorted(self._digest.values(), key=lambda d: -d["lecturas"]),
+        })
+        self._digest = {}
+        self._digest_count = 0
+        self._digest_frames = [None, None]
+        self._digest_started = None
+
+    def push(self, event: Dict[str, Any]):
+        self.stats['received'] += 1
+        now = self.clock()
+        event_type = event.get("type")
+        if event_type == "detection_update":
+            self._add_detection(event, now)
+        elif event_type == "progress":
+            if self._progress_due(event, now):
+                self._emit_progress(event, now)
+            else:
+                if self._pending_progress is not None:
+                    self.stats['progress_dropped'] += 1
+                self._pending_progress = event
+        else:
+            self.flush()
+            self._send(event)
+            return
+        if self._digest_started is not None and now - self._digest_started >= self.digest_seconds:
+            self._flush_digest()
+
+    def flush(self):
+        """Publica el digest y el último progreso pendientes (antes de otro evento o al terminar)."""
+        self._flush_digest()
+        if self._pending_progress is not None:
+            self._emit_progress(self._pending_progress, self.clock())
@@ -0,0 +1,193 @@
+"""
+Cuantización INT8 post-entrenamiento del detector de dígitos.
+
+Flujo:
+    1. Se exporta best.pt a ONNX FP32 (backend "onnx").
+    2. Se calibran las activaciones con frames reales tomados del directorio de subidas
+       (imágenes y frames muestreados de videos), preprocesados igual que en producción.
+    3. ONNX Runtime genera best_int8.onnx (QDQ, pesos INT8 por canal), que se carga con el
+       backend "onnx-int8" de utils/inference_backends.py.
+
+`build_quantization_report` compara los `numero_detectado` compuestos y la latencia por
+frame del modelo INT8 contra el modelo FP32 de referencia.
+"""
+
+import glob
+import os
+import re
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+DEFAULT_UPLOADS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "uploads")
+
+
+def iter_calibration_frames(uploads_dir: str = DEFAULT_UPLOADS_DIR, limit: int = 200,
+                            frames_per_video: int = 20) -> Iterator[Tuple[str, np.ndarray]]:
+    """Recorre imágenes y frames de video del directorio de subidas (máximo `limit` frames)."""
+    files = sorted(glob.glob(os.path.join(uploads_dir, "*")))
+    produced = 0
+    for path in files:
+        if produced >= limit:
+            return
+        lower = path.lower()
+        if lower.endswith(IMAGE_EXTENSIONS):
+            image = cv2.imread(path)
+            if image is not None:
+                produced += 1
+                yield os.path.basename(path), image
+        elif lower.endswith(VIDEO_EXTENSIONS):
+            cap = cv2.VideoCapture(path)
+            total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or 0
+            step = max(1, total // frames_per_video) if total else 30
+            frame_index = 0
+            taken = 0
+            while produced < limit and taken < frames_per_video:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                produced += 1
+                taken += 1
+                yield f"{os.path.basename(path)}#{frame_index}", frame
+                frame_index += step
+            cap.release()
+
+
+def _model_imgsz(weights_path: str) -> int:
+    from ultralytics import YOLO
+    imgsz = YOLO(weights_path).overrides.get("imgsz", 640)
+    return int(imgsz[0] if isinstance(imgsz, (list, tuple)) else imgsz)
+
+
+def _head_node_names(onnx_path: str) -> List[str]:
+    """Nodos de la cabeza de detección (último bloque /model.N/): se dejan en FP32 por precisión."""
+    import onnx
+    graph = onnx.load(onnx_path).graph
+    pattern = re.compile(r"/model\.(\d+)/")
+    indices = [int(m.group(1)) for node in graph.node for m in [pattern.search(node.name)] if m]
+    if not indices:
+        return []
+    head_prefix = f"/model.{max(indices)}/"
+    return [node.name for node in graph.node if head_prefix in node.name]
+
+
+def quantize_int8(weights_path: str, uploads_dir: str = DEFAULT_UPLOADS_DIR, limit: int = 200,
+                  force: bool = False, keep_head_fp32: bool = True, **_ignored) -> str:
+    """
+    Genera best_int8.onnx calibrado con frames del directorio de subidas y devuelve su ruta.
+    """
+    from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat,
+                                          QuantType, quantize_static)
+    from .inference_backends import export_backend, get_backend
+    from .preprocessing import PreprocessPipeline
+
+    int8_path = get_backend("onnx-int8").artifact_path(weights_path)
+    if os.path.exists(int8_path) and not force:
+        print(f"ℹ️ Modelo INT8 ya existe: {int8_path}")
+        return int8_path
+
+    fp32_path = export_backend("onnx", weights_path)
+    imgsz = _model_imgsz(weights_path)
+    pipeline = PreprocessPipeline()
+
+    class UploadsCalibrationReader(CalibrationDataReader):
+        def __init__(self):
+            self.input_name = None
+            self._frames = iter_calibration_frames(uploads_dir, limit)
+            self.count = 0
+
+        def get_next(self):
+            if self.input_name is None:
+                import onnxruntime
+                session = onnxruntime.InferenceSession(fp32_path, providers=["CPUExecutionProvider"])
+                self.input_name = session.get_inputs()[0].name
+            item = next(self._frames, None)
+            if item is None:
+                return None
+            self.count += 1
+            _, frame = item
+            # Mismo preprocesamiento que producción: letterbox cuadrado + CLAHE, como tensor NCHW
+            canvas, _ = pipeline.letterbox_gray(frame, (imgsz, imgsz), auto=False)
+            return {self.input_name: pipeline.to_tensor([canvas]).copy()}
+
+    reader = UploadsCalibrationReader()
+    nodes_to_exclude = _head_node_names(fp32_path) if keep_head_fp32 else []
+    print(f"🔧 Calibrando INT8 con frames de {uploads_dir} (máx. {limit}, imgsz={imgsz})...")
+    quantize_static(
+        fp32_path,
+        int8_path,
+        reader,
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        calibrate_method=CalibrationMethod.MinMax,
+        nodes_to_exclude=nodes_to_exclude,
+    )
+    if reader.count == 0:
+        os.remove(int8_path)
+        raise ValueError(f"No se encontraron imágenes ni videos para calibrar en {uploads_dir}")
+
+    print(f"✅ Modelo INT8 generado con {reader.count} frames de calibración: {int8_path}")
+    return int8_path
+
+
+def _latency_summary(latencies_ms: List[float]) -> Dict[str, float]:
+    values = np.asarray(latencies_ms, dtype=np.float64)
+    return {
+        "mean_ms": round(float(values.mean()), 2),
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p95_ms": round(float(np.percentile(values, 95)), 2),
+    }
+
+
+def build_quantization_report(reference_processor, int8_processor,
+                              samples: List[Tuple[str, np.ndarray]], warmup: int = 3) -> Dict[str, Any]:
+    """
+    Ejecuta ambos modelos sobre las muestras y compara el número compuesto detectado y la
+    latencia por frame.
+    """
+    from .inference_backends import compare_detections
+
+    for processor in (reference_processor, int8_processor):
+        for _, frame in samples[:warmup]:
+            processor.detect_objects_unified(frame)
+
+    per_frame = []
+    ref_latencies, int8_latencies = [], []
+    for name, frame in samples:
+        start = time.perf_counter()
+        reference = reference_processor.detect_objects_unified(frame)
+        ref_latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        candidate = int8_processor.detect_objects_unified(frame)
+        int8_latencies.append((time.perf_counter() - start) * 1000)
+
+        per_frame.append({
+            "sample": name,
+            "numero_fp32": reference.get('numero_detectado'),
+            "numero_int8": candidate.get('numero_detectado'),
+            "confianza_fp32": reference.get('confianza_numero'),
+            "confianza_int8": candidate.get('confianza_numero'),
+            "match": reference.get('numero_detectado') == candidate.get('numero_detectado'),
+            "differences": compare_detections(reference, candidate),
+        })
+
+    with_number = [f for f in per_frame if f["numero_fp32"]]
+    ref_summary = _latency_summary(ref_latencies)
+    int8_summary = _latency_summary(int8_latencies)
+    return {
+        "samples": len(per_frame),
+        "numero_agreement": round(sum(f["match"] for f in per_frame) / len(per_frame), 4) if per_frame else None,
+        "numero_recall_vs_fp32": round(sum(f["match"] for f in with_number) / len(with_number), 4) if with_number else None,
+        "latency_fp32": ref_summary,
+        "latency_int8": int8_summary,
+        "speedup_mean": round(ref_summary["mean_ms"] / int8_summary["mean_ms"], 2) if int8_summary["mean_ms"] else None,
+        "frames": per_frame,
+    }
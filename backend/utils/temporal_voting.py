@@ -0,0 +1,152 @@
+"""
+Votación temporal en streaming para estabilizar el número de vagoneta de una fuente.
+
+Cada lectura del modelo (número + confianza) es un voto con peso igual a su confianza. Los
+votos viven `window_seconds` en una deque ordenada por tiempo: añadir y caducar votos es O(1)
+amortizado y los pesos por número se mantienen como sumas acumuladas, así que elegir al líder
+solo recorre los números distintos de la ventana (unos pocos por pasada).
+
+Un número se declara estable cuando reúne al menos `min_votes` lecturas y `min_share` del
+peso total de la ventana; entonces `add` devuelve un StableNumberEvent (una vez por número
+mientras siga votado). Cuando sus votos caducan (la vagoneta se fue) puede volver a emitirse.
+Con seguimiento (utils/tracking.py), los pasos propagados votan con la lectura de la pista
+(`BoxTracker.reading()`), así que el número sigue recibiendo votos entre detecciones completas.
+El evento incluye la mejor evidencia vista (p. ej. el frame con mayor confianza) para que el
+llamador guarde un único registro en lugar de uno por cada lectura ruidosa.
+
+Configuración por cámara en cameras_config.json (opcional):
+
+    "voting": {"window_seconds": 10, "min_votes": 3, "min_share": 0.6}
+"""
+
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+VOTING_WINDOW_SECONDS = float(os.getenv("VOTING_WINDOW_SECONDS", 10))
+VOTING_MIN_VOTES = int(os.getenv("VOTING_MIN_VOTES", 3))
+VOTING_MIN_SHARE = float(os.getenv("VOTING_MIN_SHARE", 0.6))
+VOTING_MIN_CONFIDENCE = float(os.getenv("VOTING_MIN_CONFIDENCE", 0.3))  # Lecturas por debajo no votan
+
+
+class StableNumberEvent:
+    """Un número que se volvió estable en una fuente, con su mejor evidencia."""
+
+    def __init__(self, source_id: str, numero: str, confianza: float, votos: int, share: float,
+                 timestamp: float, evidence: Any = None, modelo_ladrillo: Optional[str] = None):
+        self.source_id = source_id
+        self.numero = numero
+        self.confianza = confianza        # Mejor confianza individual del número en la ventana
+        self.votos = votos
+        self.share = share                # Fracción del peso de la ventana a favor del número
+        self.timestamp = timestamp
+        self.evidence = evidence          # Lo que el llamador asoció a la mejor lectura (frame, detección...)
+        self.modelo_ladrillo = modelo_ladrillo
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'source_id': self.source_id,
+            'numero': self.numero,
+            'confianza': round(self.confianza, 4),
+            'votos': self.votos,
+            'share': round(self.share, 3),
+            'timestamp': self.timestamp,
+            'modelo_ladrillo': self.modelo_ladrillo,
+        }
+
+
+class TemporalVoter:
+    """Ventana deslizante de votos ponderados por confianza para UNA fuente (cámara o video)."""
+
+    def __init__(self, source_id: str, window_seconds: float = VOTING_WINDOW_SECONDS,
+                 min_votes: int = VOTING_MIN_VOTES, min_share: float = VOTING_MIN_SHARE,
+                 min_confidence: float = VOTING_MIN_CONFIDENCE):
+        self.source_id = source_id
+        self.window_seconds = window_seconds
+        self.min_votes = max(1, min_votes)
+        self.min_share = min_share
+        self.min_confidence = min_confidence
+        self._votes: Deque[Tuple[float, str, float]] = deque()   # (timestamp, numero, peso)
+        self._weights: Dict[str, float] = {}
+        self._counts: Dict[str, int] = {}
+        self._total_weight = 0.0
+        # Mejor lectura por número: (confianza, timestamp, evidencia, modelo_ladrillo)
+        self._best: Dict[str, Tuple[float, float, Any, Optional[str]]] = {}
+        self._emitted: set = set()   # Números ya emitidos mientras sigan en la ventana
+        self.stats = {'votes': 0, 'ignored': 0, 'events': 0}
+
+    @classmethod
+    def from_config(cls, source_id: str, config: Optional[Dict[str, Any]] = None, **defaults) -> "TemporalVoter":
+        """Crea el votante con la entrada "voting" de cameras_config.json (y valores por defecto del llamador)."""
+        options = {**defaults, **(config or {})}
+        return cls(source_id, **{k: v for k, v in options.items()
+                                 if k in ('window_seconds', 'min_votes', 'min_share', 'min_confidence')})
+
+    def _expire(self, now: float):
+        limit = now - self.window_seconds
+        while self._votes and self._votes[0][0] < limit:
+            _, numero, weight = self._votes.popleft()
+            self._total_weight -= weight
+            self._counts[numero] -= 1
+            self._weights[numero] -= weight
+            if self._counts[numero] == 0:
+                del self._counts[numero], self._weights[numero]
+                self._best.pop(numero, None)
+                self._emitted.discard(numero)
+        if not self._votes:
+            self._total_weight = 0.0  # Sin errores de redondeo acumulados
+
+    def add(self, numero: Optional[str], confianza: Optional[float], timestamp: Optional[float] = None,
+            evidence: Any = None, modelo_ladrillo: Optional[str] = None) -> Optional[StableNumberEvent]:
+        """
+        Registra una lectura (número None = frame sin número: solo avanza el reloj). Devuelve un
+        StableNumberEvent la primera vez que el número líder cumple los umbrales.
+        `timestamp` en segundos (tiempo de video o time.time(); por defecto, ahora).
+        """
+        now = time.time() if timestamp is None else timestamp
+        self._expire(now)
+        if not numero or confianza is None or confianza < self.min_confidence:
+            self.stats['ignored'] += 1
+            return None
+
+        weight = float(confianza)
+        self._votes.append((now, numero, weight))
+        self._total_weight += weight
+        self._weights[numero] = self._weights.get(numero, 0.0) + weight
+        self._counts[numero] = self._counts.get(numero, 0) + 1
+        self.stats['votes'] += 1
+        best = self._best.get(numero)
+        if best is None or weight > best[0]:
+            self._best[numero] = (weight, now, evidence, modelo_ladrillo)
+        elif modelo_ladrillo and not best[3]:
+            self._best[numero] = best[:3] + (modelo_ladrillo,)
+
+        leader = max(self._weights, key=self._weights.get)
+        if leader in self._emitted or self._counts[leader] < self.min_votes:
+            return None
+        share = self._weights[leader] / self._total_weight if self._total_weight > 0 else 0.0
+        if share < self.min_share:
+            return None
+
+        self._emitted.add(leader)
+        self.stats['events'] += 1
+        confianza_max, _, best_evidence, modelo = self._best[leader]
+        return StableNumberEvent(self.source_id, leader, confianza_max, self._counts[leader], share,
+                                 now, best_evidence, modelo)
+
+    def leader(self) -> Optional[Tuple[str, float]]:
+        """(número, fracción del peso) del líder actual de la ventana, o None."""
+        if not self._weights or self._total_weight <= 0:
+            return None
+        numero = max(self._weights, key=self._weights.get)
+        return numero, self._weights[numero] / self._total_weight
+
+    def get_status(self) -> Dict[str, Any]:
+        leader = self.leader()
+        return {
+            **self.stats,
+            'window_votes': len(self._votes),
+            'leader': {'numero': leader[0], 'share': round(leader[1], 3)} if leader else None,
+            'emitted': sorted(self._emitted),
+        }
@@ -0,0 +1,101 @@
+"""
+Inferencia por teselas para cámaras de alta resolución.
+
+En un frame 4K reducido a la entrada del modelo los dígitos quedan de pocos píxeles. En modo
+teselas el frame se corta en recortes solapados de `tile_size` píxeles (sin reducir) que se
+ejecutan juntos en un solo lote; opcionalmente se añade el frame completo reducido para los
+objetos grandes (vagoneta, ladrillo) que no caben en una tesela.
+
+Las cajas de todas las teselas se llevan al frame completo y se fusionan en las costuras
+antes de agrupar los dígitos: un dígito cortado por el borde de una tesela aparece entero en
+la vecina (gracias al solape) y parcial en la otra; la caja parcial queda casi contenida en
+la completa, así que se fusiona por intersección sobre el área menor (IoS), no por IoU.
+
+Configuración por cámara en cameras_config.json:
+
+    "tiling": {"tile_size": 1280, "overlap": 0.2, "include_full_frame": true}
+"""
+
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_TILE_SIZE = 1280        # Tamaño de entrada con el que se entrenó el modelo (train.py)
+DEFAULT_TILE_OVERLAP = 0.2      # Fracción de la tesela compartida con la vecina
+MERGE_IOS_THRESHOLD = 0.6
+
+# (tile_size, overlap, include_full_frame): hashable para agrupar pedidos y como clave de caché
+TilingConfig = Tuple[int, float, bool]
+
+
+def parse_tiling_config(config: Any) -> Optional[TilingConfig]:
+    """Convierte la entrada "tiling" de cameras_config.json (dict, true o null) en TilingConfig."""
+    if not config:
+        return None
+    if config is True:
+        config = {}
+    tile_size = int(config.get("tile_size", DEFAULT_TILE_SIZE))
+    overlap = float(config.get("overlap", DEFAULT_TILE_OVERLAP))
+    if tile_size < 32:
+        raise ValueError(f"tile_size demasiado pequeño: {tile_size}")
+    if not 0.0 <= overlap < 0.9:
+        raise ValueError(f"overlap debe estar entre 0 y 0.9: {overlap}")
+    return tile_size, overlap, bool(config.get("include_full_frame", True))
+
+
+def _tile_starts(length: int, tile: int, step: int) -> List[int]:
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, step))
+    starts.append(length - tile)  # La última tesela se alinea al borde en lugar de salirse
+    return starts
+
+
+def tile_grid(shape: Tuple[int, ...], tile_size: int, overlap: float) -> List[Tuple[int, int, int, int]]:
+    """Rectángulos (x1, y1, x2, y2) de las teselas que cubren el frame."""
+    h, w = shape[:2]
+    step = max(1, int(tile_size * (1.0 - overlap)))
+    tile_w, tile_h = min(tile_size, w), min(tile_size, h)
+    return [(x, y, x + tile_w, y + tile_h)
+            for y in _tile_starts(h, tile_size, step)
+            for x in _tile_starts(w, tile_size, step)]
+
+
+def needs_tiling(shape: Tuple[int, ...], tiling: Optional[TilingConfig]) -> bool:
+    """Solo se tesela si el frame es mayor que una tesela en algún eje."""
+    return tiling is not None and max(shape[:2]) > tiling[0]
+
+
+def merge_tile_detections(detections: np.ndarray, ios_threshold: float = MERGE_IOS_THRESHOLD) -> np.ndarray:
+    """
+    Fusión voraz por clase de cajas N×6 (x1, y1, x2, y2, conf, cls) ya en coordenadas del
+    frame completo: empezando por la más confiable, absorbe las de su clase con IoS mayor
+    que el umbral (la caja resultante es la unión y conserva la confianza máxima).
+    """
+    if len(detections) < 2:
+        return detections
+    order = np.argsort(-detections[:, 4], kind="stable")
+    boxes = detections[order].copy()
+    areas = (boxes[:, 2] - boxes[:, 0]).clip(min=0) * (boxes[:, 3] - boxes[:, 1]).clip(min=0)
+    alive = np.ones(len(boxes), dtype=bool)
+    for i in range(len(boxes)):
+        if not alive[i]:
+            continue
+        candidates = np.flatnonzero(alive & (boxes[:, 5] == boxes[i, 5]))
+        candidates = candidates[candidates > i]
+        if candidates.size == 0:
+            continue
+        other = boxes[candidates]
+        inter_w = (np.minimum(boxes[i, 2], other[:, 2]) - np.maximum(boxes[i, 0], other[:, 0])).clip(min=0)
+        inter_h = (np.minimum(boxes[i, 3], other[:, 3]) - np.maximum(boxes[i, 1], other[:, 1])).clip(min=0)
+        smaller = np.minimum(areas[i], areas[candidates])
+        ios = np.divide(inter_w * inter_h, smaller, out=np.zeros_like(smaller), where=smaller > 0)
+        merged = candidates[ios > ios_threshold]
+        if merged.size == 0:
+            continue
+        group = np.concatenate(([i], merged))
+        boxes[i, :2] = boxes[group, :2].min(axis=0)
+        boxes[i, 2:4] = boxes[group, 2:4].max(axis=0)
+        areas[i] = (boxes[i, 2] - boxes[i, 0]) * (boxes[i, 3] - boxes[i, 1])
+        alive[merged] = False
+    return boxes[alive]
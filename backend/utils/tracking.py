@@ -0,0 +1,337 @@
+"""
+Seguimiento de vagonetas y números entre detecciones completas (modo "track-then-detect").
+
+Mientras la misma vagoneta sigue a la vista no hace falta volver a pasar el modelo en cada
+muestra: las cajas de la vagoneta (`bbox_vagoneta`) y del número (`bbox_numero`) se propagan
+de un frame al siguiente con un filtro de Kalman de velocidad constante, corregido con una
+búsqueda de plantilla (cv2.matchTemplate) alrededor de la posición predicha. El modelo
+completo solo se vuelve a ejecutar cuando:
+
+- no hay pistas activas (escena vacía: se detecta con la cadencia normal de la cámara),
+- una pista se pierde o su confianza decae por debajo de `redetect_confidence`,
+- han pasado `max_skip` pasos sin detección (chequeo de seguridad para vagonetas nuevas).
+
+Cada detección completa se asocia a las pistas existentes por IoU; las cajas sin pareja abren
+pistas nuevas. Cada pista guarda el mejor `numero_detectado` visto durante su vida. En los
+pasos propagados, `reading()` devuelve ese número para los consumidores que esperan una lectura
+por paso (pasadas de video, votación temporal).
+"""
+
+import itertools
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+TRACKER_DECAY = float(os.getenv("TRACKER_DECAY", 0.97))                       # Por paso propagado sin detección
+TRACKER_REDETECT_CONFIDENCE = float(os.getenv("TRACKER_REDETECT_CONFIDENCE", 0.35))
+TRACKER_MAX_SKIP = int(os.getenv("TRACKER_MAX_SKIP", 50))                     # Pasos máximos entre detecciones
+TRACKER_IOU_THRESHOLD = 0.3
+TRACKER_MIN_MATCH_SCORE = 0.5       # Correlación normalizada mínima para aceptar la plantilla
+TRACKER_MISS_PENALTY = 0.5          # Factor de confianza por paso sin correspondencia
+TRACKER_MIN_CONFIDENCE = 0.1        # Por debajo se descarta la pista
+TEMPLATE_MAX_SIDE = 64              # La plantilla se reduce a este lado máximo (coste constante)
+SEARCH_MARGIN = 0.5                 # Ventana de búsqueda: caja predicha + esta fracción por lado
+
+# (clave de la caja, clave de la confianza) en el diccionario unificado de detección
+_TRACKED_KINDS = {
+    'numero': ('bbox_numero', 'confianza_numero'),
+    'vagoneta': ('bbox_vagoneta', 'confianza_vagoneta'),
+}
+
+_track_ids = itertools.count(1)
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> float:
+    """IoU de dos cajas (x1, y1, x2, y2)."""
+    inter_w = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    inter_h = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = inter_w * inter_h
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return float(inter / union) if union > 0 else 0.0
+
+
+class _BoxKalman:
+    """Kalman de velocidad constante sobre (cx, cy, w, h); la velocidad solo en el centro."""
+
+    def __init__(self, box: np.ndarray):
+        self.kf = cv2.KalmanFilter(6, 4)
+        transition = np.eye(6, dtype=np.float32)
+        transition[0, 4] = transition[1, 5] = 1.0
+        self.kf.transitionMatrix = transition
+        self.kf.measurementMatrix = np.eye(4, 6, dtype=np.float32)
+        self.kf.processNoiseCov = np.diag([1.0, 1.0, 1.0, 1.0, 0.5, 0.5]).astype(np.float32)
+        self.kf.errorCovPost = np.diag([10.0, 10.0, 10.0, 10.0, 100.0, 100.0]).astype(np.float32)
+        self.kf.statePost = np.concatenate([self._to_measurement(box), np.zeros((2, 1), np.float32)])
+
+    @staticmethod
+    def _to_measurement(box: np.ndarray) -> np.ndarray:
+        x1, y1, x2, y2 = box
+        return np.array([[(x1 + x2) / 2], [(y1 + y2) / 2], [x2 - x1], [y2 - y1]], dtype=np.float32)
+
+    @staticmethod
+    def _to_box(state: np.ndarray) -> np.ndarray:
+        cx, cy, w, h = state[:4, 0]
+        w, h = max(float(w), 1.0), max(float(h), 1.0)
+        return np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], dtype=np.float32)
+
+    def predict(self) -> np.ndarray:
+        return self._to_box(self.kf.predict())
+
+    def correct(self, box: np.ndarray, noise: float) -> np.ndarray:
+        # La detección del modelo es más fiable que la plantilla: ruido de medida por fuente
+        self.kf.measurementNoiseCov = np.eye(4, dtype=np.float32) * noise
+        return self._to_box(self.kf.correct(self._to_measurement(box)))
+
+
+class Track:
+    """Una vagoneta o un número seguido entre frames."""
+
+    def __init__(self, kind: str, box: np.ndarray, confidence: float, frame: np.ndarray):
+        self.id = next(_track_ids)
+        self.kind = kind
+        self.kalman = _BoxKalman(box)
+        self.box = np.asarray(box, dtype=np.float32)
+        self.confidence = confidence
+        self.hits = 1              # Detecciones completas asociadas
+        self.detection_misses = 0  # Detecciones completas seguidas que no la vieron
+        self.propagated = 0        # Pasos resueltos sin modelo
+        self.numero_detectado: Optional[str] = None
+        self.confianza_numero: Optional[float] = None
+        self.modelo_ladrillo: Optional[str] = None
+        self.template: Optional[np.ndarray] = None
+        self._scale = 1.0
+        self._set_template(frame)
+
+    def _set_template(self, frame: np.ndarray):
+        patch = _crop_gray(frame, self.box)
+        if patch is None:
+            self.template = None
+            return
+        self._scale = min(1.0, TEMPLATE_MAX_SIDE / max(patch.shape[:2]))
+        self.template = cv2.resize(patch, None, fx=self._scale, fy=self._scale, interpolation=cv2.INTER_AREA) if self._scale < 1.0 else patch
+
+    def update_from_detection(self, box: np.ndarray, confidence: float, frame: np.ndarray):
+        self.box = self.kalman.correct(np.asarray(box, dtype=np.float32), noise=1.0)
+        self.confidence = confidence
+        self.hits += 1
+        self.detection_misses = 0
+        self._set_template(frame)
+
+    def miss_detection(self):
+        self.detection_misses += 1
+        self.confidence *= TRACKER_MISS_PENALTY
+
+    def offer_number(self, numero: Optional[str], confianza: Optional[float],
+                     modelo_ladrillo: Optional[str]) -> bool:
+        """Guarda el número si mejora al mejor visto; devuelve True si lo guardó."""
+        if modelo_ladrillo:
+            self.modelo_ladrillo = modelo_ladrillo
+        if not numero or confianza is None or (self.confianza_numero or 0.0) >= confianza:
+            return False
+        self.numero_detectado, self.confianza_numero = numero, float(confianza)
+        return True
+
+
+    def propagate(self, frame: np.ndarray) -> bool:
+        """Predice la caja y la corrige con la plantilla; devuelve False si no encontró correspondencia."""
+        predicted = self.kalman.predict()
+        self.propagated += 1
+        measured = self._match_template(frame, predicted)
+        if measured is None:
+            self.box = predicted
+            self.confidence *= TRACKER_MISS_PENALTY
+            return False
+        self.box = self.kalman.correct(measured, noise=4.0)
+        self.confidence *= TRACKER_DECAY
+        # La plantilla solo se renueva con detecciones del modelo: renovarla con su propia
+        # correspondencia acumula deriva
+        return True
+
+    def _match_template(self, frame: np.ndarray, predicted: np.ndarray) -> Optional[np.ndarray]:
+        if self.template is None:
+            return None
+        w, h = predicted[2] - predicted[0], predicted[3] - predicted[1]
+        window = np.array([predicted[0] - w * SEARCH_MARGIN, predicted[1] - h * SEARCH_MARGIN,
+                           predicted[2] + w * SEARCH_MARGIN, predicted[3] + h * SEARCH_MARGIN])
+        search = _crop_gray(frame, window)
+        if search is None:
+            return None
+        if self._scale < 1.0:
+            search = cv2.resize(search, None, fx=self._scale, fy=self._scale, interpolation=cv2.INTER_AREA)
+        th, tw = self.template.shape[:2]
+        if search.shape[0] < th or search.shape[1] < tw:
+            return None
+        scores = cv2.matchTemplate(search, self.template, cv2.TM_CCOEFF_NORMED)
+        _, best, _, (mx, my) = cv2.minMaxLoc(scores)
+        if best < TRACKER_MIN_MATCH_SCORE:
+            return None
+        x1 = max(0, int(window[0])) + mx / self._scale
+        y1 = max(0, int(window[1])) + my / self._scale
+        return np.array([x1, y1, x1 + tw / self._scale, y1 + th / self._scale], dtype=np.float32)
+
+    def inside(self, frame_shape: Tuple[int, ...]) -> bool:
+        h, w = frame_shape[:2]
+        cx, cy = (self.box[0] + self.box[2]) / 2, (self.box[1] + self.box[3]) / 2
+        return 0 <= cx < w and 0 <= cy < h
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'track_id': self.id,
+            'tipo': self.kind,
+            'bbox': [round(float(v), 1) for v in self.box],
+            'confianza_pista': round(float(self.confidence), 3),
+            'numero_detectado': self.numero_detectado,
+            'confianza_numero': self.confianza_numero,
+            'modelo_ladrillo': self.modelo_ladrillo,
+            'detecciones': self.hits,
+            'pasos_propagados': self.propagated,
+        }
+
+
+def _crop_gray(frame: np.ndarray, box) -> Optional[np.ndarray]:
+    h, w = frame.shape[:2]
+    x1, y1 = max(0, int(box[0])), max(0, int(box[1]))
+    x2, y2 = min(w, int(np.ceil(box[2]))), min(h, int(np.ceil(box[3])))
+    if x2 - x1 < 4 or y2 - y1 < 4:
+        return None
+    patch = frame[y1:y2, x1:x2]
+    return cv2.cvtColor(patch, cv2.COLOR_BGR2GRAY) if patch.ndim == 3 else patch
+
+
+class BoxTracker:
+    """
+    Pistas de una cámara (o de un video). Uso por cada frame muestreado:
+
+        if tracker.should_detect():
+            resultado = await run_detection_on_frame_async(frame)
+            nuevos_numeros = tracker.update(frame, resultado)
+        else:
+            tracker.propagate(frame)
+    """
+
+    def __init__(self, detect_interval: int = 1, max_skip: int = TRACKER_MAX_SKIP,
+                 redetect_confidence: float = TRACKER_REDETECT_CONFIDENCE,
+                 iou_threshold: float = TRACKER_IOU_THRESHOLD):
+        self.detect_interval = max(1, detect_interval)   # Pasos entre detecciones con la escena vacía
+        self.max_skip = max(1, max_skip)
+        self.redetect_confidence = redetect_confidence
+        self.iou_threshold = iou_threshold
+        self.tracks: List[Track] = []
+        self.steps_since_detection = 0
+        self._lost = False
+        self.stats = {'steps': 0, 'detections': 0, 'propagations': 0, 'tracks_created': 0, 'tracks_lost': 0}
+
+    def should_detect(self) -> bool:
+        """True si este paso necesita el modelo completo."""
+        self.steps_since_detection += 1
+        if self._lost or any(t.confidence < self.redetect_confidence or t.detection_misses
+                             for t in self.tracks):
+            return True
+        limit = self.max_skip if self.tracks else self.detect_interval
+        return self.steps_since_detection >= limit
+
+    def update(self, frame: np.ndarray, detection: Optional[Dict[str, Any]]) -> List[Track]:
+        """
+        Asocia una detección completa a las pistas. Devuelve las pistas de número cuyo mejor
+        número mejoró en esta detección.
+        """
+        detection = detection or {}
+        self.stats['steps'] += 1
+        self.stats['detections'] += 1
+        self.steps_since_detection = 0
+        self._lost = False
+
+        # La detección también es un paso de tiempo: se predicen todas las pistas antes de asociar
+        for track in self.tracks:
+            track.box = track.kalman.predict()
+
+        matched: Dict[str, Track] = {}
+        for kind, (bbox_key, conf_key) in _TRACKED_KINDS.items():
+            bbox, confidence = detection.get(bbox_key), detection.get(conf_key)
+            candidates = [t for t in self.tracks if t.kind == kind]
+            if bbox is None or confidence is None:
+                for track in candidates:
+                    track.miss_detection()
+                continue
+            box = np.asarray(bbox, dtype=np.float32)[:4]
+            track = max(candidates, key=lambda t: box_iou(t.box, box), default=None)
+            if track is not None and box_iou(track.box, box) >= self.iou_threshold:
+                track.update_from_detection(box, float(confidence), frame)
+            else:
+                track = Track(kind, box, float(confidence), frame)
+                self.tracks.append(track)
+                self.stats['tracks_created'] += 1
+            for other in candidates:
+                if other is not track:
+                    other.miss_detection()
+            matched[kind] = track
+
+        improved = []
+        plate = matched.get('numero')
+        if plate is not None and plate.offer_number(detection.get('numero_detectado'),
+                                                    detection.get('confianza_numero'),
+                                                    detection.get('modelo_ladrillo')):
+            improved.append(plate)
+        wagon = matched.get('vagoneta')
+        if wagon is not None:
+            # El número pertenece a la vagoneta que lo contiene
+            if plate is not None and self._contains(wagon.box, plate.box):
+                wagon.offer_number(plate.numero_detectado, plate.confianza_numero, detection.get('modelo_ladrillo'))
+            elif detection.get('modelo_ladrillo'):
+                wagon.modelo_ladrillo = detection.get('modelo_ladrillo')
+        self.stats['tracks_lost'] += self._prune(frame.shape)
+        return improved
+
+    def propagate(self, frame: np.ndarray) -> List[Track]:
+        """Avanza las pistas un paso sin el modelo; devuelve las pistas activas."""
+        self.stats['steps'] += 1
+        self.stats['propagations'] += 1
+        for track in self.tracks:
+            track.propagate(frame)
+        lost = self._prune(frame.shape)
+        if lost:
+            # Una pista que sale de escena suele significar que entra la siguiente vagoneta
+            self._lost = True
+            self.stats['tracks_lost'] += lost
+        return self.tracks
+
+    def _prune(self, frame_shape: Tuple[int, ...]) -> int:
+        # Dos detecciones completas seguidas sin verla: la pista seguía fondo, no la vagoneta
+        alive = [t for t in self.tracks if t.confidence >= TRACKER_MIN_CONFIDENCE
+                 and t.detection_misses < 2 and t.inside(frame_shape)]
+        lost = len(self.tracks) - len(alive)
+        self.tracks = alive
+        return lost
+
+    @staticmethod
+    def _contains(outer: np.ndarray, inner: np.ndarray) -> bool:
+        cx, cy = (inner[0] + inner[2]) / 2, (inner[1] + inner[3]) / 2
+        return outer[0] <= cx <= outer[2] and outer[1] <= cy <= outer[3]
+
+    def best_track(self) -> Optional[Track]:
+        """Pista de número con el mejor número visto, si hay."""
+        with_number = [t for t in self.tracks if t.numero_detectado]
+        return max(with_number, key=lambda t: t.confianza_numero, default=None)
+
+    def reading(self) -> Optional[Dict[str, Any]]:
+        """
+        Lectura de un paso propagado (sin modelo), con las claves del resultado de detección: el
+        mejor número de las pistas vivas y la confianza de la detección completa que lo leyó.
+        Así las pasadas y la votación no se quedan sin lecturas mientras se sigue a la vagoneta.
+        None si ninguna pista tiene número.
+        """
+        track = self.best_track()
+        if track is None:
+            return None
+        return {'numero_detectado': track.numero_detectado, 'confianza_numero': track.confianza_numero,
+                'modelo_ladrillo': track.modelo_ladrillo, 'track_id': track.id}
+
+    def get_status(self) -> Dict[str, Any]:
+        steps = self.stats['steps']
+        return {
+            **self.stats,
+            'detection_ratio': round(self.stats['detections'] / steps, 3) if steps else None,
+            'active_tracks': [t.to_dict() for t in self.tracks],
+        }
@@ -0,0 +1,349 @@
+"""
+Cola persistente de trabajos de procesamiento de video.
+
+Cada video subido es un documento de la colección `video_jobs` de MongoDB (estado, prioridad,
+parámetros, punto de control y resultado), así que un reinicio del servidor o una pestaña
+cerrada no pierden el trabajo. `VIDEO_JOB_WORKERS` workers asíncronos toman los trabajos
+pendientes por prioridad (mayor primero) y antigüedad con un find_one_and_update atómico y
+mandan un latido mientras trabajan; los trabajos 'running' sin latido desde hace
+`VIDEO_JOB_STALE_SECONDS` (worker caído) vuelven a la cola y se reanudan desde su último punto
+de control, hasta `VIDEO_JOB_MAX_ATTEMPTS` intentos.
+
+El progreso se publica en memoria a cualquier número de suscriptores (SSE o WebSocket) que
+pueden conectarse en cualquier momento: reciben primero una foto del trabajo y después los
+eventos en vivo hasta `stream_end`. Los eventos finales se guardan con el trabajo para quien
+se conecte cuando ya terminó. Como cualquier instancia puede tomar el trabajo, un suscriptor
+que no recibe eventos en `VIDEO_JOB_SUBSCRIBER_POLL_SECONDS` lee el trabajo de Mongo: publica
+el progreso del último punto de control y, cuando el trabajo terminó, sus eventos finales.
+
+Configuración:
+
+    VIDEO_JOB_WORKERS=1           # Videos procesándose a la vez en este proceso
+    VIDEO_JOB_STALE_SECONDS=60    # Sin latido durante este tiempo, el trabajo vuelve a la cola
+    VIDEO_JOB_MAX_ATTEMPTS=3      # Intentos antes de marcar el trabajo como fallido
+    VIDEO_CHECKPOINT_SECONDS=30   # Tiempo de video entre puntos de control
+    VIDEO_JOB_SUBSCRIBER_POLL_SECONDS=5   # Sin eventos en vivo, cada cuánto un suscriptor consulta Mongo
+"""
+
+import asyncio
+import os
+import socket
+import traceback
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+import crud
+
+VIDEO_JOB_WORKERS = int(os.getenv("VIDEO_JOB_WORKERS", 1))
+VIDEO_JOB_POLL_SECONDS = float(os.getenv("VIDEO_JOB_POLL_SECONDS", 2.0))
+VIDEO_JOB_HEARTBEAT_SECONDS = float(os.getenv("VIDEO_JOB_HEARTBEAT_SECONDS", 10.0))
+VIDEO_JOB_STALE_SECONDS = float(os.getenv("VIDEO_JOB_STALE_SECONDS", 60.0))
+VIDEO_JOB_MAX_ATTEMPTS = int(os.getenv("VIDEO_JOB_MAX_ATTEMPTS", 3))
+VIDEO_CHECKPOINT_SECONDS = float(os.getenv("VIDEO_CHECKPOINT_SECONDS", 30.0))  # Tiempo de video entre puntos de control
+VIDEO_JOB_SUBSCRIBER_POLL_SECONDS = float(os.getenv("VIDEO_JOB_SUBSCRIBER_POLL_SECONDS", 5.0))
+SUBSCRIBER_QUEUE_SIZE = 1000   # Un suscriptor lento pierde los eventos más antiguos, no frena al worker
+
+FINISHED_STATUSES = ("completed", "failed")
+STALE_FAILED_MESSAGE = "El trabajo falló: se agotaron los reintentos tras caídas del worker."
+
+
+class JobLostError(RuntimeError):
+    """El worker perdió el trabajo (lo reencoló el barrido de trabajos sin latido)."""
+
+
+class JobContext:
+    """Lo que el manejador de un trabajo puede hacer: publicar eventos y guardar puntos de control."""
+
+    def __init__(self, queue: "VideoJobQueue", job: Dict[str, Any], worker_id: str):
+        self.queue = queue
+        self.job = job
+        self.job_id = job["_id"]
+        self.worker_id = worker_id
+        self.final_events: List[Dict[str, Any]] = []
+        self.lost = False   # True si el trabajo ya no es de este worker: no debe crear más registros
+
+    def ensure_owned(self):
+        """Lanza JobLostError si el trabajo ya no es de este worker (antes de crear registros)."""
+        if self.lost:
+            raise JobLostError(f"El trabajo {self.job_id} ya no pertenece al worker {self.worker_id}")
+
+    def publish(self, event: Dict[str, Any]):
+        self.queue.publish(self.job_id, event)
+
+    def publish_final(self, event: Dict[str, Any]):
+        """Publica un evento que también reciben quienes se conecten cuando el trabajo ya terminó."""
+        self.final_events.append(event)
+        self.publish(event)
+
+    async def checkpoint(self, checkpoint: Dict[str, Any]):
+        """Guarda el punto de control del trabajo (se recibe en job['checkpoint'] al reanudar)."""
+        self.ensure_owned()
+        self.job["checkpoint"] = checkpoint
+        owned = await asyncio.to_thread(crud.update_video_job, self.job_id,
+                                        {"checkpoint": checkpoint, "heartbeat_at": datetime.now(timezone.utc)},
+                                        self.worker_id)
+        if not owned:
+            self.lost = True
+            self.ensure_owned()
+
+
+# Manejador de un trabajo: devuelve el resultado (se guarda en job['result']) o lanza una excepción
+JobHandler = Callable[[Dict[str, Any], JobContext], Awaitable[Dict[str, Any]]]
+
+
+class VideoJobQueue:
+    """Cola de trabajos de video en MongoDB con workers en segundo plano y suscriptores en memoria."""
+
+    def __init__(self, handler: JobHandler, workers: int = VIDEO_JOB_WORKERS):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._last_progress: Dict[str, Dict[str, Any]] = {}
+        self._running: Dict[str, str] = {}   # job_id -> worker_id
+        self.stats = {'enqueued': 0, 'completed': 0, 'failed': 0, 'requeued': 0}
+
+    async def start(self):
+        await asyncio.to_thread(crud.ensure_video_job_indexes)
+        await self._recover()
+        self._tasks = [asyncio.create_task(self._worker(f"{self.instance_id}:{i}")) for i in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._monitor()))
+        print(f"🎞️ Cola de videos iniciada con {self.workers} worker(s)")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, params: Dict[str, Any], priority: int = 0) -> str:
+        """Crea un trabajo pendiente y despierta a los workers. Devuelve su id (processing_id)."""
+        job = {
+            "_id": str(uuid.uuid4()),
+            "status": "pending",
+            "priority": int(priority),
+            "params": params,
+            "created_at": datetime.now(timezone.utc),
+            "attempts": 0,
+            "checkpoint": None,
+            "result": None,
+            "error": None,
+        }
+        job_id = await asyncio.to_thread(crud.create_video_job, job)
+        self.stats['enqueued'] += 1
+        self._wakeup.set()
+        return job_id
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(crud.get_video_job, job_id)
+
+    # --- Suscriptores -------------------------------------------------------------------
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(job_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[job_id]
+
+    def publish(self, job_id: str, event: Dict[str, Any]):
+        if event.get("type") == "progress":
+            self._last_progress[job_id] = event
+        for queue in self._subscribers.get(job_id, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def snapshot(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Evento con el estado actual del trabajo, lo primero que recibe un suscriptor nuevo."""
+        checkpoint = job.get("checkpoint") or {}
+        return {
+            "type": "job_status",
+            "processing_id": job["_id"],
+            "status": job.get("status"),
+            "priority": job.get("priority", 0),
+            "attempts": job.get("attempts", 0),
+            "checkpoint_frame": checkpoint.get("frame"),
+            "records_created": len(checkpoint.get("records") or []),
+            "last_progress": self._last_progress.get(job["_id"]),
+        }
+
+    @staticmethod
+    def checkpoint_progress(job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Evento `progress` con el último punto de control guardado (trabajo en otra instancia)."""
+        checkpoint = job.get("checkpoint") or {}
+        if checkpoint.get("frame") is None:
+            return None
+        total = checkpoint.get("total_frames")
+        return {"type": "progress", "stage": "frame_processing", "processing_id": job["_id"],
+                "message": f"Procesando frame {checkpoint['frame']}/{total or '?'} (último punto de control)",
+                "current_frame": checkpoint["frame"], "total_frames": total,
+                "records_created": len(checkpoint.get("records") or [])}
+
+    async def events(self, job_id: str):
+        """
+        Eventos de un trabajo para un suscriptor: la foto actual, los eventos finales guardados
+        si ya terminó o los eventos en vivo hasta `stream_end`. Nada si el trabajo no existe.
+        Si el trabajo corre en otra instancia no llegan eventos en vivo: sin eventos durante
+        VIDEO_JOB_SUBSCRIBER_POLL_SECONDS se consulta el trabajo en Mongo.
+        """
+        queue = self.subscribe(job_id)   # Antes de leer el estado: no se pierde un final entre medias
+        try:
+            job = await self.get_job(job_id)
+            if job is None:
+                return
+            yield self.snapshot(job)
+            if job.get("status") in FINISHED_STATUSES:
+                for event in job.get("final_events") or []:
+                    yield event
+                return
+            last_checkpoint = (job.get("checkpoint") or {}).get("frame")
+            delivered: List[Dict[str, Any]] = []   # Eventos finales ya recibidos en vivo
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=VIDEO_JOB_SUBSCRIBER_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    job = await self.get_job(job_id)
+                    if job is None:
+                        return
+                    if job.get("status") in FINISHED_STATUSES:
+                        # Lo que ya estaba en la cola va primero; después, lo guardado que no llegó en vivo
+                        while not queue.empty():
+                            event = queue.get_nowait()
+                            yield event
+                            if event.get("type") == "stream_end":
+                                return
+                            delivered.append(event)
+                        for event in job.get("final_events") or []:
+                            if event not in delivered:
+                                yield event
+                        return
+                    checkpoint = (job.get("checkpoint") or {}).get("frame")
+                    if job_id not in self._running and checkpoint != last_checkpoint:
+                        last_checkpoint = checkpoint
+                        progress = self.checkpoint_progress(job)
+                        if progress is not None:
+                            yield progress
+                    continue
+                yield event
+                if event.get("type") == "stream_end":
+                    return
+                if event.get("type") not in ("progress", "detection_digest"):
+                    delivered.append(event)
+        finally:
+            self.unsubscribe(job_id, queue)
+
+    # --- Workers ------------------------------------------------------------------------
+
+    async def _recover(self):
+        stale_before = datetime.now(timezone.utc) - timedelta(seconds=VIDEO_JOB_STALE_SECONDS)
+        end_event = {"type": "stream_end", "error_occurred": True, "message": STALE_FAILED_MESSAGE}
+        requeued, failed = await asyncio.to_thread(crud.requeue_stale_video_jobs, stale_before,
+                                                   VIDEO_JOB_MAX_ATTEMPTS, [end_event])
+        if requeued or failed:
+            self.stats['requeued'] += len(requeued)
+            self.stats['failed'] += len(failed)
+            print(f"♻️ Trabajos de video sin latido: {len(requeued)} reencolados, {len(failed)} fallidos")
+            self._wakeup.set()
+        # Los suscriptores de un trabajo fallido reciben su final en lugar de esperar para siempre
+        for job_id in failed:
+            self.publish(job_id, {**end_event, "processing_id": job_id})
+            self._last_progress.pop(job_id, None)
+
+    async def _monitor(self):
+        while True:
+            await asyncio.sleep(VIDEO_JOB_STALE_SECONDS / 2)
+            try:
+                await self._recover()
+            except Exception as e:
+                print(f"❌ Error revisando trabajos de video caídos: {e}")
+
+    async def _worker(self, worker_id: str):
+        while True:
+            try:
+                job = await asyncio.to_thread(crud.claim_next_video_job, worker_id)
+            except Exception as e:
+                print(f"❌ Error tomando trabajos de video: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=VIDEO_JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job, worker_id)
+
+    async def _heartbeat(self, context: JobContext, handler_task: asyncio.Task):
+        """Latido del trabajo; si otro lo reencoló o lo tomó, detiene el manejador."""
+        while True:
+            await asyncio.sleep(VIDEO_JOB_HEARTBEAT_SECONDS)
+            try:
+                owned = await asyncio.to_thread(crud.update_video_job, context.job_id,
+                                                {"heartbeat_at": datetime.now(timezone.utc)}, context.worker_id)
+            except Exception as e:
+                # Un error puntual de Mongo no mata el latido: se reintenta en el siguiente
+                print(f"❌ Error enviando el latido del trabajo {context.job_id}: {e}")
+                continue
+            if not owned:
+                print(f"⚠️ El trabajo {context.job_id} ya no pertenece a {context.worker_id}; se detiene")
+                context.lost = True
+                handler_task.cancel()
+                return
+
+    async def _run(self, job: Dict[str, Any], worker_id: str):
+        job_id = job["_id"]
+        self._running[job_id] = worker_id
+        context = JobContext(self, job, worker_id)
+        print(f"🎞️ Worker {worker_id} procesa el trabajo {job_id} (intento {job.get('attempts')})")
+        self.publish(job_id, self.snapshot(job))
+        handler_task = asyncio.create_task(self.handler(job, context))
+        heartbeat = asyncio.create_task(self._heartbeat(context, handler_task))
+        fields: Dict[str, Any]
+        try:
+            result = await handler_task
+            context.ensure_owned()
+            fields = {"status": "completed", "result": result, "error": None}
+            end_event = {"type": "stream_end", "error_occurred": False, "processing_id": job_id,
+                         "message": (result or {}).get("message", "Proceso completado.")}
+            self.stats['completed'] += 1
+        except (asyncio.CancelledError, JobLostError):
+            if context.lost:
+                # Otro worker lo reanuda desde el último punto de control: este no toca el trabajo
+                print(f"⚠️ Worker {worker_id} abandona el trabajo {job_id} (reasignado)")
+                return
+            # Parada ordenada: el trabajo vuelve a la cola y se reanudará desde su punto de control
+            await asyncio.to_thread(crud.update_video_job, job_id, {"status": "pending", "worker_id": None}, worker_id)
+            raise
+        except Exception as e:
+            traceback.print_exc()
+            fields = {"status": "failed", "error": str(e)}
+            end_event = {"type": "stream_end", "error_occurred": True, "processing_id": job_id,
+                         "message": f"Error durante el procesamiento: {str(e)}"}
+            self.stats['failed'] += 1
+        finally:
+            heartbeat.cancel()
+            self._running.pop(job_id, None)
+
+        fields.update({"final_events": context.final_events + [end_event], "finished_at": datetime.now(timezone.utc)})
+        if not await asyncio.to_thread(crud.update_video_job, job_id, fields, worker_id):
+            print(f"⚠️ El trabajo {job_id} se reasignó mientras {worker_id} lo terminaba; no se marca como terminado")
+            return
+        self.publish(job_id, end_event)
+        self._last_progress.pop(job_id, None)
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'workers': self.workers,
+            'running': dict(self._running),
+            'subscribers': {job_id: len(queues) for job_id, queues in self._subscribers.items()},
+        }
@@ -0,0 +1,193 @@
+"""
+Muestreo de frames de video de grueso a fino con grab()/retrieve().
+
+`cap.read()` decodifica y convierte a BGR cada frame aunque luego se descarte. El muestreador
+avanza con `grab()` (solo demultiplexa y decodifica lo imprescindible) y hace `retrieve()`
+únicamente del frame que se va a analizar.
+
+Mientras no hay nada a la vista muestrea con un paso grueso en tiempo (`coarse_ms`,
+independiente de los FPS del video). Cuando un frame tiene un acierto (número leído o pista
+activa) pasa al paso fino (uno de cada `fine_every` frames, el paso histórico) durante
+`dense_ms` tras el último acierto, y al entrar en ese modo retrocede hasta justo después de la
+muestra gruesa anterior para no perder el comienzo de la pasada. El resultado de la muestra que
+provocó el retroceso no se pierde: el recorrido fino vuelve a pasar exactamente por ese frame y
+el llamador recupera su detección con `cached_result()` en lugar de repetir la inferencia. Sin
+FPS conocidos o con `coarse_ms=0` se usa siempre el paso fino.
+
+Opcionalmente, MotionGate pasa cada muestra reducida por el MotionDetector de la captura
+automática (MOG2 + morfología) y el modelo solo corre sobre las muestras con movimiento (o
+mientras el seguimiento tenga pistas activas): los videos de túnel son casi siempre estáticos.
+Las muestras que se revisitan tras un retroceso no vuelven a alimentar el modelo de fondo (que
+solo ve frames en orden creciente) y cuentan como movimiento: hubo un acierto justo después.
+
+Configuración:
+
+    VIDEO_COARSE_STRIDE_MS=500   # Paso grueso entre muestras sin aciertos (0 = siempre paso fino)
+    VIDEO_DENSE_WINDOW_MS=1500   # Tiempo de muestreo fino tras el último acierto
+    VIDEO_MOTION_GATE=false      # Analizar solo las muestras con movimiento
+    VIDEO_MOTION_WIDTH=320       # Ancho al que se reduce el frame para el paso de movimiento
+"""
+
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .auto_capture_system import MotionDetector
+
+VIDEO_COARSE_STRIDE_MS = float(os.getenv("VIDEO_COARSE_STRIDE_MS", 500))
+VIDEO_DENSE_WINDOW_MS = float(os.getenv("VIDEO_DENSE_WINDOW_MS", 1500))
+SAMPLE_EVERY = 5   # Paso fino: uno de cada N frames (el muestreo fijo de siempre)
+VIDEO_MOTION_GATE = os.getenv("VIDEO_MOTION_GATE", "false").lower() in ("1", "true", "yes")
+VIDEO_MOTION_WIDTH = int(os.getenv("VIDEO_MOTION_WIDTH", 320))
+
+
+class FrameSampler:
+    """Elige los frames a analizar de un rango del video y los lee con grab()/retrieve()."""
+
+    def __init__(self, fps: float, start: int = 0, end: Optional[int] = None,
+                 coarse_ms: float = VIDEO_COARSE_STRIDE_MS, dense_ms: float = VIDEO_DENSE_WINDOW_MS,
+                 fine_every: int = SAMPLE_EVERY):
+        self.fine_every = max(1, fine_every)
+        coarse = int(round(coarse_ms * fps / 1000.0)) if fps and fps > 0 and coarse_ms > 0 else 0
+        self.coarse_every = max(self.fine_every, coarse)
+        self.dense_frames = int(round(dense_ms * fps / 1000.0)) if fps and fps > 0 else 0
+        self.start = start
+        self.end = end
+        self.position = start          # Frames consumidos del video (= número base 1 del último leído)
+        self._dense_until = -1         # Último frame (base 1) del paso fino
+        self._last_sample = start      # Última muestra aceptada (base 1)
+        self._rewind_to: Optional[int] = None
+        self._replay: Optional[Tuple[int, Any]] = None   # (frame del acierto, su resultado) a reutilizar
+        self.stats = {'grabbed': 0, 'retrieved': 0, 'rewinds': 0, 'reused': 0}
+
+    @property
+    def resume_position(self) -> int:
+        """Desde dónde habría que reanudar para no perder nada de lo que aún no se analizó."""
+        return self._rewind_to if self._rewind_to is not None else self.position
+
+    @property
+    def coarse(self) -> bool:
+        """True si hay paso grueso (FPS conocidos y paso grueso mayor que el fino)."""
+        return self.coarse_every > self.fine_every
+
+    def _next_target(self) -> int:
+        if not self.coarse or self.position < self._dense_until:
+            # Paso fino alineado a múltiplos de fine_every, como el muestreo fijo
+            target = (self.position // self.fine_every + 1) * self.fine_every
+            if self._replay is not None and self.position < self._replay[0] < target:
+                target = self._replay[0]  # Se pasa por el frame del acierto para reutilizar su resultado
+            return target
+        return self.position + self.coarse_every
+
+    def read(self, cap: cv2.VideoCapture) -> Tuple[Optional[np.ndarray], int, bool]:
+        """
+        Avanza hasta la siguiente muestra. Devuelve (frame o None, número de frame base 1,
+        fin del rango). `position` indica cuántos frames del video se han recorrido.
+        """
+        if self._rewind_to is not None:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, self._rewind_to)
+            self.position = self._rewind_to
+            self._rewind_to = None
+        elif self._replay is not None and self.position >= self._replay[0]:
+            self._replay = None  # El frame del acierto ya se entregó
+        target = self._next_target()
+        while self.end is None or self.position < self.end:
+            if not cap.grab():
+                return None, self.position, True
+            self.position += 1
+            self.stats['grabbed'] += 1
+            if self.position == target:
+                ret, frame = cap.retrieve()
+                self.stats['retrieved'] += 1
+                return (frame if ret else None), self.position, False
+        return None, self.position, True
+
+    def cached_result(self, frame_number: int) -> Optional[Any]:
+        """Resultado guardado por `report` para `frame_number` (el acierto que provocó el retroceso)."""
+        if self._replay is None or self._replay[0] != frame_number or self._replay[1] is None:
+            return None
+        result = self._replay[1]
+        self._replay = None
+        self.stats['reused'] += 1
+        return result
+
+    def report(self, frame_number: int, hit: bool, result: Optional[Any] = None) -> bool:
+        """
+        Resultado del análisis de la muestra `frame_number` (acierto = número leído o pista activa).
+        Devuelve True si la muestra debe posponerse: fue un acierto tras un paso grueso y el
+        muestreador retrocede para recorrer el hueco con el paso fino. La muestra se volverá a
+        ver en orden (así el seguimiento y las pasadas reciben los frames siempre crecientes) y
+        `result`, si se pasa, se recupera entonces con `cached_result` sin repetir la inferencia.
+        """
+        if hit and self.coarse:
+            if frame_number > self._dense_until and frame_number - self._last_sample > self.fine_every:
+                self._rewind_to = max(self.start, self._last_sample)
+                self._dense_until = frame_number + self.dense_frames
+                self._replay = (frame_number, result)
+                self.stats['rewinds'] += 1
+                return True
+            self._dense_until = frame_number + self.dense_frames
+        self._last_sample = frame_number
+        return False
+
+
+class MotionGate:
+    """Paso de movimiento barato sobre frames reducidos antes de llamar al modelo."""
+
+    def __init__(self, width: int = VIDEO_MOTION_WIDTH, min_area: int = 5000, warmup: int = 5):
+        self.width = width
+        self.warmup = warmup       # Primeras muestras: el fondo aún no está aprendido, se analizan siempre
+        self.min_area = min_area   # En píxeles del frame original, como en la captura automática
+        self.detector = MotionDetector(min_area=min_area)
+        self._last_frame = -1   # Último frame que vio el modelo de fondo
+        self.stats = {'checked': 0, 'skipped': 0, 'revisited': 0, 'motion_s': 0.0, 'inference_s': 0.0, 'inferences': 0}
+
+    def has_motion(self, frame: np.ndarray, frame_number: Optional[int] = None) -> bool:
+        """
+        Alimenta el modelo de fondo con la muestra reducida; True si hay movimiento. Un frame no
+        posterior al último visto (revisita tras un retroceso del muestreador) no se le vuelve a
+        dar al modelo de fondo y cuenta como movimiento.
+        """
+        if frame_number is not None:
+            if frame_number <= self._last_frame:
+                self.stats['revisited'] += 1
+                return True
+            self._last_frame = frame_number
+        start = time.perf_counter()
+        height, width = frame.shape[:2]
+        scale = min(1.0, self.width / float(width))
+        if scale < 1.0:
+            frame = cv2.resize(frame, (max(1, int(width * scale)), max(1, int(height * scale))),
+                               interpolation=cv2.INTER_AREA)
+        self.detector.min_area = self.min_area * scale * scale
+        moving, _ = self.detector.detect_motion(frame)
+        self.stats['checked'] += 1
+        self.stats['motion_s'] += time.perf_counter() - start
+        return moving or self.stats['checked'] <= self.warmup
+
+    def mark_skipped(self):
+        self.stats['skipped'] += 1
+
+    def record_inference(self, seconds: float):
+        """Duración de una inferencia real del video (para estimar el tiempo ahorrado)."""
+        self.stats['inference_s'] += seconds
+        self.stats['inferences'] += 1
+
+
+def motion_progress(gates: List[Optional[MotionGate]]) -> Dict[str, float]:
+    """
+    Campos de progreso del paso de movimiento (suma de uno o varios segmentos): muestras sin
+    movimiento no analizadas y tiempo ahorrado estimado (muestras saltadas × inferencia media
+    del video, menos lo que costó el paso de movimiento). Vacío si no hay paso de movimiento.
+    """
+    gates = [g for g in gates if g is not None]
+    if not gates:
+        return {}
+    skipped = sum(g.stats['skipped'] for g in gates)
+    inferences = sum(g.stats['inferences'] for g in gates)
+    average = sum(g.stats['inference_s'] for g in gates) / inferences if inferences else 0.0
+    saved = skipped * average - sum(g.stats['motion_s'] for g in gates)
+    return {'motion_skipped': skipped, 'time_saved_s': round(max(0.0, saved), 2)}
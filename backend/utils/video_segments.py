@@ -0,0 +1,195 @@
+"""
+Procesamiento de videos subidos por segmentos en paralelo.
+
+El video se divide en rangos de frames contiguos; cada segmento abre su propio decodificador
+(cv2.VideoCapture posicionado en su primer frame), decodifica en un hilo (OpenCV libera el GIL
+al decodificar) con el muestreo de grueso a fino de utils/video_sampling.py y manda sus frames
+muestreados al servicio de inferencia por lotes, así que los frames de varios segmentos se
+agrupan en los mismos lotes. Cada segmento tiene su propio
+seguimiento (utils/tracking.py) y agrega sus lecturas en pasadas sin filtrar; el llamador
+recibe los segmentos en orden de frames y fusiona las pasadas que cruzan un corte con
+PassageAggregator.add_passage, de modo que el resultado es el mismo que el del recorrido
+secuencial salvo la inferencia extra al inicio de cada segmento. Como las pasadas sin filtrar
+incluyen el ruido, los segmentos no guardan imágenes: cada pasada recuerda solo el número de su
+mejor frame y el llamador lo relee con FrameReader cuando la pasada sobrevive a los filtros.
+
+Configuración:
+
+    VIDEO_SEGMENTS=4                # Segmentos en paralelo (1 = recorrido secuencial)
+    VIDEO_SEGMENT_MIN_FRAMES=1500   # No se crean segmentos más cortos que esto
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .image_processing import run_detection_on_frame_async
+from .passages import Passage, PassageAggregator
+from .tracking import BoxTracker, TRACKER_MAX_SKIP
+from .annotation import detection_geometry
+from .video_sampling import FrameSampler, MotionGate
+
+VIDEO_SEGMENTS = int(os.getenv("VIDEO_SEGMENTS", 1))
+VIDEO_SEGMENT_MIN_FRAMES = int(os.getenv("VIDEO_SEGMENT_MIN_FRAMES", 1500))
+
+
+def plan_segments(total_frames: int, segments: int = VIDEO_SEGMENTS,
+                  min_frames: int = VIDEO_SEGMENT_MIN_FRAMES, start: int = 0) -> List[Tuple[int, Optional[int]]]:
+    """
+    Rangos [inicio, fin) de índices de frame (base 0) para cada segmento desde `start` (al
+    reanudar un trabajo). El último no tiene fin: lee hasta el final real del video, por si
+    CAP_PROP_FRAME_COUNT se queda corto.
+    """
+    remaining = total_frames - start
+    if remaining <= 0 or segments <= 1:
+        return [(start, None)]
+    segments = max(1, min(segments, remaining // max(1, min_frames)))
+    size = remaining // segments
+    bounds = [(start + i * size, start + (i + 1) * size) for i in range(segments)]
+    bounds[-1] = (bounds[-1][0], None)
+    return bounds
+
+
+class SegmentResult:
+    """Lecturas y pasadas (sin filtrar) de un segmento del video."""
+
+    def __init__(self, index: int, start: int, end: Optional[int]):
+        self.index = index
+        self.start = start
+        self.end = end
+        # {frame, numero, confianza, modelo[, seguimiento]} en orden de frames; seguimiento = paso propagado
+        self.reads: List[Dict[str, Any]] = []
+        self.passages: List[Passage] = []       # Ordenadas por frame_inicio, sin best_frame (solo frame_mejor)
+        self.frames_read = 0
+        self.warnings: List[str] = []
+        self.tracking: Dict[str, Any] = {}
+
+
+async def process_segment(video_path: str, index: int, start: int, end: Optional[int], fps: float,
+                          progress: Dict[str, int], motion_gate: Optional[MotionGate] = None) -> SegmentResult:
+    """Decodifica y analiza un segmento con su propio VideoCapture y su propio seguimiento."""
+    result = SegmentResult(index, start, end)
+    cap = await asyncio.to_thread(cv2.VideoCapture, video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Error al abrir el video para el segmento {index}: {video_path}")
+    tracker = BoxTracker(detect_interval=1, max_skip=TRACKER_MAX_SKIP)
+    # Pasadas sin filtros: los umbrales se aplican al fusionar, cuando se conoce la pasada completa
+    passages = PassageAggregator(fps, min_reads=1, min_confidence=0.0, dominance=float('inf'))
+    sampler = FrameSampler(fps, start=start, end=end)
+    try:
+        if start > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        while True:
+            frame, frame_count, finished = await asyncio.to_thread(sampler.read, cap)
+            # Al retroceder para densificar, la posición baja: el avance cuenta una sola vez
+            advanced = max(0, sampler.position - start - result.frames_read)
+            result.frames_read += advanced
+            progress['frames'] = progress.get('frames', 0) + advanced
+            if finished:
+                break
+            if frame is None or frame.size == 0:
+                result.warnings.append(f"Frame {frame_count} es None o está vacío.")
+                continue
+            try:
+                # Acierto que provocó un retroceso del muestreador: su inferencia ya está hecha
+                detection_results = sampler.cached_result(frame_count)
+                moving = motion_gate.has_motion(frame, frame_count) if motion_gate else True
+                if detection_results is None and not tracker.should_detect():
+                    if sampler.report(frame_count, bool(tracker.tracks)):
+                        continue
+                    tracker.propagate(frame)
+                    # Paso sin modelo: la pista sigue leyendo su número para la votación y las pasadas
+                    reading = tracker.reading()
+                    if reading is not None:
+                        result.reads.append({'frame': frame_count, 'numero': reading['numero_detectado'],
+                                             'confianza': reading['confianza_numero'],
+                                             'modelo': reading['modelo_ladrillo'], 'seguimiento': True})
+                        result.passages.extend(passages.extend(frame_count, reading['numero_detectado']))
+                    continue
+                if detection_results is None and not moving and not tracker.tracks:
+                    motion_gate.mark_skipped()
+                    sampler.report(frame_count, False)
+                    continue
+                if detection_results is None:
+                    inference_start = time.perf_counter()
+                    detection_results = await run_detection_on_frame_async(frame)
+                    if motion_gate:
+                        motion_gate.record_inference(time.perf_counter() - inference_start)
+                if sampler.report(frame_count, bool(detection_results.get('numero_detectado'))
+                                  or detection_results.get('bbox_vagoneta') is not None, detection_results):
+                    continue
+                tracker.update(frame, detection_results)
+                numero = detection_results.get('numero_detectado')
+                confianza = detection_results.get('confianza_numero')
+                modelo = detection_results.get('modelo_ladrillo')
+                result.reads.append({'frame': frame_count, 'numero': numero, 'confianza': confianza, 'modelo': modelo})
+                # Sin imagen: el mejor frame se relee al guardar la pasada, si sobrevive a los filtros
+                result.passages.extend(passages.add(frame_count, numero, confianza, None, modelo,
+                                                    detection_geometry(detection_results)))
+            except Exception as e_detect:
+                result.warnings.append(f"Error detectando en frame {frame_count}: {str(e_detect)}")
+        result.passages.extend(passages.close_all())
+        result.passages.sort(key=lambda p: p.frame_inicio)
+        result.tracking = {**tracker.get_status(), **sampler.stats}
+        return result
+    finally:
+        cap.release()
+
+
+class FrameReader:
+    """Relee frames sueltos del video (el mejor frame de las pasadas de los segmentos)."""
+
+    def __init__(self, video_path: str):
+        self.video_path = video_path
+        self._cap: Optional[cv2.VideoCapture] = None
+        self._next = 0   # Índice (base 0) del frame que devolvería el siguiente read() sin posicionar
+
+    def read(self, frame_number: int) -> Optional[np.ndarray]:
+        """Frame `frame_number` (base 1, como los de FrameSampler) o None si no se puede leer."""
+        if self._cap is None:
+            self._cap = cv2.VideoCapture(self.video_path)
+            if not self._cap.isOpened():
+                raise RuntimeError(f"Error al abrir el video para releer frames: {self.video_path}")
+        index = frame_number - 1
+        if index != self._next:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+        ret, frame = self._cap.read()
+        self._next = index + 1
+        return frame if ret and frame is not None and frame.size else None
+
+    def release(self):
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+
+async def run_segments(video_path: str, bounds: List[Tuple[int, Optional[int]]], fps: float,
+                       motion_gates: Optional[List[Optional[MotionGate]]] = None,
+                       progress_interval: float = 1.0) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Lanza un segmento por rango y produce ('progress', frames leídos en total) cada
+    `progress_interval` segundos y ('segment', SegmentResult) en orden de frames, en cuanto el
+    segmento y todos los anteriores han terminado. Un error en un segmento cancela el resto.
+    `motion_gates`: un MotionGate (o None) por segmento; el llamador lee sus estadísticas.
+    """
+    progress: Dict[str, int] = {'frames': 0}
+    motion_gates = motion_gates or [None] * len(bounds)
+    tasks = [asyncio.create_task(process_segment(video_path, i, start, end, fps, progress, motion_gates[i]))
+             for i, (start, end) in enumerate(bounds)]
+    next_index = 0
+    try:
+        while next_index < len(tasks):
+            await asyncio.wait({tasks[next_index]}, timeout=progress_interval)
+            yield 'progress', progress['frames']
+            while next_index < len(tasks) and tasks[next_index].done():
+                yield 'segment', tasks[next_index].result()
+                next_index += 1
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
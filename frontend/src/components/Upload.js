@@ -166,6 +166,21 @@ const Upload = () => {
   const setupEventSource = useCallback((fileId, processingId, filename) => {
     const eventSource = new EventSource(`http://localhost:8000/stream-video-processing/${processingId}`);
     setActiveEventSources(prev => ({ ...prev, [fileId]: eventSource }));
+    // Los registros llegan en cada punto de control mientras el video se sigue procesando;
+    // el archivo solo termina con processing_complete o stream_end
+    const registros = [];
+    const resultadoDeRegistros = (message) => {
+      const mejor = registros.reduce((a, r) => ((r.confianza || 0) > (a.confianza || 0) ? r : a), registros[0]);
+      return {
+        fileId,
+        filename,
+        status: 'ok',
+        message,
+        numero_detectado: [...new Set(registros.map(r => r.numero))].join(', '),
+        confianza: mejor.confianza,
+        registros: registros.length,
+      };
+    };
 
     eventSource.onopen = () => {
       setFileProgress(prev => ({
@@ -192,27 +207,35 @@ const Upload = () => {
           serverMessage = `${data.message} (${data.current_frame}/${data.total_frames})`;
         } else if (data.type === 'detection_update') {
           serverMessage = `Frame ${data.frame}: Detectado ${data.numero} (Confianza: ${(data.confianza * 100).toFixed(1)}%)`;
+        } else if (data.type === 'detection_digest') {
+          // Lecturas agrupadas por el servidor: por número, la mejor confianza del intervalo
+          const resumen = data.detections.map(d => `${d.numero} (${(d.confianza * 100).toFixed(1)}%, ${d.lecturas} lecturas)`).join(', ');
+          serverMessage = `Frames ${data.frame_inicio}-${data.frame_fin}: Detectado ${resumen}`;
         } else if (data.type === 'final_result') {
           serverMessage = data.message || "Análisis de video completado, esperando registro en BD.";
           currentProgressState = { resultDataFromStream: data.data }; 
         } else if (data.type === 'db_record_created') {
-          isTerminalEvent = true;
-          shouldCloseEventSource = true;
           const recordData = data.data;
-          setAllFilesResults(prevResults => [...prevResults, {
-            fileId,
-            filename,
-            status: 'ok',
-            message: data.message || `Registro creado: ${recordData.numero} (Conf: ${recordData.confianza ? (recordData.confianza * 100).toFixed(1) + '%' : 'N/A'})`,
-            numero_detectado: recordData.numero,
-            confianza: recordData.confianza,
-            // ... any other relevant fields from recordData
-          }]);
-          currentProgressState = {
-            status: 'completed',
-            result: recordData,
-          };
+          registros.push(recordData);
+          currentProgressState = { result: recordData, registros: registros.length };
           serverMessage = data.message || `Registro creado: ${recordData.numero} (Conf: ${recordData.confianza ? (recordData.confianza * 100).toFixed(1) + '%' : 'N/A'})`;
+        } else if (data.type === 'processing_complete') {
+          isTerminalEvent = true;
+          shouldCloseEventSource = true;
+          // Un cliente que se conectó tarde no vio los db_record_created anteriores
+          if (registros.length === 0 && Array.isArray(data.records)) {
+            registros.push(...data.records);
+          }
+          serverMessage = `Proceso completado: ${data.total_records} registro(s) creado(s).`;
+          if (registros.length > 0) {
+            const resultado = resultadoDeRegistros(serverMessage);
+            setAllFilesResults(prevResults => [...prevResults.filter(r => r.fileId !== fileId), resultado]);
+            currentProgressState = { status: 'completed', result: resultado };
+          } else {
+            setAllFilesResults(prevResults => [...prevResults.filter(r => r.fileId !== fileId),
+              { fileId, filename, status: 'ignored', message: serverMessage }]);
+            currentProgressState = { status: 'ignored' };
+          }
         } else if (data.type === 'status' && (data.stage === 'completion' || data.stage === 'finalization')) {
           serverMessage = data.message || 'Proceso completado en servidor.';
           if (data.message && data.message.includes("no se identificó un número") && !fileProgress[fileId]?.result) {
@@ -238,7 +261,11 @@ const Upload = () => {
 
           const existingResultIndex = allFilesResults.findIndex(r => r.fileId === fileId);
 
-          if (existingResultIndex === -1) {
+          if (registros.length > 0 && !data.error_occurred) {
+            const resultado = resultadoDeRegistros(serverMessage);
+            setAllFilesResults(prevResults => [...prevResults.filter(r => r.fileId !== fileId), resultado]);
+            currentProgressState = { status: 'completed', result: resultado };
+          } else if (existingResultIndex === -1) {
             const statusToSet = data.error_occurred ? 'error' : 'ignored';
             setAllFilesResults(prevResults => [...prevResults, {
               fileId,